@@ -1,5 +1,7 @@
 import util
 import voice_util as vu
+import metrics
+import tracing
 
 
 class Action:
@@ -24,6 +26,7 @@ class Action:
 
     def __init__(self, prev_action):
         self._prev_action = prev_action
+        self._index = prev_action._index + 1 if prev_action is not None else 0
 
     def get_prompt_user_text(self):
         return self._prompt_user_text
@@ -73,28 +76,11 @@ class Action:
         """
 
         user_confirmation = self._NO
+        input_type = self._user_input_type.name if self._user_input_type is not None else None
         # Prompts the user with a question until they have confirmed, that they have been understood correctly
         while user_confirmation == self._NO:
-            # Prompt user with action they need to perform
-            self._execute_conditional(self._prompt_user_text, vu.say)
-
-            # Prompt user if they want to skip the action if they have completed it before
-            # if self._action_completed:
-            #    skip = self._get_navigation_input("You have completed this action already, do you want to skip it?")
-            #    if skip == self._YES:
-            #        break
-
-            # Get the user answer
-            input_text = self._execute_conditional(self._user_input_type, vu.get_user_input, self._user_input_side_effect_func)
-
-            # Confirm user answers
-
-            # Space digits if input is a bsn or some other number that is not a year
-            input_text_s = self._user_input_type.format(input_text)
-
-            user_confirmation = self._get_navigation_input(self._confirm_user_input_message + str(input_text_s))
-            if user_confirmation == self._NO:
-                self._execute_conditional("Sorry, lets try that again", vu.say)
+            with tracing.context(action_index=self._index, input_type=input_type), tracing.span("turn"):
+                user_confirmation = self._run_turn()
 
         #if self._prev_action is not None:
         #    user_confirmation = self._get_navigation_input(f"Would you like to return to the previous action? It was: {self._prev_action.get_prompt_user_text()}")
@@ -110,6 +96,34 @@ class Action:
 
     # private methods
 
+    def _run_turn(self):
+        """
+        Ask the question once and confirm the answer
+        :return: the user's confirmation, _YES or _NO
+        """
+        # Prompt user with action they need to perform
+        self._execute_conditional(self._prompt_user_text, vu.say)
+
+        # Prompt user if they want to skip the action if they have completed it before
+        # if self._action_completed:
+        #    skip = self._get_navigation_input("You have completed this action already, do you want to skip it?")
+        #    if skip == self._YES:
+        #        break
+
+        # Get the user answer
+        input_text = self._execute_conditional(self._user_input_type, vu.get_user_input, self._user_input_side_effect_func)
+
+        # Confirm user answers
+
+        # Space digits if input is a bsn or some other number that is not a year
+        input_text_s = self._user_input_type.format(input_text)
+
+        user_confirmation = self._get_navigation_input(self._confirm_user_input_message + str(input_text_s))
+        if user_confirmation == self._NO:
+            metrics.CONFIRMATION_RETRIES.inc(input_type=self._user_input_type.name)
+            self._execute_conditional("Sorry, lets try that again", vu.say)
+        return user_confirmation
+
     def _execute_conditional(self, param, func, side_effect_func=None):
         """
         This function is used to execute function like "add_user_input, add_help, ..." only if they have been set
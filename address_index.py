@@ -0,0 +1,430 @@
+"""
+Local geocoding of spelled Amsterdam addresses.
+
+The index is a directory built once from an address export (e.g. the BAG):
+
+    streets.txt        street names, one per line, street id = line number
+    street_offsets.npy addresses of street i are rows offsets[i]:offsets[i + 1]
+    numbers.npy        house numbers, sorted within each street
+    coords.npy         latitude/longitude per address
+    grid_*.npy         address rows per 100 m grid cell, for reverse geocoding
+    build_id.txt       content hash of the streets and address arrays
+
+The arrays are memory-mapped on load, so opening the index costs a few
+milliseconds whatever its size; only the pages that are looked up are read.
+
+Spelled street names come from speech recognition, so lookup tolerates
+errors: exact match, then single letters that are often misheard when spelled
+("b" for "d", "m" for "n", ...), then a Dutch phonetic key, then fuzzy
+matching. The house number decides between candidates: the best-scoring street
+that has the number wins.
+
+    python address_index.py build adressen.csv data/addresses
+"""
+
+import argparse
+import csv
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+import kdtree
+
+# ---------------------------------------------------------------------------
+#   Configurations
+# ---------------------------------------------------------------------------
+
+INDEX_DIR = os.path.join("data", "addresses")
+FUZZY_CUTOFF = 75   # minimum rapidfuzz ratio of a fuzzy candidate
+MAX_CANDIDATES = 5
+GRID_CELL = 100.0           # metres, cell size of the reverse geocoding grid
+REVERSE_MAX_DISTANCE = 250  # metres, farther from any address counts as "no address"
+_GRID_SHIFT = 1 << 20       # keeps cell coordinates positive when packed into one key
+
+# letters that sound alike when spelled out loud (English letter names)
+_CONFUSABLE_LETTERS = (
+    "bdeptvgcz",  # the "ee" rhyme
+    "mn",
+    "fsx",
+    "ajk",        # the "ay" rhyme
+    "iy",
+    "quw",
+    "lr",
+)
+_CONFUSIONS: Dict[str, str] = {}
+for _group in _CONFUSABLE_LETTERS:
+    for _letter in _group:
+        _CONFUSIONS[_letter] = _CONFUSIONS.get(_letter, "") + _group.replace(_letter, "")
+
+# Dutch spelling variants that sound the same, applied in order
+_PHONETIC_RULES = (
+    (re.compile(r"ij|ei|y"), "ei"),
+    (re.compile(r"au|ou"), "au"),
+    (re.compile(r"ch|g"), "g"),
+    (re.compile(r"ph"), "f"),
+    (re.compile(r"c(?=[eiy])"), "s"),
+    (re.compile(r"c|q"), "k"),
+    (re.compile(r"z"), "s"),
+    (re.compile(r"v"), "f"),
+    (re.compile(r"w"), "v"),
+    (re.compile(r"dt\b|d\b"), "t"),
+    (re.compile(r"h(?![aeiou])"), ""),
+    (re.compile(r"(.)\1+"), r"\1"),
+)
+
+
+def normalize(name: str) -> str:
+    """
+    Letters only, lower case, no accents: "Van Baerlestraat" -> "vanbaerlestraat"
+    """
+    decomposed = unicodedata.normalize("NFKD", name.lower())
+    return "".join(c for c in decomposed if "a" <= c <= "z")
+
+
+def phonetic_key(name: str) -> str:
+    key = normalize(name)
+    for pattern, replacement in _PHONETIC_RULES:
+        key = pattern.sub(replacement, key)
+    return key
+
+
+def misheard_variants(spelled: str) -> set[str]:
+    """
+    Every spelling that differs from spelled in one letter that sounds alike
+    """
+    variants = set()
+    for i, letter in enumerate(spelled):
+        for other in _CONFUSIONS.get(letter, ""):
+            variants.add(spelled[:i] + other + spelled[i + 1:])
+    return variants
+
+
+@dataclass
+class StreetMatch:
+    street_id: int
+    name: str
+    score: float    # 100 for an exact match
+    method: str     # "exact", "misheard", "phonetic" or "fuzzy"
+
+
+@dataclass
+class Address:
+    street: str
+    number: int
+    lat: float
+    lon: float
+    exact: bool = True  # False if the nearest existing house number was taken
+    row: int = -1       # position in the index arrays, the key of per-address tables
+
+    def __str__(self):
+        return f"{self.street} {self.number}"
+
+
+# ---------------------------------------------------------------------------
+#   INDEX
+# ---------------------------------------------------------------------------
+
+class AddressIndex:
+    def __init__(self, directory: str = INDEX_DIR):
+        """
+        :param directory: index directory written by build_index
+        """
+        self.directory = directory
+        with open(os.path.join(directory, "streets.txt"), encoding="utf-8") as f:
+            self.streets = f.read().splitlines()
+        self.offsets = np.load(os.path.join(directory, "street_offsets.npy"), mmap_mode="r")
+        self.numbers = np.load(os.path.join(directory, "numbers.npy"), mmap_mode="r")
+        self.coords = np.load(os.path.join(directory, "coords.npy"), mmap_mode="r")
+        self._grid = None
+        try:
+            with open(os.path.join(directory, "build_id.txt"), encoding="utf-8") as f:
+                self.build_id = f.read().strip()
+        except FileNotFoundError:
+            # index built before build ids were written
+            self.build_id = content_hash(self.streets, self.offsets, self.numbers, self.coords)
+
+        self._keys = [normalize(name) for name in self.streets]
+        self._exact: Dict[str, List[int]] = {}
+        self._phonetic: Dict[str, List[int]] = {}
+        for street_id, (key, name) in enumerate(zip(self._keys, self.streets)):
+            self._exact.setdefault(key, []).append(street_id)
+            self._phonetic.setdefault(phonetic_key(name), []).append(street_id)
+
+    def __len__(self):
+        return len(self.numbers)
+
+    # ------------------------------------------------------------------
+    # Streets
+    # ------------------------------------------------------------------
+    def match_street(self, spelled: str, limit: int = MAX_CANDIDATES) -> list[StreetMatch]:
+        """
+        Candidate streets for a spelled name, best first
+        :param spelled: the name as recognised, spaces and case do not matter
+        """
+        key = normalize(spelled)
+        if not key:
+            return []
+        found: Dict[int, StreetMatch] = {}
+
+        def add(street_ids, score, method):
+            for street_id in street_ids:
+                if street_id not in found or found[street_id].score < score:
+                    found[street_id] = StreetMatch(street_id, self.streets[street_id], score, method)
+
+        add(self._exact.get(key, ()), 100, "exact")
+        for variant in misheard_variants(key):
+            add(self._exact.get(variant, ()), 95, "misheard")
+        add(self._phonetic.get(phonetic_key(key), ()), 90, "phonetic")
+        if len(found) < limit:
+            for _, score, street_id in process.extract(key, self._keys, scorer=fuzz.ratio,
+                                                       limit=limit, score_cutoff=FUZZY_CUTOFF):
+                add((street_id,), min(score, 89), "fuzzy")
+        return sorted(found.values(), key=lambda m: (-m.score, m.name))[:limit]
+
+    # ------------------------------------------------------------------
+    # Addresses
+    # ------------------------------------------------------------------
+    def locate(self, street_id: int, number: int, nearest_number: bool = True) -> Optional[Address]:
+        """
+        Coordinates of a house number on a street
+        :param nearest_number: if the number does not exist take the closest one on the same side of the street
+        """
+        start, end = int(self.offsets[street_id]), int(self.offsets[street_id + 1])
+        if start == end:
+            return None
+        numbers = self.numbers[start:end]
+        pos = int(np.searchsorted(numbers, number))
+        if pos < len(numbers) and numbers[pos] == number:
+            lat, lon = self.coords[start + pos]
+            return Address(self.streets[street_id], int(number), float(lat), float(lon), row=start + pos)
+        if not nearest_number:
+            return None
+        same_side = np.nonzero(numbers % 2 == number % 2)[0]
+        pool = same_side if len(same_side) else np.arange(len(numbers))
+        best = int(pool[np.argmin(np.abs(numbers[pool].astype(np.int64) - number))])
+        lat, lon = self.coords[start + best]
+        return Address(self.streets[street_id], int(numbers[best]), float(lat), float(lon), exact=False,
+                       row=start + best)
+
+    def address(self, row: int) -> Address:
+        street_id = int(np.searchsorted(self.offsets, row, side="right")) - 1
+        lat, lon = self.coords[row]
+        return Address(self.streets[street_id], int(self.numbers[row]), float(lat), float(lon), row=row)
+
+    def geocode(self, spelled: str, number: int) -> Optional[Address]:
+        """
+        Best address for a spelled street name and a house number: the best
+        street that has this exact number, otherwise the best street's closest number
+        """
+        candidates = self.match_street(spelled)
+        for match in candidates:
+            address = self.locate(match.street_id, number, nearest_number=False)
+            if address is not None:
+                return address
+        return self.locate(candidates[0].street_id, number) if candidates else None
+
+    # ------------------------------------------------------------------
+    # Reverse geocoding
+    # ------------------------------------------------------------------
+    def _grid_arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self._grid is None:
+            paths = [os.path.join(self.directory, f"grid_{name}.npy") for name in ("keys", "offsets", "rows")]
+            if all(os.path.exists(path) for path in paths):
+                self._grid = tuple(np.load(path, mmap_mode="r") for path in paths)
+            else:
+                # index built before the grid existed
+                self._grid = _grid_arrays(self.coords)
+        return self._grid
+
+    def reverse(self, lat: float, lon: float, max_distance: float = REVERSE_MAX_DISTANCE) -> Optional[Address]:
+        """
+        The address nearest to a point
+        :return: None if there is no address within max_distance metres
+        """
+        keys, offsets, rows = self._grid_arrays()
+        point = kdtree.project(lat, lon)
+        cx, cy = (int(v) for v in np.floor(point / GRID_CELL))
+        best_d, best_row = np.inf, -1
+        ring = 0
+        while True:
+            # the cells at Chebyshev distance `ring` from the point's cell
+            span = np.arange(-ring, ring + 1)
+            if ring == 0:
+                cells = np.array([[cx, cy]])
+            else:
+                edge = np.full(len(span), ring)
+                cells = np.concatenate((np.stack((cx + span, cy - edge), 1), np.stack((cx + span, cy + edge), 1),
+                                        np.stack((cx - edge[1:-1], cy + span[1:-1]), 1),
+                                        np.stack((cx + edge[1:-1], cy + span[1:-1]), 1)))
+            wanted = (cells[:, 0] + _GRID_SHIFT) * (2 * _GRID_SHIFT) + (cells[:, 1] + _GRID_SHIFT)
+            at = np.searchsorted(keys, wanted)
+            hit = (at < len(keys)) & (keys[np.minimum(at, len(keys) - 1)] == wanted)
+            candidates = [rows[offsets[i]:offsets[i + 1]] for i in at[hit]]
+            if candidates:
+                candidates = np.concatenate(candidates)
+                diff = kdtree.project(self.coords[candidates, 0], self.coords[candidates, 1]) - point
+                d = np.hypot(diff[:, 0], diff[:, 1])
+                i = int(d.argmin())
+                if d[i] < best_d:
+                    best_d, best_row = float(d[i]), int(candidates[i])
+            # everything outside the searched rings is at least ring * GRID_CELL away
+            if best_row >= 0 and best_d <= ring * GRID_CELL:
+                break
+            if ring * GRID_CELL > max_distance:
+                break
+            ring += 1
+        if best_row < 0 or best_d > max_distance:
+            return None
+        return self.address(best_row)
+
+
+# ---------------------------------------------------------------------------
+#   Building
+# ---------------------------------------------------------------------------
+
+_STREET_COLUMNS = ("street", "straatnaam", "openbareruimte", "openbare_ruimte")
+_NUMBER_COLUMNS = ("number", "huisnummer")
+_LAT_COLUMNS = ("lat", "latitude")
+_LON_COLUMNS = ("lon", "lng", "longitude")
+
+
+def _column(row: dict, names: tuple) -> str | None:
+    return next((row[name] for name in names if row.get(name)), None)
+
+
+def _grid_arrays(coords) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    :return: sorted cell keys, offsets into rows per key, address rows ordered by cell
+    """
+    cells = np.floor(kdtree.project(coords[:, 0], coords[:, 1]) / GRID_CELL).astype(np.int64) + _GRID_SHIFT
+    cell_keys = cells[:, 0] * (2 * _GRID_SHIFT) + cells[:, 1]
+    order = np.argsort(cell_keys, kind="stable")
+    keys, counts = np.unique(cell_keys[order], return_counts=True)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    return keys, offsets, order.astype(np.int32)
+
+
+def content_hash(streets: List[str], offsets: np.ndarray, numbers: np.ndarray, coords: np.ndarray) -> str:
+    """
+    Hash of the index content, changes whenever any address row changes or moves
+    """
+    digest = hashlib.sha256("\n".join(streets).encode("utf-8"))
+    for array, dtype in ((offsets, np.int64), (numbers, np.int32), (coords, np.float64)):
+        digest.update(np.ascontiguousarray(array, dtype=dtype).tobytes())
+    return digest.hexdigest()
+
+
+def build_index(csv_path: str, directory: str = INDEX_DIR) -> int:
+    """
+    Write an index directory from a CSV with street, house number and lat/lon columns
+    :return: number of addresses
+    """
+    rows = {}
+    with open(csv_path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            street, number = _column(row, _STREET_COLUMNS), _column(row, _NUMBER_COLUMNS)
+            lat, lon = _column(row, _LAT_COLUMNS), _column(row, _LON_COLUMNS)
+            if not (street and number and lat and lon):
+                continue
+            match = re.match(r"\d+", number.strip())
+            if match:
+                # house number additions (12-H, 12A) share the coordinates of the number
+                rows.setdefault((street.strip(), int(match.group())), (float(lat), float(lon)))
+
+    streets = sorted({street for street, _ in rows})
+    street_ids = {street: i for i, street in enumerate(streets)}
+    keys = sorted(rows, key=lambda k: (street_ids[k[0]], k[1]))
+    offsets = np.zeros(len(streets) + 1, dtype=np.int64)
+    np.add.at(offsets, [street_ids[street] + 1 for street, _ in keys], 1)
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "streets.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(streets))
+    offsets = np.cumsum(offsets)
+    numbers = np.array([number for _, number in keys], dtype=np.int32)
+    coords = np.array([rows[k] for k in keys], dtype=np.float64).reshape(-1, 2)
+    np.save(os.path.join(directory, "street_offsets.npy"), offsets)
+    np.save(os.path.join(directory, "numbers.npy"), numbers)
+    np.save(os.path.join(directory, "coords.npy"), coords)
+    for name, array in zip(("keys", "offsets", "rows"), _grid_arrays(coords)):
+        np.save(os.path.join(directory, f"grid_{name}.npy"), array)
+    with open(os.path.join(directory, "build_id.txt"), "w", encoding="utf-8") as f:
+        f.write(content_hash(streets, offsets, numbers, coords))
+    return len(keys)
+
+
+# ---------------------------------------------------------------------------
+#   Shared index
+# ---------------------------------------------------------------------------
+
+_index: Optional[AddressIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index(directory: str = INDEX_DIR) -> Optional[AddressIndex]:
+    """
+    The index, opened on first use
+    :return: None if no index has been built
+    """
+    global _index
+    with _index_lock:
+        if _index is None or _index.directory != directory:
+            if not os.path.exists(os.path.join(directory, "streets.txt")):
+                return None
+            start = time.perf_counter()
+            _index = AddressIndex(directory)
+            print(f"[DEBUG] Opened address index with {len(_index)} addresses "
+                  f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return _index
+
+
+# ---------------------------------------------------------------------------
+#   MAIN
+# ---------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the local address index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build the index from a CSV export")
+    build.add_argument("csv", help="CSV with street, house number, lat and lon columns")
+    build.add_argument("directory", nargs="?", default=INDEX_DIR)
+    query = sub.add_parser("query", help="geocode a spelled street name and house number")
+    query.add_argument("street")
+    query.add_argument("number", type=int)
+    query.add_argument("--directory", default=INDEX_DIR)
+    reverse = sub.add_parser("reverse", help="nearest address of a point")
+    reverse.add_argument("lat", type=float)
+    reverse.add_argument("lon", type=float)
+    reverse.add_argument("--directory", default=INDEX_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        print(f"Indexed {build_index(args.csv, args.directory)} addresses in {args.directory}")
+        return
+
+    index = AddressIndex(args.directory)
+    if args.command == "reverse":
+        start = time.perf_counter()
+        address = index.reverse(args.lat, args.lon)
+        print(f"-> {address}" if address else "-> no address nearby")
+        print(f"[DEBUG] reverse geocoding took {(time.perf_counter() - start) * 1000:.2f} ms")
+        return
+
+    for match in index.match_street(args.street):
+        print(f"{match.score:5.1f}  {match.method:9s} {match.name}")
+    start = time.perf_counter()
+    address = index.geocode(args.street, args.number)
+    print(f"-> {address} ({address.lat:.6f}, {address.lon:.6f})" if address else "-> not found")
+    print(f"[DEBUG] geocoding took {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,27 @@
 #afafvalcontainers.py
 
 import re
-import time
 from typing import Dict, Optional, Tuple, Any
-import sys
 
 import action_chain
+import address_index
+import browser_profile
+import container_index
+import driver_pool
+import map_query
+import map_waits
+import nearest_table
+import tracing
 import util
+import voice_util
 from voice_util import say
 
 import selenium
 from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support.ui import Select, WebDriverWait
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support import expected_conditions as EC
 
-# Fix for macOS
-if sys.platform == 'darwin':
-    from webdriver_manager.chrome import ChromeDriverManager
-
 # ------------------------------------------------------------------
 #   Config & globals
 # ------------------------------------------------------------------
@@ -30,7 +31,7 @@ AFVAL_URL = (
 
 residual, glass, paper, textile, textile_collection, organic, bread  = (1, 2, 3, 5, 13698, 6, 7)
 
-CHROME_HEADLESS = False
+BROWSER_PROFILE = "map" # see browser_profile.PROFILES, "full" shows the window and loads everything
 DEFAULT_TIMEOUT = 15
 
 action_chain = action_chain.ActionChain()
@@ -58,6 +59,7 @@ def collect_user_data() -> Dict[str, Any]:
         nonlocal address
         address = v
         data["address"] = address
+        data["street"] = address
         print(f"[DEBUG] Stored street: {address}")
 
     h = action_chain.add_action()
@@ -70,6 +72,7 @@ def collect_user_data() -> Dict[str, Any]:
         nonlocal stNumber
         stNumber = v
         data["address"] = data.get("address") + f" {str(stNumber)}"
+        data["house_number"] = stNumber
         print(f"[DEBUG] Stored house number: {str(stNumber)}")
 
     h = action_chain.add_action()
@@ -77,26 +80,19 @@ def collect_user_data() -> Dict[str, Any]:
     h.add_get_user_input(util.INPUT_TYPE.NUMBER, store_stNumber)
     h.add_confirm_user_input("Did I understand you correctly, your house number is ")
 
-     # — Ask for container type — ----------------------------------------------------
-    container: int | None = None
-    type_mapping = {
-        "residual waste": 1,
-        "glass": 2,
-        "paper": 3,
-        "textile containers": 5,
-        "organic waste": 6,
-        "bread and pastry waste" : 7
-    }
-    def store_container(v):
-        nonlocal container
-        container = v
-        data["container"] = 13698 if container == "textile collection" else int("1249" + str(type_mapping[v]))
-        print(f"[DEBUG] Stored container type: {container}")
+     # — Ask for container types — ----------------------------------------------------
+    containers: list[str] | None = None
+    def store_containers(v):
+        nonlocal containers
+        containers = v or []
+        data["containers"] = [container_index.fraction_id(name) for name in containers]
+        data["container"] = data["containers"][0] if data["containers"] else None
+        print(f"[DEBUG] Stored container types: {containers}")
 
     h = action_chain.add_action()
-    h.add_prompt_user("What is the container type you want to find? Residual waste or glass or paper or textile collection, or textile containers, or organic waste, or bread and pastry waste.")
-    h.add_get_user_input(util.INPUT_TYPE.CONTAINER, store_container)
-    h.add_confirm_user_input("Did I understand you correctly, the container type you want to find is ")
+    h.add_prompt_user("Which container types do you want to find? You can name more than one: residual waste, glass, paper, textile collection, textile containers, organic waste, or bread and pastry waste.")
+    h.add_get_user_input(util.INPUT_TYPE.CONTAINERS, store_containers)
+    h.add_confirm_user_input("Did I understand you correctly, the container types you want to find are ")
 
     # fill dummy data for testing
     #data["container"] = residual  # Default to residual waste
@@ -114,53 +110,21 @@ def wait_click(wait: WebDriverWait, locator: Tuple[str, str]):
     el.click()
     return el
 
-# ------------------------------------------------------------------
-#   Main form-filler
-# ------------------------------------------------------------------
-def find_bin(driver: webdriver.Chrome, data: Dict[str, Any]) -> str:
-    wait = WebDriverWait(driver, DEFAULT_TIMEOUT)
-
-    # 1) Wait for the map to load
-    wait.until(EC.presence_of_element_located((By.ID, "map")))
-
-    # 2) Click the "Find container" button
-    wait_click(wait, (By.CLASS_NAME, "legend__search"))
-
-    # 3) Fill in the address and press enter
-    address = data.get("address", "")
-    if not address:
-        raise ValueError("Address is required to find a bin.")
-    
-    address_input = wait.until(EC.presence_of_element_located((By.ID, "search-input")))
-    address_input.send_keys(address)
-    # Wait for the listings to load then find the first listing in the dropdown with class search-result search-result--selected and click it
-    wait.until(EC.presence_of_element_located((By.CLASS_NAME, "search-result")))
-    first_listing = wait.until(EC.presence_of_element_located((By.CLASS_NAME, "search-result--selected")))
-    first_listing.click()
-    # Wait for the map to update with the new location
-    wait.until(EC.presence_of_element_located((By.CLASS_NAME, "leaflet-marker-icon")))
-
-    # 4) Find the ul with class categories and click on all the checkboxes inside it except for the one with value "1249 + str(data['container'])"
-    # Using their xpaths
-    container_type_value = data["container"]
-    categories_ul = wait.until(EC.presence_of_element_located((By.XPATH, "//ul[@class='categories']")))
-    checkboxes = categories_ul.find_elements(By.CLASS_NAME, "form-checkbox__label")
-    for checkbox in [12491, 12492, 12493, 12495, 13698, 12496, 12497]:
-        if checkbox != container_type_value:
-            label = wait.until(EC.element_to_be_clickable((By.XPATH, f"//label[@for='category_{checkbox}_checkbox']")))
-            label.click()
-    
-    time.sleep(2)
-
-    # 4) Zoom in to reduce containers shown. Focus on the closest ones.
+def _open_nearest_by_clicking(driver: webdriver.Chrome, wait: WebDriverWait, timer: map_waits.StepTimer):
+    """
+    Zoom and click through the clusters until a container marker can be clicked.
+    Used when the Leaflet map cannot be queried directly.
+    """
+    # Zoom in to reduce containers shown. Focus on the closest ones.
     zoom_button = wait.until(EC.element_to_be_clickable((By.CLASS_NAME, "leaflet-control-zoom-in")))
     # Click the zoom button until its class changes to "disabled"
+    before = map_waits.snapshot(driver)
     while "leaflet-disabled" not in zoom_button.get_attribute("class"):
+        before = map_waits.snapshot(driver)
         zoom_button.click()
-        time.sleep(0.5)
+        timer.wait("zoom in", map_waits.zoom_finished(before), replaced=0.5)
 
-        
-    time.sleep(2)
+    timer.wait("markers after zoom in", map_waits.map_idle(before), replaced=2)
 
     markers = wait.until(EC.presence_of_all_elements_located((By.XPATH, "//div[contains(@class, 'leaflet-marker-icon')]")))
     poi_markers = [marker for marker in markers if "marker-poi-wrapper" in marker.get_attribute("class")]        
@@ -169,8 +133,9 @@ def find_bin(driver: webdriver.Chrome, data: Dict[str, Any]) -> str:
     # Zoom out until a cluster or marker is found
     zoom_button = wait.until(EC.element_to_be_clickable((By.CLASS_NAME, "leaflet-control-zoom-out")))
     while not poi_markers and not clusters:
+        before = map_waits.snapshot(driver)
         zoom_button.click()
-        time.sleep(0.5)
+        timer.wait("zoom out", map_waits.map_idle(before), replaced=0.5)
         markers = wait.until(EC.presence_of_all_elements_located((By.XPATH, "//div[contains(@class, 'leaflet-marker-icon')]")))
         poi_markers = [marker for marker in markers if "marker-poi-wrapper" in marker.get_attribute("class")]        
         clusters = [marker for marker in markers if "marker-cluster-wrapper" in marker.get_attribute("class")]
@@ -180,8 +145,9 @@ def find_bin(driver: webdriver.Chrome, data: Dict[str, Any]) -> str:
     while not poi_markers:
         first_cluster = clusters[0]
         print("[DEBUG] Clicking on the first cluster found.")
+        before = map_waits.snapshot(driver)
         first_cluster.click()
-        time.sleep(2)
+        timer.wait("cluster click", map_waits.map_idle(before), replaced=2)
         markers = wait.until(EC.presence_of_all_elements_located((By.XPATH, "//div[contains(@class, 'leaflet-marker-icon')]")))
         poi_markers = [marker for marker in markers if "marker-poi-wrapper" in marker.get_attribute("class")]
         clusters = [marker for marker in markers if "marker-cluster-wrapper" in marker.get_attribute("class")]
@@ -194,61 +160,251 @@ def find_bin(driver: webdriver.Chrome, data: Dict[str, Any]) -> str:
         except selenium.common.exceptions.ElementClickInterceptedException:
             # zoom out a bit
             zoom_button = wait.until(EC.element_to_be_clickable((By.CLASS_NAME, "leaflet-control-zoom-out")))
+            before = map_waits.snapshot(driver)
             zoom_button.click()
-            time.sleep(0.5)
+            timer.wait("zoom out", map_waits.zoom_finished(before), replaced=0.5)
 
+# ------------------------------------------------------------------
+#   Main form-filler
+# ------------------------------------------------------------------
+CATEGORIES = list(container_index.FRACTIONS) # category ids of the map legend
 
-    feature_div = wait.until(EC.presence_of_element_located((By.CLASS_NAME, "feature-digital-item__link")))
-    href = feature_div.get_attribute("href")
+def _search_address(driver: webdriver.Chrome, wait: WebDriverWait, address: str):
+    # 1) Wait for the map to load
+    wait.until(EC.presence_of_element_located((By.ID, "map")))
+
+    # 2) Click the "Find container" button
+    wait_click(wait, (By.CLASS_NAME, "legend__search"))
+
+    # 3) Fill in the address and press enter
+    if not address:
+        raise ValueError("Address is required to find a bin.")
     
-    driver.get(href)
+    address_input = wait.until(EC.presence_of_element_located((By.ID, "search-input")))
+    address_input.send_keys(address)
+    # Wait for the listings to load then find the first listing in the dropdown with class search-result search-result--selected and click it
+    wait.until(EC.presence_of_element_located((By.CLASS_NAME, "search-result")))
+    first_listing = wait.until(EC.presence_of_element_located((By.CLASS_NAME, "search-result--selected")))
+    first_listing.click()
+    # Wait for the map to update with the new location
+    wait.until(EC.presence_of_element_located((By.CLASS_NAME, "leaflet-marker-icon")))
+
+
+def _show_only(driver: webdriver.Chrome, wait: WebDriverWait, timer: map_waits.StepTimer,
+               fraction: int, visible: set) -> set:
+    """
+    Click the legend checkboxes so only one category is shown
+    :param visible: the categories shown now, all of them on a fresh page
+    :return: the categories shown afterwards
+    """
+    before = map_waits.snapshot(driver)
+    for category in CATEGORIES:
+        if (category == fraction) != (category in visible):
+            label = wait.until(EC.element_to_be_clickable((By.XPATH, f"//label[@for='category_{category}_checkbox']")))
+            label.click()
+
+    timer.wait("category toggles", map_waits.markers_rerendered(before), replaced=2)
+    return {fraction}
+
+
+def _open_nearest(driver: webdriver.Chrome, wait: WebDriverWait, timer: map_waits.StepTimer,
+                  previous_link: Optional[str] = None,
+                  point: Optional[Tuple[float, float]] = None) -> str:
+    """
+    Open the nearest shown container
+    :param previous_link: link of the container opened before, its panel may still be shown
+    :param point: (lat, lon) to measure from, default the map centre
+    :return: the Google Maps link of the container
+    """
+    # Read all markers from the map in one call, fall back to zooming and clicking through the clusters
+    if map_query.open_nearest(driver, point) is None:
+        print("[WARN] Could not query the map directly, clicking through the clusters")
+        _open_nearest_by_clicking(driver, wait, timer)
+
+    def new_link(driver):
+        links = driver.find_elements(By.CLASS_NAME, "feature-digital-item__link")
+        href = links[0].get_attribute("href") if links else None
+        return href if href and href != previous_link else False
+
+    return wait.until(new_link)
+
+
+def _address_from_maps(driver: webdriver.Chrome, wait: WebDriverWait, timer: map_waits.StepTimer, href: str) -> str:
+    browser_profile.navigate(driver, href, BROWSER_PROFILE)
     WebDriverWait(driver, DEFAULT_TIMEOUT).until(
             EC.presence_of_element_located((By.ID, "yDmH0d"))
     )
     
     driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
 
-    time.sleep(2)
+    timer.wait("maps page", map_waits.document_ready, replaced=2)
 
     third_button = wait.until(EC.element_to_be_clickable((By.XPATH, "(//button)[3]")))
     third_button.click()
 
-    time.sleep(2)
+    destination = (By.XPATH, "(//input[@class='tactile-searchbox-input'])[2]")
+    timer.wait("maps directions", map_waits.attribute_present(destination, "aria-label"), replaced=2)
 
-    address_element = wait.until(EC.presence_of_element_located((By.XPATH, "(//input[@class='tactile-searchbox-input'])[2]")))
+    address_element = wait.until(EC.presence_of_element_located(destination))
     address_text = address_element.get_attribute("aria-label")
-    address_text = address_text.replace("Bestemming", "").strip()
-    return f"The nearest waste container for {data['container']} is located at {address_text}."
+    return address_text.replace("Bestemming", "").strip()
+
+
+def _reverse_geocode(lat: float, lon: float) -> Optional[str]:
+    """
+    Address of a container position from the local address index, None without index or nearby address
+    """
+    index = address_index.get_index()
+    address = index.reverse(lat, lon) if index is not None else None
+    return str(address) if address is not None else None
+
+
+def find_bins(driver: webdriver.Chrome, data: Dict[str, Any], fractions: list[int]) -> Dict[int, str]:
+    """
+    Nearest container of several fractions in one browser session. The address is
+    searched once; per fraction only the legend is switched and the nearest marker
+    read from the map. Its address comes from the local address index; only markers
+    it cannot resolve are opened and looked up on Google Maps, after all markers are
+    found, so the map is loaded once.
+    :return: fraction -> address of its nearest container
+    """
+    wait = WebDriverWait(driver, DEFAULT_TIMEOUT)
+    timer = map_waits.StepTimer(driver, DEFAULT_TIMEOUT)
+
+    with tracing.span("map.search"):
+        _search_address(driver, wait, data.get("address", ""))
+
+    # 4) Per fraction: show only that category and find its nearest container
+    point = data.get("location")    # the geocoded address, more exact than the map centre
+    visible = set(CATEGORIES)
+    results: Dict[int, str] = {}
+    links: Dict[int, str] = {}
+    link = None
+    for fraction in fractions:
+        with tracing.span("map.fraction", fraction=fraction):
+            with tracing.span("map.show_only"):
+                visible = _show_only(driver, wait, timer, fraction, visible)
+            with tracing.span("map.find_nearest"):
+                marker = map_query.find_nearest(driver, point)
+            place = _reverse_geocode(marker.lat, marker.lng) if marker is not None else None
+            if place is not None:
+                results[fraction] = place
+                continue
+            with tracing.span("map.open_nearest"):
+                link = links[fraction] = _open_nearest(driver, wait, timer, previous_link=link, point=point)
+
+    # 5) Resolve the addresses the local index could not
+    for fraction, href in links.items():
+        with tracing.span("maps.address", fraction=fraction):
+            results[fraction] = _address_from_maps(driver, wait, timer, href)
+    results = {fraction: results[fraction] for fraction in fractions}
+    print("[DEBUG] Wait timings:\n" + timer.report())
+    print("[DEBUG] Navigation timings:\n" + browser_profile.timing_report())
+    return results
+
+
+def find_bin(driver: webdriver.Chrome, data: Dict[str, Any]) -> str:
+    return combine_answer(find_bins(driver, data, [data["container"]]))
+
+
+def combine_answer(places: Dict[int, str]) -> str:
+    """
+    One spoken answer for all fractions
+    :param places: fraction -> where its nearest container is
+    """
+    if not places:
+        return "Sorry, I could not find a waste container near you."
+    if len(places) == 1:
+        fraction, place = next(iter(places.items()))
+        return f"The nearest waste container for {container_index.FRACTIONS.get(fraction, fraction)} is located at {place}."
+    parts = [f"for {container_index.FRACTIONS.get(fraction, fraction)} at {place}" for fraction, place in places.items()]
+    return "The nearest waste containers are " + util.join_spoken(parts) + "."
+
 # ------------------------------------------------------------------
 #   Run
 # ------------------------------------------------------------------
-def run_calculation(data: Dict[str, Any]) -> str:
-    opts = Options()
-    if CHROME_HEADLESS:
-        opts.add_argument("--headless=new")
+def geocode_address(data: Dict[str, Any]):
+    """
+    Resolve the spelled street and house number with the local address index.
+    Sets "location" and replaces "address" by the corrected spelling, which
+    also helps the search box of the live map.
+    """
+    if data.get("location") is not None or not data.get("street") or data.get("house_number") is None:
+        return
+    index = address_index.get_index()
+    if index is None:
+        return
+    address = index.geocode(data["street"], int(data["house_number"]))
+    if address is None:
+        print(f"[WARN] No street found for '{data['street']}'")
+        return
+    print(f"[DEBUG] Geocoded '{data['street']} {data['house_number']}' as {address} ({address.lat:.5f}, {address.lon:.5f})")
+    data["address"] = str(address)
+    data["location"] = (address.lat, address.lon)
+    data["address_row"] = address.row
+
+
+def find_bins_offline(data: Dict[str, Any], fractions: list[int]) -> Dict[int, str]:
+    """
+    Answer from the container snapshot instead of the live map
+    :param data: needs "location" (lat, lon), and "address_row" to use the precomputed table
+    :return: fraction -> where its nearest container is, for the fractions the snapshot could answer;
+             empty if there is no location, or the snapshot is missing or stale
+    """
+    location = data.get("location")
+    if location is None:
+        return {}
+    index = container_index.get_index()
+    if index is None or index.is_stale():
+        print("[DEBUG] Container snapshot missing or stale, using the live map")
+        return {}
+    # precomputed per address if the table is built from the same data, otherwise a tree search
+    table = nearest_table.get_table()
+    use_table = (table is not None and data.get("address_row") is not None
+                 and table.matches(address_index.get_index(), index))
+    places = {}
+    for fraction in fractions:
+        if use_table:
+            nearest = table.lookup(data["address_row"], fraction)
+        else:
+            nearest = next(iter(index.nearest(fraction, *location)), None)
+        if nearest is None:
+            continue
+        container = nearest.container
+        print(f"[DEBUG] Nearest container {container.id} is {nearest.distance_m:.0f} m away")
+        places[fraction] = (container.address or _reverse_geocode(container.lat, container.lon)
+                            or f"{container.lat:.5f}, {container.lon:.5f}")
+    return places
 
-    # macOS fix again
-    if sys.platform == 'darwin':
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=opts)
-    else:
-        driver = webdriver.Chrome(options=opts)
 
-    driver.maximize_window() # Needed to get most information on screen
-
-    try:
-        driver.get(AFVAL_URL)
+def run_calculation(data: Dict[str, Any]) -> str:
+    with tracing.span("calculation", demo="afval"):
+        return _run_calculation(data)
+
+
+def _run_calculation(data: Dict[str, Any]) -> str:
+    fractions = data.get("containers") or [data["container"]]
+    with tracing.span("geocode"):
+        geocode_address(data)
+    with tracing.span("offline.lookup"):
+        places = find_bins_offline(data, fractions)
+    missing = [fraction for fraction in fractions if fraction not in places]
+    if not missing:
+        return combine_answer(places)
+
+    with driver_pool.get_pool(BROWSER_PROFILE).borrow() as driver:
+        map_waits.install(driver)
+        browser_profile.navigate(driver, AFVAL_URL, BROWSER_PROFILE)
         WebDriverWait(driver, DEFAULT_TIMEOUT).until(
             EC.presence_of_element_located((By.ID, "map"))
         )
-        result = find_bin(driver, data)
-        return result
-    finally:
-        time.sleep(3)
-        driver.quit()
+        places.update(find_bins(driver, data, missing))
+    return combine_answer({fraction: places[fraction] for fraction in fractions if fraction in places})
 
 if __name__ == '__main__':
     ########## Task 3: Finding nearest bin ###########
+    voice_util.init() # health check and spaCy load while the welcome message plays
+    driver_pool.get_pool(BROWSER_PROFILE).warm() # Chrome starts while the user answers
     user_data = collect_user_data()
     result = run_calculation(user_data)
     say(result)
@@ -0,0 +1,195 @@
+"""
+Batch filling of the LH0082Z form from stored answer sets.
+
+Every line of the input file is one JSON record with the same keys that
+fill_pdf_document.collect_pdf_user_data produces, plus an optional "id":
+
+    {"id": "emp-0001", "0": "Jansen J.", "1_BSN": "123456789", "TICK_2A_JA": true, ...}
+
+Usage:
+    python batch_fill.py answers.jsonl filled/ --workers 4
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+import pdf_form
+
+# ---------------------------------------------------------------------------
+#   Configurations
+# ---------------------------------------------------------------------------
+
+TEMPLATE_PDF = "example.pdf"
+IN_FLIGHT_PER_WORKER = 4 # bounds the number of queued records, keeps memory flat
+
+_template: Optional[pdf_form.FormTemplate] = None # one parsed template per worker process
+
+
+@dataclass
+class BatchReport:
+    filled: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+    errors: list = field(default_factory=list)
+
+    @property
+    def forms_per_second(self) -> float:
+        return self.filled / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"Filled {self.filled} forms ({self.failed} failed) in {self.seconds:.2f}s "
+                f"- {self.forms_per_second:.1f} forms/s")
+
+
+# ----------------------------------------------------------------------
+# Input / output helpers
+# ----------------------------------------------------------------------
+def read_records(path: str, skipped: Optional[list] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the records of a JSONL file, one at a time. A line that is not a JSON
+    object is reported and skipped, the rest of the batch still runs.
+    :param path: JSONL file, "-" is not supported
+    :param skipped: list that gets (line number, error) of every skipped line
+    :return: generator of dicts
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError(f"expected a JSON object, got {type(record).__name__}")
+            except ValueError as e: # json.JSONDecodeError is a ValueError
+                print(f"[WARN] Skipping line {line_number} of {path}: {e}")
+                if skipped is not None:
+                    skipped.append((line_number, str(e)))
+                continue
+            yield record
+
+
+def output_path(output_dir: str, index: int, record: Dict[str, Any]) -> str:
+    """
+    Unique output file for a record: the running index keeps names apart even
+    if two records share an id
+    """
+    name = f"{index:06d}"
+    if record.get("id") is not None:
+        name += "_" + re.sub(r"[^A-Za-z0-9_.-]+", "-", str(record["id"]))[:64]
+    return os.path.join(output_dir, name + ".pdf")
+
+
+# ----------------------------------------------------------------------
+# Worker
+# ----------------------------------------------------------------------
+def _init_worker(template_path: str, lazy: bool = False):
+    global _template
+    _template = pdf_form.FormTemplate(template_path, lazy=lazy)
+
+
+def _fill_one(task: Tuple[int, Dict[str, Any], str, bool, bool]) -> Tuple[int, Optional[str]]:
+    index, record, path, overwrite, incremental = task
+    try:
+        _template.fill(record)
+        # "xb" refuses to clobber the output of an earlier batch
+        with open(path, "wb" if overwrite else "xb") as f:
+            _template.save(f, incremental=incremental)
+        return index, None
+    except Exception as e:
+        return index, f"{type(e).__name__}: {e}"
+
+
+# ---------------------------------------------------------------------------
+#   BATCH API
+# ---------------------------------------------------------------------------
+
+def fill_batch(records: Iterable[Dict[str, Any]], output_dir: str, template: str = TEMPLATE_PDF,
+               workers: Optional[int] = None, overwrite: bool = False,
+               incremental: bool = True, lazy: bool = False) -> BatchReport:
+    """
+    Fill one pdf per record, spread over a process pool
+    :param records: iterable of field dicts, consumed lazily
+    :param output_dir: directory for the filled forms, created if missing
+    :param template: the blank form, parsed once per worker
+    :param workers: number of processes, None for os.cpu_count(), 0 to fill in-process
+    :param overwrite: replace existing output files instead of failing on them
+    :param incremental: append the changed fields to the template bytes instead of a full rewrite
+    :param lazy: memory-map the template and parse only the form fields (pdf_lazy), the
+                 workers then share the template bytes through the page cache
+    :return: BatchReport with throughput and failures
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    report = BatchReport()
+    tasks = ((i, rec, output_path(output_dir, i, rec), overwrite, incremental)
+             for i, rec in enumerate(records))
+
+    def collect(result):
+        index, error = result
+        if error is None:
+            report.filled += 1
+        else:
+            report.failed += 1
+            report.errors.append((index, error))
+            print(f"[WARN] Record {index} failed: {error}")
+
+    start = time.perf_counter()
+    if workers == 0:
+        _init_worker(template, lazy and incremental)
+        try:
+            for task in tasks:
+                collect(_fill_one(task))
+        finally:
+            _template.close()
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(template, lazy and incremental)) as pool:
+            pending = set()
+            for task in tasks:
+                pending.add(pool.submit(_fill_one, task))
+                if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        collect(fut.result())
+            for fut in wait(pending).done:
+                collect(fut.result())
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+# ---------------------------------------------------------------------------
+#   MAIN
+# ---------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill the LH0082Z form for every record of a JSONL file.")
+    parser.add_argument("records", help="JSONL file with one answer set per line")
+    parser.add_argument("output_dir", help="directory for the filled pdfs")
+    parser.add_argument("--template", default=TEMPLATE_PDF, help="blank pdf form")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (0 = no pool)")
+    parser.add_argument("--overwrite", action="store_true", help="replace existing output files")
+    parser.add_argument("--full-rewrite", action="store_true",
+                        help="serialize the whole document instead of an incremental update")
+    parser.add_argument("--lazy", action="store_true",
+                        help="memory-map the template and only parse its form fields (large templates)")
+    args = parser.parse_args(argv)
+
+    skipped = []
+    report = fill_batch(read_records(args.records, skipped), args.output_dir, template=args.template,
+                        workers=args.workers, overwrite=args.overwrite,
+                        incremental=not args.full_rewrite, lazy=args.lazy)
+    print(report)
+    if skipped:
+        print(f"Skipped {len(skipped)} malformed lines: {', '.join(str(n) for n, _ in skipped)}")
+    return 1 if report.failed or skipped else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
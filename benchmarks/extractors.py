@@ -0,0 +1,352 @@
+"""
+Microbenchmark of the util extractors and INPUT_TYPE.format.
+
+Every turn runs one util.extract_* on the recognized text: spaCy NER,
+dateutil's fuzzy parser, pycountry, rapidfuzz, word2number. Per INPUT_TYPE
+this measures, on the labelled corpus in benchmarks/corpora/extractors.json:
+the latency distribution (p50/p95/p99/max per call), throughput, the peak
+Python allocation per call (tracemalloc) and the accuracy against the labels.
+INPUT_TYPE.format, which builds the read-back of the confirmation question,
+is measured on the labels as the implementation "format".
+
+Alternative implementations run side by side with the one in util: the ones
+in ALTERNATIVES (extractors without spaCy or without the LLM), and any
+function given with --alt TYPE=name=module:function. The LLM of extract_yes_no
+is replaced by the rule-based stand-in of benchmarks.sessions, so only the
+parsing is measured (--live-llm uses the configured model).
+
+Results can be appended to HISTORY_PATH (--record) and shown as a trend per
+extractor (--trend).
+
+Usage (from the repository root):
+    python -m benchmarks.extractors
+    python -m benchmarks.extractors --type NUMBER --type BIRTHDATE --repeat 50 -v
+    python -m benchmarks.extractors --alt NUMBER=mine=my_module:extract_number --record
+    python -m benchmarks.extractors --trend
+"""
+
+import argparse
+import contextlib
+import datetime
+import importlib
+import io
+import json
+import math
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from dateutil.parser import parse as parse_date
+from word2number import w2n
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import util  # noqa: E402
+import voice_util  # noqa: E402
+from benchmarks.sessions import llm_answer  # noqa: E402
+
+CORPUS_PATH = os.path.join(ROOT, "benchmarks", "corpora", "extractors.json")
+HISTORY_PATH = os.path.join(ROOT, "benchmarks", "history", "extractors.jsonl")
+REPEAT = 20         # passes over the corpus per extractor
+WARMUP = 2          # passes before measuring (spaCy and the regex caches warm up)
+
+
+# ----------------------------------------------------------------------
+# Alternative implementations
+# ----------------------------------------------------------------------
+def number_without_spacy(text: str) -> Optional[int]:
+    match = re.search(r"\d+", text.replace(",", ""))
+    if match:
+        return int(match.group())
+    try:
+        return w2n.word_to_num(text)
+    except ValueError:
+        return None
+
+
+def amount_without_spacy(text: str) -> Optional[float]:
+    match = re.search(r"\d[\d,]*(?:\.\d+)?", text)
+    if match:
+        return float(match.group().replace(",", ""))
+    try:
+        return float(w2n.word_to_num(text))
+    except ValueError:
+        return None
+
+
+def birthdate_without_spacy(text: str) -> Optional[tuple[int, int, int]]:
+    if not re.search(r"\d{4}", text):
+        return None # dateutil fills a missing year with this year's
+    try:
+        dt = parse_date(text, dayfirst=True, fuzzy=True)
+    except (ValueError, OverflowError):
+        return None
+    return dt.day, dt.month, dt.year
+
+
+def yes_no_keywords(text: str) -> Optional[bool]:
+    words = set(re.findall(r"[a-z']+", text.lower()))
+    if words & {"no", "nope", "not", "don't", "wrong", "incorrect"}:
+        return False
+    if words & {"yes", "yeah", "yep", "correct", "right", "sure", "please"}:
+        return True
+    return None
+
+
+ALTERNATIVES: Dict[str, Dict[str, Callable[[str], Any]]] = {
+    "NUMBER": {"no-spacy": number_without_spacy},
+    "AMOUNT": {"no-spacy": amount_without_spacy},
+    "BIRTHDATE": {"no-spacy": birthdate_without_spacy},
+    "YES_NO": {"keywords": yes_no_keywords},
+}
+
+
+def implementations(input_type: util.INPUT_TYPE, extra: Dict[str, Dict[str, Callable]]) -> Dict[str, Callable]:
+    impls = {"util": lambda text: util._extract(input_type, text)}
+    impls.update(ALTERNATIVES.get(input_type.name, {}))
+    impls.update(extra.get(input_type.name, {}))
+    return impls
+
+
+# ----------------------------------------------------------------------
+# Measuring
+# ----------------------------------------------------------------------
+@dataclass
+class ExtractorResult:
+    input_type: str
+    impl: str
+    samples: int
+    calls: int = 0
+    p50_us: float = 0.0
+    p95_us: float = 0.0
+    p99_us: float = 0.0
+    max_us: float = 0.0
+    per_second: float = 0.0
+    alloc_kib: float = 0.0          # mean peak Python allocation per call
+    accuracy: Optional[float] = None  # share of samples extracted as labelled, None for format
+    errors: int = 0                 # calls that raised
+    misses: List[list] = field(default_factory=list)  # [text, expected, got]
+
+
+def _normalize(value):
+    if isinstance(value, tuple):
+        return [_normalize(v) for v in value]
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))]
+
+
+def _call(func: Callable, arg):
+    try:
+        return func(arg), None
+    except Exception as e:
+        return None, e
+
+
+def measure(input_type: str, impl: str, func: Callable, inputs: List[Any], expected: Optional[List[Any]] = None,
+            repeat: int = REPEAT, warmup: int = WARMUP) -> ExtractorResult:
+    """
+    :param inputs: the arguments, one call each per pass
+    :param expected: the labels, None to skip the accuracy
+    """
+    result = ExtractorResult(input_type, impl, len(inputs))
+    with contextlib.redirect_stdout(io.StringIO()):  # the extractors print their warnings
+        for _ in range(warmup):
+            for arg in inputs:
+                _call(func, arg)
+
+        durations = []
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for arg in inputs:
+                t0 = time.perf_counter_ns()
+                _call(func, arg)
+                durations.append((time.perf_counter_ns() - t0) / 1000)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        allocated = 0
+        outputs = []
+        for arg in inputs:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            output, error = _call(func, arg)
+            allocated += tracemalloc.get_traced_memory()[1] - before
+            outputs.append(output)
+            result.errors += error is not None
+        tracemalloc.stop()
+
+    durations.sort()
+    result.calls = len(durations)
+    result.p50_us = _quantile(durations, 0.5)
+    result.p95_us = _quantile(durations, 0.95)
+    result.p99_us = _quantile(durations, 0.99)
+    result.max_us = durations[-1]
+    result.per_second = result.calls / elapsed if elapsed else math.inf
+    result.alloc_kib = allocated / len(inputs) / 1024
+    if expected is not None:
+        correct = 0
+        for arg, label, output in zip(inputs, expected, outputs):
+            if _normalize(output) == _normalize(label):
+                correct += 1
+            else:
+                result.misses.append([arg, label, _normalize(output)])
+        result.accuracy = correct / len(inputs)
+    return result
+
+
+def run(corpus: Dict[str, List[list]], types: Optional[List[str]] = None,
+        extra: Optional[Dict[str, Dict[str, Callable]]] = None, repeat: int = REPEAT) -> List[ExtractorResult]:
+    results = []
+    for input_type in util.INPUT_TYPE:
+        samples = corpus.get(input_type.name)
+        if not samples or (types and input_type.name not in types):
+            continue
+        texts = [text for text, _ in samples]
+        labels = [label for _, label in samples]
+        for impl, func in implementations(input_type, extra or {}).items():
+            results.append(measure(input_type.name, impl, func, texts, labels, repeat))
+        values = [label for label in labels if label is not None]
+        if values:
+            results.append(measure(input_type.name, "format", input_type.format, values, None, repeat))
+    return results
+
+
+def format_results(results: List[ExtractorResult], verbose: bool = False) -> str:
+    header = (f"{'type':<11} {'impl':<10} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {'max us':>9} "
+              f"{'calls/s':>9} {'KiB/call':>8} {'accuracy':>8} {'vs util':>7}")
+    lines = [header, "-" * len(header)]
+    baseline = {r.input_type: r.p50_us for r in results if r.impl == "util"}
+    for r in results:
+        accuracy = f"{r.accuracy:.0%}" if r.accuracy is not None else "-"
+        relative = f"{r.p50_us / baseline[r.input_type]:.2f}x" if r.impl not in ("util", "format") \
+            and baseline.get(r.input_type) else ""
+        lines.append(f"{r.input_type:<11} {r.impl:<10} {r.p50_us:>9.1f} {r.p95_us:>9.1f} {r.p99_us:>9.1f} "
+                     f"{r.max_us:>9.1f} {r.per_second:>9.0f} {r.alloc_kib:>8.1f} {accuracy:>8} {relative:>7}"
+                     + (f"  {r.errors} errors" if r.errors else ""))
+        if verbose:
+            for text, label, got in r.misses:
+                lines.append(f"{'':<23} miss {text!r}: expected {label!r}, got {got!r}")
+    return "\n".join(lines)
+
+
+# ----------------------------------------------------------------------
+# History
+# ----------------------------------------------------------------------
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def record(results: List[ExtractorResult], path: str = HISTORY_PATH, note: Optional[str] = None):
+    """
+    Append one run to the history file, one JSON line per run
+    """
+    entry = {"time": datetime.datetime.now().isoformat(timespec="seconds"), "commit": _git_commit(),
+             "python": platform.python_version(), "machine": platform.node(), "note": note,
+             "results": [{k: v for k, v in asdict(r).items() if k != "misses"} for r in results]}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+    print(f"Recorded in {path}")
+
+
+def trend(path: str = HISTORY_PATH, last: int = 10, types: Optional[List[str]] = None) -> str:
+    """
+    p50 and accuracy of every extractor over the last runs in the history file
+    """
+    with open(path, encoding="utf-8") as f:
+        runs = [json.loads(line) for line in f if line.strip()][-last:]
+    series: Dict[tuple, Dict[int, dict]] = {}
+    for i, entry in enumerate(runs):
+        for r in entry["results"]:
+            if not types or r["input_type"] in types:
+                series.setdefault((r["input_type"], r["impl"]), {})[i] = r
+    labels = [f"{entry['time'][5:16]} {entry.get('commit') or ''}".strip() for entry in runs]
+    lines = ["p50 us (accuracy) per run, oldest first:"]
+    lines += [f"  {i + 1}: {label}" for i, label in enumerate(labels)]
+    lines.append(f"{'type':<11} {'impl':<10} " + " ".join(f"{i + 1:>13}" for i in range(len(runs))))
+    for (input_type, impl), points in series.items():
+        cells = []
+        for i in range(len(runs)):
+            r = points.get(i)
+            if r is None:
+                cells.append(f"{'-':>13}")
+            else:
+                accuracy = f"({r['accuracy']:.0%})" if r.get("accuracy") is not None else ""
+                cells.append(f"{r['p50_us']:>7.1f}{accuracy:>6}")
+        lines.append(f"{input_type:<11} {impl:<10} " + " ".join(cells))
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+#   MAIN
+# ---------------------------------------------------------------------------
+
+def _parse_alt(text: str) -> tuple[str, str, Callable]:
+    try:
+        input_type, name, target = text.split("=", 2)
+        module_name, function_name = target.split(":")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected TYPE=name=module:function, got {text!r}") from None
+    if input_type not in util.INPUT_TYPE.__members__:
+        raise argparse.ArgumentTypeError(f"unknown INPUT_TYPE {input_type!r}")
+    return input_type, name, getattr(importlib.import_module(module_name), function_name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the util extractors on a labelled corpus.")
+    parser.add_argument("--corpus", default=CORPUS_PATH)
+    parser.add_argument("--type", action="append", help="only this INPUT_TYPE (repeatable)")
+    parser.add_argument("--alt", type=_parse_alt, action="append", default=[],
+                        help="also run TYPE=name=module:function (repeatable)")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--live-llm", action="store_true", help="extract_yes_no asks the configured LLM")
+    parser.add_argument("--record", action="store_true", help=f"append the results to {HISTORY_PATH}")
+    parser.add_argument("--note", help="stored with --record, e.g. what changed")
+    parser.add_argument("--history", default=HISTORY_PATH)
+    parser.add_argument("--trend", nargs="?", type=int, const=10, metavar="RUNS",
+                        help="show the last RUNS recorded runs instead of measuring")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="list the misclassified samples")
+    args = parser.parse_args(argv)
+
+    if args.trend:
+        print(trend(args.history, args.trend, args.type))
+        return 0
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)
+    extra: Dict[str, Dict[str, Callable]] = {}
+    for input_type, name, func in args.alt:
+        extra.setdefault(input_type, {})[name] = func
+
+    if not args.live_llm:
+        voice_util.make_llm_request = llm_answer
+    results = run(corpus, args.type, extra, args.repeat)
+    print(format_results(results, args.verbose))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+    if args.record:
+        record(results, args.history, args.note)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Import-time profile of the voice modules, with a budget.
+
+Importing voice_util (and util, action_chain, which every demo imports) must
+stay cheap: no spaCy model, no network health check, no threads. Those belong
+to voice_util.init(). This runs `python -X importtime -c "import <module>"` in a
+fresh interpreter per module, reports the slowest imports below it and fails
+(exit code 1) when the median cumulative import time exceeds the module's
+budget in BUDGET_MS, or when a module in LAZY_MODULES got imported.
+
+Usage (from the repository root):
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --module voice_util --top 25 --repeat 5
+    python -m benchmarks.import_time --budget voice_util=600
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BUDGET_MS = {           # median cumulative import time per module
+    "voice_util": 1000,
+    "util": 1000,
+    "action_chain": 1000,
+}
+LAZY_MODULES = ("spacy", "thinc", "torch")  # loaded by util.load_models(), never on import
+REPEAT = 3
+TOP = 15
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+@dataclass
+class ImportEntry:
+    name: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+@dataclass
+class ImportProfile:
+    module: str
+    entries: List[ImportEntry] = field(default_factory=list)
+
+    @property
+    def cumulative_ms(self) -> float:
+        own = next((e for e in self.entries if e.name == self.module and e.depth == 0), None)
+        return own.cumulative_us / 1000 if own else float("nan")
+
+    def imported(self, name: str) -> bool:
+        return any(e.name == name or e.name.startswith(name + ".") for e in self.entries)
+
+
+def parse_importtime(stderr: str) -> List[ImportEntry]:
+    """
+    The entries of a -X importtime report, in the order the imports finished
+    """
+    entries = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append(ImportEntry(name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return entries
+
+
+def profile(module: str) -> ImportProfile:
+    """
+    Import module in a fresh interpreter with -X importtime
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               cwd=ROOT, capture_output=True, text=True, timeout=300)
+    if completed.returncode != 0:
+        tail = completed.stderr.strip().splitlines()[-1:] or ["no output"]
+        raise RuntimeError(f"import {module} failed: {tail[0]}")
+    return ImportProfile(module, parse_importtime(completed.stderr))
+
+
+def check(profiles: List[ImportProfile], budget_ms: Optional[float]) -> List[str]:
+    """
+    :return: the budget violations of one module's profiles
+    """
+    module = profiles[0].module
+    problems = []
+    median = statistics.median(p.cumulative_ms for p in profiles)
+    if budget_ms is not None and median > budget_ms:
+        problems.append(f"import {module} takes {median:.0f} ms, the budget is {budget_ms:.0f} ms")
+    for lazy in LAZY_MODULES:
+        if profiles[0].imported(lazy):
+            problems.append(f"import {module} imports {lazy}")
+    return problems
+
+
+def format_profile(p: ImportProfile, top: int = TOP) -> str:
+    lines = [f"{'cumulative ms':>13} {'self ms':>8}  module"]
+    for e in sorted(p.entries, key=lambda e: -e.cumulative_us)[:top]:
+        lines.append(f"{e.cumulative_us / 1000:>13.1f} {e.self_us / 1000:>8.1f}  {'  ' * e.depth}{e.name}")
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+#   MAIN
+# ---------------------------------------------------------------------------
+
+def _parse_budget(text: str) -> tuple[str, float]:
+    module, sep, ms = text.partition("=")
+    try:
+        return module, float(ms)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected module=milliseconds, got {text!r}") from None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Profile the import time of the voice modules against a budget.")
+    parser.add_argument("--module", action="append", help="module to import (repeatable), defaults to BUDGET_MS")
+    parser.add_argument("--budget", type=_parse_budget, action="append", default=[],
+                        help="module=milliseconds, overrides BUDGET_MS (repeatable)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="imports per module, the median is checked")
+    parser.add_argument("--top", type=int, default=TOP, help="slowest imports to list")
+    args = parser.parse_args(argv)
+
+    budgets: Dict[str, float] = {**BUDGET_MS, **dict(args.budget)}
+    problems = []
+    for module in args.module or list(BUDGET_MS):
+        try:
+            profiles = [profile(module) for _ in range(max(1, args.repeat))]
+        except RuntimeError as e:
+            problems.append(str(e))
+            continue
+        timings = ", ".join(f"{p.cumulative_ms:.0f}" for p in profiles)
+        budget = budgets.get(module)
+        print(f"import {module}: {timings} ms" + (f" (budget {budget:.0f} ms)" if budget is not None else ""))
+        print(format_profile(min(profiles, key=lambda p: p.cumulative_ms), args.top))
+        print()
+        problems += check(profiles, budget)
+
+    for problem in problems:
+        print(f"FAIL {problem}")
+    if not problems:
+        print("All imports within budget")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Latency of the categorization calls to the LLM, before and after the warm-up
+and the fixed system prompt.
+
+Modes, each run against the configured LM Studio / Ollama server (or --url):
+    legacy   the request as voice_util sent it before: the instructions repeated in one user
+             prompt, no token limit, no stop sequence, a new connection per call, no warm-up
+    current  voice_util.classify after voice_util.warm_up_llm(): fixed SYSTEM_PROMPT prefix,
+             llm_max_tokens, the category JSON schema (llm_structured) at llm_temperature,
+             one kept-alive connection
+
+Per mode the first call (which pays model load and prompt processing when the
+server is cold) is reported apart from the p50/p95 of the remaining calls, with
+the share of replies that name exactly one of the categories. Restart the
+server (or unload the model) between runs to measure a cold first call.
+
+Usage (from the repository root):
+    python -m benchmarks.llm_latency
+    python -m benchmarks.llm_latency --mode current --rounds 5
+    python -m benchmarks.llm_latency --url http://localhost:11434/api/generate --environment mac
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import voice_util  # noqa: E402
+
+CONFIRMATION = ["yes", "no"]
+CONTAINERS = ["residual waste", "glass", "paper", "textile", "organic waste", "bread and pastry waste"]
+SAMPLES = [
+    ("yes you did", CONFIRMATION),
+    ("no you did not", CONFIRMATION),
+    ("yes that's right", CONFIRMATION),
+    ("nope", CONFIRMATION),
+    ("I have some old bottles", CONTAINERS),
+    ("cardboard boxes", CONTAINERS),
+    ("that is correct", CONFIRMATION),
+    ("no that is wrong", CONFIRMATION),
+]
+ROUNDS = 3      # passes over SAMPLES per mode
+
+
+def legacy_request(text: str, categories: List[str]) -> str:
+    """
+    The categorization request of voice_util before the system prompt and the token limit
+    """
+    prompt = (
+        f"Which category from the list {categories} fits the sentence: "
+        f"'{text}' the best? Only reply with the matching category name."
+    )
+    if voice_util.environment == "mac":
+        data = {"model": voice_util.MODEL_NAME, "prompt": prompt, "stream": False, "temperature": 0.7}
+        return requests.post(voice_util.url, headers=voice_util.headers, json=data).json()["response"]
+    data = {"model": voice_util.MODEL_NAME, "messages": [{"role": "user", "content": prompt}], "temperature": 0.7}
+    response = requests.post(voice_util.url, headers=voice_util.headers, json=data)
+    return response.json()["choices"][0]["message"]["content"]
+
+
+@dataclass
+class ModeResult:
+    mode: str
+    warmup_ms: Optional[float] = None
+    first_ms: float = 0.0
+    durations_ms: List[float] = field(default_factory=list)  # the calls after the first
+    exact: int = 0              # replies naming exactly one category
+    calls: int = 0
+
+    def summary(self) -> str:
+        rest = sorted(self.durations_ms)
+        p50 = statistics.median(rest) if rest else float("nan")
+        p95 = rest[min(len(rest) - 1, int(len(rest) * 0.95))] if rest else float("nan")
+        warmup = f"{self.warmup_ms:8.0f}" if self.warmup_ms is not None else f"{'-':>8}"
+        return (f"{self.mode:<8} {warmup} {self.first_ms:9.0f} {p50:8.0f} {p95:8.0f} "
+                f"{self.exact / self.calls if self.calls else 0:>8.0%}")
+
+
+def _names_one(reply: Optional[str], categories: List[str]) -> bool:
+    if reply is None:
+        return False
+    reply = reply.lower()
+    return sum(category.lower() in reply for category in categories) == 1
+
+
+def run_mode(mode: str, rounds: int = ROUNDS) -> ModeResult:
+    result = ModeResult(mode)
+    if mode == "current":
+        start = time.perf_counter()
+        voice_util.warm_up_llm()
+        result.warmup_ms = (time.perf_counter() - start) * 1000
+        call = voice_util.classify
+    else:
+        call = lambda text, categories: legacy_request(text, categories)
+
+    for i in range(rounds * len(SAMPLES)):
+        text, categories = SAMPLES[i % len(SAMPLES)]
+        start = time.perf_counter()
+        reply = call(text, categories)
+        ms = (time.perf_counter() - start) * 1000
+        if i == 0:
+            result.first_ms = ms
+        else:
+            result.durations_ms.append(ms)
+        result.calls += 1
+        result.exact += _names_one(reply, categories)
+    return result
+
+
+# ---------------------------------------------------------------------------
+#   MAIN
+# ---------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Categorization latency of the LLM, legacy requests vs current.")
+    parser.add_argument("--mode", action="append", choices=["legacy", "current"],
+                        help="modes to run in this order (repeatable), default legacy then current")
+    parser.add_argument("--rounds", type=int, default=ROUNDS)
+    parser.add_argument("--url", help="LLM endpoint, defaults to voice_util.url")
+    parser.add_argument("--environment", choices=["linux", "mac"], help="API flavour: linux = LM Studio, mac = Ollama")
+    parser.add_argument("--json", help="also write the per-call latencies to this file")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        voice_util.url = args.url
+    if args.environment:
+        voice_util.environment = args.environment
+    results = []
+    for mode in args.mode or ["legacy", "current"]:
+        try:
+            results.append(run_mode(mode, args.rounds))
+        except requests.RequestException as e:
+            print(f"Could not reach the LLM at {voice_util.url}: {e}")
+            return 1
+    print(f"{'mode':<8} {'warm-up':>8} {'first ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'one cat.':>8}")
+    for result in results:
+        print(result.summary())
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([result.__dict__ for result in results], f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Benchmark of the pdf form backends in pdf_backends.
+
+Measures per backend: parse time, fill time, save time, output size and peak
+(Python) memory, on example.pdf and on synthetic forms with many pages.
+
+Usage (from the repository root):
+    python -m benchmarks.pdf_backends
+    python -m benchmarks.pdf_backends --pages 10 100 --fields 20 --repeat 5 --json results.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdf_backends  # noqa: E402
+
+EXAMPLE_PDF = "example.pdf"
+EXAMPLE_DATA = {
+    "0": "Jansen J.", "1_BSN": "123456789", "2": "Hoofdstraat 5", "3": "1234AB",
+    "4": "Amsterdam", "5": "Noord-Holland", "6": "Nederland", "d": "01", "m": "07", "y": "1997",
+    "d_F": "19", "m_F": "10", "y_F": "2026", "TICK_2A_JA": True, "TICK_2B_JA": False,
+}
+
+
+# ----------------------------------------------------------------------
+# Synthetic forms
+# ----------------------------------------------------------------------
+def make_synthetic_form(pages: int, fields_per_page: int) -> bytes:
+    """
+    Build a pdf with text fields f<page>_<i> and one "Ja" checkbox per page
+    :return: the pdf bytes
+    """
+    objects = {}
+    next_num = [1]
+
+    def add(body) -> int:
+        num = next_num[0]
+        next_num[0] += 1
+        objects[num] = body
+        return num
+
+    catalog = add(None)
+    page_tree = add(None)
+    font = add("<</Type/Font/Subtype/Type1/BaseFont/Helvetica>>")
+    on_state = add("<</Length 0>>\nstream\n\nendstream")
+    off_state = add("<</Length 0>>\nstream\n\nendstream")
+
+    page_nums, field_nums = [], []
+    for p in range(pages):
+        content = f"BT /Helv 12 Tf 50 800 Td (Synthetic page {p + 1}) Tj ET"
+        content_num = add(f"<</Length {len(content)}>>\nstream\n{content}\nendstream")
+        page_num = next_num[0] + fields_per_page + 1
+        widgets = []
+        for i in range(fields_per_page):
+            y = 760 - i * (700 // max(fields_per_page, 1))
+            widgets.append(add(f"<</Type/Annot/Subtype/Widget/FT/Tx/T(f{p}_{i})/Rect[100 {y} 400 {y + 16}]"
+                               f"/DA(/Helv 10 Tf 0 g)/F 4/P {page_num} 0 R>>"))
+        widgets.append(add(f"<</Type/Annot/Subtype/Widget/FT/Btn/T(c{p})/Rect[420 760 432 772]/AS/Off"
+                           f"/AP<</N<</Ja {on_state} 0 R/Off {off_state} 0 R>>>>/F 4/P {page_num} 0 R>>"))
+        annots = " ".join(f"{w} 0 R" for w in widgets)
+        assert add(f"<</Type/Page/Parent {page_tree} 0 R/MediaBox[0 0 595 842]/Contents {content_num} 0 R"
+                   f"/Resources<</Font<</Helv {font} 0 R>>>>/Annots[{annots}]>>") == page_num
+        page_nums.append(page_num)
+        field_nums.extend(widgets)
+
+    kids = " ".join(f"{n} 0 R" for n in page_nums)
+    fields = " ".join(f"{n} 0 R" for n in field_nums)
+    objects[page_tree] = f"<</Type/Pages/Kids[{kids}]/Count {pages}>>"
+    objects[catalog] = (f"<</Type/Catalog/Pages {page_tree} 0 R/AcroForm<</Fields[{fields}]"
+                        f"/DA(/Helv 0 Tf 0 g)/DR<</Font<</Helv {font} 0 R>>>>>>>>")
+
+    out = bytearray(b"%PDF-1.7\n")
+    offsets = {}
+    for num in sorted(objects):
+        offsets[num] = len(out)
+        out += f"{num} 0 obj\n{objects[num]}\nendobj\n".encode("latin-1")
+    xref_at = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for num in sorted(objects):
+        out += b"%010d 00000 n \n" % offsets[num]
+    out += f"trailer\n<</Size {len(objects) + 1}/Root {catalog} 0 R>>\nstartxref\n{xref_at}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def synthetic_data(pages: int, fields_per_page: int) -> dict:
+    data = {f"f{p}_{i}": f"value {p}-{i}" for p in range(pages) for i in range(fields_per_page)}
+    data["TICK_2B_JA"] = True # ticks the "Ja" checkboxes
+    return data
+
+
+# ----------------------------------------------------------------------
+# Measurement
+# ----------------------------------------------------------------------
+def measure(backend_cls, path: str, data: dict, incremental: bool, appearances: bool) -> dict:
+    t0 = time.perf_counter()
+    backend = backend_cls(path, incremental=incremental, appearances=appearances)
+    t1 = time.perf_counter()
+    backend.fill(data)
+    t2 = time.perf_counter()
+    output = backend.save()
+    t3 = time.perf_counter()
+
+    # separate pass, tracemalloc slows everything down too much to time it as well
+    tracemalloc.start()
+    backend = backend_cls(path, incremental=incremental, appearances=appearances)
+    backend.fill(data)
+    backend.save()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"parse_ms": (t1 - t0) * 1000, "fill_ms": (t2 - t1) * 1000, "save_ms": (t3 - t2) * 1000,
+            "output_kb": len(output) / 1024, "peak_mb": peak / 2**20}
+
+
+def run(cases, backends, repeat: int, incremental: bool, appearances: bool) -> list[dict]:
+    results = []
+    for label, path, data in cases:
+        for name in backends:
+            runs = [measure(pdf_backends.get_backend(name), path, data, incremental, appearances)
+                    for _ in range(repeat)]
+            row = {"form": label, "backend": name, "input_kb": os.path.getsize(path) / 1024}
+            row.update({key: statistics.median(r[key] for r in runs) for key in runs[0]})
+            results.append(row)
+            print(f"{label:<22} {name:<6} parse {row['parse_ms']:8.1f} ms  fill {row['fill_ms']:8.1f} ms  "
+                  f"save {row['save_ms']:8.1f} ms  in {row['input_kb']:8.0f} KB  out {row['output_kb']:8.0f} KB  "
+                  f"peak {row['peak_mb']:6.1f} MB")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pdf form backends.")
+    parser.add_argument("--backends", nargs="+", default=sorted(pdf_backends.BACKENDS))
+    parser.add_argument("--pages", nargs="*", type=int, default=[10, 100], help="sizes of the synthetic forms")
+    parser.add_argument("--fields", type=int, default=20, help="text fields per synthetic page")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--full-rewrite", action="store_true", help="benchmark full rewrites instead of incremental saves")
+    parser.add_argument("--need-appearances", action="store_true",
+                        help="leave appearances to the viewer instead of generating them")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cases = [("example.pdf", EXAMPLE_PDF, EXAMPLE_DATA)]
+        for pages in args.pages:
+            path = os.path.join(tmp, f"synthetic_{pages}.pdf")
+            with open(path, "wb") as f:
+                f.write(make_synthetic_form(pages, args.fields))
+            cases.append((f"synthetic {pages}x{args.fields}", path, synthetic_data(pages, args.fields)))
+        results = run(cases, args.backends, args.repeat, incremental=not args.full_rewrite,
+                      appearances=not args.need_appearances)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,698 @@
+"""
+End-to-end session benchmark of the three voice demos, without a microphone.
+
+Drives the real ActionChain flows of fill_pdf_document, toeslagen and afval
+from a scenario file: per session the demo and the scripted answers of the
+user, as transcripts or WAV clips. Everything outside the process is replaced
+by a local stand-in with a configurable injected latency:
+
+    speech      speech_recognition's Microphone/Recognizer: listening takes the
+                clip length (or a time per word), recognition returns the transcript
+    tts         gTTS and the audio player: synthesis and playback take a time per character
+    llm         a local HTTP server speaking the LM Studio and Ollama APIs, voice_util.url
+                points to it; it answers category prompts by matching the sentence
+    translate   googletrans in toeslagen
+    web         Chrome (driver_pool.new_chrome), the calculator form (toeslagen.fill_form)
+                and the container map (afval.find_bins)
+
+The rest runs for real: action_chain, voice_util, the spaCy extractors, the
+pdf filling, the local rules, the address and container indexes. Per session
+the harness reports the wall-clock time, the number of turns (asked questions,
+including retries), the latency injected on the session's path and the time
+per traced stage, and compares them with a stored baseline: more turns, or a
+session or stage slower than TOLERANCE (and MIN_DELTA_MS), is a regression and
+the exit code is 1. A session that asks for more answers than scripted, or
+leaves answers unused, fails as well.
+
+Usage (from the repository root):
+    python -m benchmarks.sessions --save-baseline
+    python -m benchmarks.sessions
+    python -m benchmarks.sessions --only toeslagen-basic --repeat 3 --time-scale 0.1 -v
+
+Scenario file (JSON), latencies in milliseconds, defaults in DEFAULT_LATENCY:
+    {"latency": {"llm_ms": 300, ...},
+     "sessions": [{"name": "pdf-basic", "demo": "fill_pdf_document",
+                   "utterances": ["j a n s e n", "yes", {"wav": "clips/initials.wav", "text": "J K"}, ...]}]}
+An utterance is a transcript ("" is not understood), {"wav": path, "text": transcript}
+(without "text" the clip is transcribed by the real recognizer) or {"silence": true}
+(no speech until the listen timeout). A session can set "latency", "settings"
+(module attributes, e.g. {"toeslagen": {"USE_LOCAL_RULES": false}}) and the stand-in
+calculator answers "result" and "translation".
+"""
+
+import argparse
+import ast
+import contextlib
+import importlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import types
+import wave
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import metrics  # noqa: E402
+import tracing  # noqa: E402
+
+SCENARIO_PATH = os.path.join(ROOT, "benchmarks", "scenarios", "sessions.json")
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baselines", "sessions.json")
+TOLERANCE = 0.10        # a session or stage this much slower than the baseline is a regression
+MIN_DELTA_MS = 100      # ... if it is also at least this much slower
+
+DEFAULT_LATENCY = {
+    "synthesize_ms": 350,           # gTTS request
+    "synthesize_ms_per_char": 1.5,
+    "playback_chars_per_second": 15,
+    "calibrate_ms": 250,            # adjust_for_ambient_noise
+    "listen_ms": 600,               # silence before and after a transcript
+    "listen_ms_per_word": 350,
+    "recognize_ms": 700,            # recognize_google
+    "llm_ms": 300,
+    "translate_ms": 400,
+    "browser_start_ms": 1500,
+    "navigate_ms": 1800,
+    "form_ms": 4000,                # toeslagen: filling the calculator until the result
+    "map_search_ms": 2500,          # afval: searching the address on the map
+    "map_fraction_ms": 1500,        # afval: per container type
+}
+
+# every run should reach the stand-in calculator instead of an answer cached by the previous run
+DEMO_SETTINGS = {"toeslagen": {"USE_RESULT_CACHE": False}}
+
+DEFAULT_RESULT = "Je hebt recht op huurtoeslag. Je krijgt ongeveer € 200 per maand."
+DEFAULT_TRANSLATION = "You are entitled to rent benefit. You will receive about € 200 per month."
+
+
+class ScenarioExhausted(BaseException):
+    """
+    The flow asked for more answers than the scenario has. Not an Exception:
+    get_user_input retries on every Exception and would listen forever.
+    """
+
+
+@dataclass
+class Utterance:
+    text: Optional[str]         # what the recognizer returns, None to transcribe the clip
+    wav: Optional[str] = None
+    seconds: float = 0.0        # how long the user speaks
+    silence: bool = False
+
+
+def load_utterance(entry, latency: Dict[str, float], base_dir: str) -> Utterance:
+    if isinstance(entry, str):
+        entry = {"text": entry}
+    if entry.get("silence"):
+        return Utterance(None, silence=True)
+    wav = entry.get("wav")
+    if wav is not None:
+        wav = os.path.join(base_dir, wav)
+        with wave.open(wav, "rb") as clip:
+            seconds = clip.getnframes() / clip.getframerate()
+        return Utterance(entry.get("text"), wav, seconds)
+    text = entry.get("text", "")
+    return Utterance(text, seconds=(latency["listen_ms"] + latency["listen_ms_per_word"] * len(text.split())) / 1000)
+
+
+# ----------------------------------------------------------------------
+# Stand-ins
+# ----------------------------------------------------------------------
+class StandIns:
+    """
+    Shared state of the stand-ins: the answers still to give, the latencies and the
+    latency injected so far on the session's path
+    """
+    def __init__(self, time_scale: float = 1.0):
+        self.time_scale = time_scale
+        self.latency = dict(DEFAULT_LATENCY)
+        self.utterances: deque[Utterance] = deque()
+        self.result = DEFAULT_RESULT
+        self.translation = DEFAULT_TRANSLATION
+        self.waited = 0.0
+        self.heard = 0
+        self._characters = 0
+        self._lock = threading.Lock()
+
+    def start(self, session: Dict[str, Any], latency: Dict[str, float], base_dir: str):
+        self.latency = {**DEFAULT_LATENCY, **latency, **session.get("latency", {})}
+        self.utterances = deque(load_utterance(entry, self.latency, base_dir) for entry in session["utterances"])
+        self.result = session.get("result", DEFAULT_RESULT)
+        self.translation = session.get("translation", DEFAULT_TRANSLATION)
+        self.waited = 0.0
+        self.heard = 0
+
+    def sleep(self, ms: float, count: bool = True):
+        """
+        :param count: add to the latency waited for on the session's path, False for background work
+        """
+        seconds = ms / 1000 * self.time_scale
+        if count:
+            with self._lock:
+                self.waited += seconds
+        time.sleep(seconds)
+
+    # speech ---------------------------------------------------------------
+    def listen(self, timeout: Optional[float]) -> Utterance:
+        if not self.utterances:
+            raise ScenarioExhausted(f"the flow asked for answer {self.heard + 1}, the scenario has {self.heard}")
+        utterance = self.utterances.popleft()
+        self.heard += 1
+        if utterance.silence:
+            self.sleep((timeout or 0) * 1000)
+            raise _sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+        self.sleep(utterance.seconds * 1000)
+        return utterance
+
+    def recognize(self, audio: Utterance) -> str:
+        if audio.text is None:
+            with _sr.AudioFile(audio.wav) as source:
+                recognizer = _sr.Recognizer()
+                return recognizer.recognize_google(recognizer.record(source))
+        self.sleep(self.latency["recognize_ms"])
+        if not audio.text:
+            raise _sr.UnknownValueError()
+        return audio.text
+
+    # text to speech -------------------------------------------------------
+    def synthesize(self, text: str):
+        self._characters = len(text)
+        self.sleep(self.latency["synthesize_ms"] + self.latency["synthesize_ms_per_char"] * len(text))
+
+    def play(self) -> int:
+        self.sleep(self._characters / self.latency["playback_chars_per_second"] * 1000)
+        return 0
+
+
+_stand_ins: Optional[StandIns] = None
+_sr = None  # the real speech_recognition module, for its exceptions and the clip transcription
+
+
+class _Microphone:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _Recognizer:
+    def __init__(self):
+        self.pause_threshold = 0.8
+
+    def adjust_for_ambient_noise(self, source, duration: float = 1.0):
+        _stand_ins.sleep(_stand_ins.latency["calibrate_ms"])
+
+    def listen(self, source, timeout=None, phrase_time_limit=None):
+        return _stand_ins.listen(timeout)
+
+    def recognize_google(self, audio, **kwargs) -> str:
+        return _stand_ins.recognize(audio)
+
+
+class _TTS:
+    def __init__(self, text: str, lang: str = "en", slow: bool = False):
+        self.text = text
+
+    def save(self, path: str):
+        _stand_ins.synthesize(self.text)
+
+
+class _Os:
+    """voice_util's os, with os.system (the audio player) as the playback stand-in"""
+    def __getattr__(self, name):
+        return getattr(os, name)
+
+    @staticmethod
+    def system(command: str) -> int:
+        return _stand_ins.play()
+
+
+class _Translator:
+    def translate(self, text: str, src: str = "auto", dest: str = "en"):
+        with tracing.span("translate"):
+            _stand_ins.sleep(_stand_ins.latency["translate_ms"])
+        return types.SimpleNamespace(text=text)
+
+
+def _translate_to_english(text: str) -> str:
+    with tracing.span("translate"):
+        _stand_ins.sleep(_stand_ins.latency["translate_ms"])
+    return _stand_ins.translation
+
+
+async def _translate_to_english_async(text: str) -> str:
+    return _translate_to_english(text)
+
+
+# LLM ----------------------------------------------------------------------
+# voice_util.classify, and the single-prompt form used before it had a system prompt
+_CATEGORY_PROMPT = re.compile(r"(?:Categories: |list )(\[.*?\])(?:\nSentence: | fits the sentence:? )'(.*)'", re.S)
+_YES_WORDS = {"yes", "yeah", "yep", "correct", "right", "sure", "please"}
+_NO_WORDS = {"no", "nope", "not", "wrong", "incorrect"}
+
+
+def llm_answer(prompt: str, system: Optional[str] = None, max_tokens: Optional[int] = None,
+               schema: Optional[dict] = None, temperature: float = 0.7) -> str:
+    """
+    What a well-behaved model replies to the category prompts of voice_util and util:
+    the category named in the sentence, or yes/no for the usual ways to say them.
+    With a schema, like constrained decoding, {"category": ...} with one of its values,
+    "unclear" (voice_util.UNCLEAR) when the sentence fits no category.
+    Has the signature of voice_util.make_llm_request, to replace it in-process.
+    """
+    if schema is not None:
+        allowed = next(iter(schema["properties"].values()))["enum"]
+        answer = llm_answer(prompt)
+        if answer not in allowed:
+            answer = "unclear" if "unclear" in allowed else allowed[0]
+        return json.dumps({next(iter(schema["properties"])): answer})
+    match = _CATEGORY_PROMPT.search(prompt)
+    if match is None:
+        return "unknown"
+    categories = ast.literal_eval(match.group(1))
+    words = set(re.findall(r"[a-z']+", match.group(2).lower()))
+    for category in categories:
+        if category.lower() in words:
+            return category
+    if "yes" in categories and words & _YES_WORDS:
+        return "yes"
+    if "no" in categories and words & _NO_WORDS:
+        return "no"
+    return "unknown"
+
+
+class _LlmHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b"{}"  # the health check of voice_util.init
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = request.get("prompt") or request.get("messages", [{}])[-1].get("content", "")
+        schema = request.get("format") or request.get("response_format", {}).get("json_schema", {}).get("schema")
+        _stand_ins.sleep(_stand_ins.latency["llm_ms"])
+        answer = llm_answer(prompt, schema=schema)
+        if self.path.startswith("/api/generate"):
+            reply = {"model": request.get("model"), "response": answer, "done": True}
+        else:
+            reply = {"choices": [{"index": 0, "message": {"role": "assistant", "content": answer}}]}
+        body = json.dumps(reply).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# web ----------------------------------------------------------------------
+class _Element:
+    text = ""
+
+    def is_displayed(self) -> bool:
+        return True
+
+    def is_enabled(self) -> bool:
+        return True
+
+    def click(self):
+        pass
+
+
+class _Driver:
+    """Enough of a WebDriver for driver_pool, browser_profile.navigate and the waits before the page work"""
+    def __init__(self):
+        self.window_handles = ["main"]
+        self.switch_to = types.SimpleNamespace(window=lambda handle: None)
+        self.current_url = "about:blank"
+
+    def get(self, url: str):
+        if url != "about:blank":
+            _stand_ins.sleep(_stand_ins.latency["navigate_ms"])
+        self.current_url = url
+
+    def execute_script(self, script: str, *args):
+        import browser_profile
+        if script == browser_profile.NAVIGATION_JS:
+            loaded = _stand_ins.latency["navigate_ms"] * _stand_ins.time_scale
+            return [loaded * 0.8, loaded]
+        if script.strip() == "return 1":
+            return 1
+        return None
+
+    def execute_cdp_cmd(self, cmd: str, params: dict) -> dict:
+        return {}
+
+    def find_element(self, by, value) -> _Element:
+        return _Element()
+
+    def find_elements(self, by, value) -> List[_Element]:
+        return [_Element()]
+
+    def set_window_size(self, width, height):
+        pass
+
+    def maximize_window(self):
+        pass
+
+    def delete_all_cookies(self):
+        pass
+
+    def close(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+def _new_chrome(profile=None) -> _Driver:
+    # browsers warmed in the background while the user answers do not delay the session
+    _stand_ins.sleep(_stand_ins.latency["browser_start_ms"], count=threading.current_thread() is threading.main_thread())
+    return _Driver()
+
+
+def _fill_form(driver, data: Dict[str, Any]) -> str:
+    with tracing.span("form.fill", steps=0):
+        _stand_ins.sleep(_stand_ins.latency["form_ms"])
+    return _stand_ins.result
+
+
+def _find_bins(driver, data: Dict[str, Any], fractions: List[int]) -> Dict[int, str]:
+    with tracing.span("map.search"):
+        _stand_ins.sleep(_stand_ins.latency["map_search_ms"])
+    places = {}
+    for fraction in fractions:
+        with tracing.span("map.fraction", fraction=fraction):
+            _stand_ins.sleep(_stand_ins.latency["map_fraction_ms"])
+        places[fraction] = f"Stand-in street {fraction}"
+    return places
+
+
+# ----------------------------------------------------------------------
+# Installing the stand-ins
+# ----------------------------------------------------------------------
+_MISSING = object()
+
+
+class Patches:
+    """Module attributes replaced for a while, restored in reverse order"""
+    def __init__(self):
+        self._saved = []
+
+    def set(self, obj, name: str, value):
+        self._saved.append((obj, name, getattr(obj, name, _MISSING)))
+        setattr(obj, name, value)
+
+    def restore(self):
+        for obj, name, value in reversed(self._saved):
+            if value is _MISSING:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, value)
+        self._saved.clear()
+
+
+@contextlib.contextmanager
+def installed(stand_ins: StandIns):
+    """
+    Replace speech, text to speech, the LLM endpoint, translation and the browser by the stand-ins
+    """
+    global _stand_ins, _sr
+    patches = Patches()
+    patches.set(metrics, "METRICS_PATH", None)  # voice_util.init() below starts the exporters
+    import driver_pool
+    import voice_util
+    import toeslagen
+    import afval
+
+    _stand_ins, _sr = stand_ins, voice_util.sr
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _LlmHandler)
+    threading.Thread(target=server.serve_forever, name="llm-stand-in", daemon=True).start()
+    path = "/api/generate" if voice_util.environment == "mac" else "/v1/chat/completions"
+
+    patches.set(voice_util, "sr", types.SimpleNamespace(
+        Recognizer=_Recognizer, Microphone=_Microphone, WaitTimeoutError=_sr.WaitTimeoutError,
+        UnknownValueError=_sr.UnknownValueError, RequestError=_sr.RequestError))
+    patches.set(voice_util, "r", _Recognizer())
+    patches.set(voice_util, "gTTS", _TTS)
+    patches.set(voice_util, "os", _Os())
+    patches.set(voice_util, "url", f"http://127.0.0.1:{server.server_port}{path}")
+    patches.set(voice_util, "health_url", f"http://127.0.0.1:{server.server_port}/")
+    patches.set(toeslagen, "translate_to_english",
+                _translate_to_english if sys.platform == "darwin" else _translate_to_english_async)
+    if hasattr(toeslagen, "translator"):
+        patches.set(toeslagen, "translator", _Translator())
+    patches.set(driver_pool, "new_chrome", _new_chrome)
+    patches.set(toeslagen, "fill_form", _fill_form)
+    patches.set(afval, "find_bins", _find_bins)
+    driver_pool.close_all()
+    # the spaCy model loads once here, not inside whichever session comes first
+    voice_util.init(background=False)
+    try:
+        yield
+    finally:
+        driver_pool.close_all()
+        patches.restore()
+        server.shutdown()
+        server.server_close()
+        _stand_ins = None
+
+
+# ----------------------------------------------------------------------
+# Sessions
+# ----------------------------------------------------------------------
+def _run_fill_pdf_document(module, workdir: str):
+    data = module.collect_pdf_user_data()
+    module.say("Thanks. I'm now filling in the PDF document.")
+    module.say(module.fill_pdf(data))
+
+
+def _run_toeslagen(module, workdir: str):
+    import driver_pool
+    driver_pool.get_pool(module.BROWSER_PROFILE).warm()
+    data = module.collect_user_data()
+    module.say("Please wait for the calculation...")
+    module.say(module.run_calculation(data))
+
+
+def _run_afval(module, workdir: str):
+    import driver_pool
+    driver_pool.get_pool(module.BROWSER_PROFILE).warm()
+    data = module.collect_user_data()
+    module.say(module.run_calculation(data))
+
+
+RUNNERS: Dict[str, Callable] = {
+    "fill_pdf_document": _run_fill_pdf_document,
+    "toeslagen": _run_toeslagen,
+    "afval": _run_afval,
+}
+
+
+@dataclass
+class SessionRun:
+    name: str
+    demo: str
+    seconds: float = 0.0
+    turns: int = 0
+    utterances: int = 0
+    waited: float = 0.0         # latency injected on the session's path
+    stages: Dict[str, List[float]] = field(default_factory=dict)  # span name -> [count, total ms]
+    error: Optional[str] = None
+
+    def as_baseline(self) -> dict:
+        return {"seconds": round(self.seconds, 3), "turns": self.turns,
+                "stages": {name: round(total, 1) for name, (_, total) in self.stages.items()}}
+
+
+def run_session(session: Dict[str, Any], stand_ins: StandIns, latency: Dict[str, float], base_dir: str,
+                workdir: str, verbose: bool = False) -> SessionRun:
+    """
+    One scripted conversation through the demo, from the welcome to the last answer
+    """
+    import action_chain
+    demo = session["demo"]
+    if demo not in RUNNERS:
+        raise ValueError(f"Unknown demo {demo!r} in session {session['name']!r}, choose from {', '.join(RUNNERS)}")
+    module = importlib.import_module(demo)
+    run = SessionRun(session["name"], demo)
+    stand_ins.start(session, latency, base_dir)
+
+    session_id = tracing.new_session()
+
+    def collect(span: tracing.Span):
+        if span.attributes.get("session") == session_id and span.name != "session":
+            stage = run.stages.setdefault(span.name, [0, 0.0])
+            stage[0] += 1
+            stage[1] += span.duration_ms
+
+    patches = Patches()
+    patches.set(module, "action_chain", action_chain.ActionChain())  # the chains are module globals
+    if demo == "fill_pdf_document":
+        patches.set(module, "INPUT_PDF", os.path.join(ROOT, module.INPUT_PDF))
+        patches.set(module, "OUTPUT_PDF", os.path.join(workdir, os.path.basename(module.OUTPUT_PDF)))
+    for module_name, settings in {**DEMO_SETTINGS, **session.get("settings", {})}.items():
+        target = importlib.import_module(module_name)
+        for name, value in settings.items():
+            patches.set(target, name, value)
+
+    tracing.add_listener(collect)
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    try:
+        with output, tracing.span("session", demo=demo, scenario=run.name):
+            RUNNERS[demo](module, workdir)
+    except ScenarioExhausted as e:
+        run.error = f"scenario too short: {e}"
+    except Exception as e:
+        run.error = f"{type(e).__name__}: {e}"
+    finally:
+        run.seconds = time.perf_counter() - start
+        tracing.remove_listener(collect)
+        patches.restore()
+        import driver_pool
+        driver_pool.close_all()
+    if run.error is None and stand_ins.utterances:
+        run.error = f"{len(stand_ins.utterances)} scripted answers were never asked for"
+    run.turns = int(run.stages.get("turn", [0])[0])
+    run.utterances = stand_ins.heard
+    run.waited = stand_ins.waited
+    return run
+
+
+# ----------------------------------------------------------------------
+# Baseline
+# ----------------------------------------------------------------------
+def compare(run: SessionRun, baseline: dict, tolerance: float = TOLERANCE, min_delta_ms: float = MIN_DELTA_MS) -> List[str]:
+    """
+    :return: the regressions of the run against its baseline entry
+    """
+    problems = []
+    if run.turns != baseline["turns"]:
+        problems.append(f"{baseline['turns']} -> {run.turns} turns")
+
+    def slower(before_ms: float, after_ms: float) -> bool:
+        return after_ms > before_ms * (1 + tolerance) and after_ms - before_ms >= min_delta_ms
+
+    if slower(baseline["seconds"] * 1000, run.seconds * 1000):
+        problems.append(f"session {baseline['seconds']:.2f}s -> {run.seconds:.2f}s")
+    for name, before in sorted(baseline["stages"].items()):
+        after = run.stages.get(name, [0, 0.0])[1]
+        if slower(before, after):
+            problems.append(f"{name} {before:.0f} ms -> {after:.0f} ms")
+    return problems
+
+
+def format_run(run: SessionRun) -> str:
+    lines = [f"{run.name} ({run.demo}): {run.seconds:.2f}s, {run.turns} turns, {run.utterances} answers, "
+             f"{run.waited:.2f}s injected, {run.seconds - run.waited:.2f}s own"]
+    if run.error:
+        lines.append(f"  ERROR {run.error}")
+    lines.append(f"  {'stage':<22} {'count':>6} {'total s':>9} {'share':>7}")
+    for name, (count, total) in sorted(run.stages.items(), key=lambda item: -item[1][1]):
+        lines.append(f"  {name:<22} {count:>6} {total / 1000:>9.2f} {total / 10 / run.seconds if run.seconds else 0:>6.1f}%")
+    return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+#   MAIN
+# ---------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark full voice sessions of the demos against a baseline.")
+    parser.add_argument("--scenario", default=SCENARIO_PATH)
+    parser.add_argument("--only", action="append", help="run only this session (repeatable)")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per session, the median run is reported")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiply every injected latency, e.g. 0.1")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store these runs as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--min-delta-ms", type=float, default=MIN_DELTA_MS)
+    parser.add_argument("--json", help="also write the runs to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the output of the demos")
+    args = parser.parse_args(argv)
+
+    with open(args.scenario, encoding="utf-8") as f:
+        scenario = json.load(f)
+    sessions = [s for s in scenario["sessions"] if not args.only or s["name"] in args.only]
+    if not sessions:
+        print(f"No sessions to run in {args.scenario}")
+        return 2
+    base_dir = os.path.dirname(os.path.abspath(args.scenario))
+    tracing.configure(sample_rate=0)  # the listener sees every span, nothing is written to data/traces.jsonl
+
+    stand_ins = StandIns(args.time_scale)
+    runs: List[SessionRun] = []
+    with installed(stand_ins), tempfile.TemporaryDirectory(prefix="sessions-") as workdir:
+        for session in sessions:
+            attempts = [run_session(session, stand_ins, scenario.get("latency", {}), base_dir, workdir, args.verbose)
+                        for _ in range(max(1, args.repeat))]
+            attempts.sort(key=lambda run: run.seconds)
+            run = attempts[(len(attempts) - 1) // 2]
+            run.error = run.error or next((attempt.error for attempt in attempts if attempt.error), None)
+            runs.append(run)
+            print(format_run(run))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([run.__dict__ for run in runs], f, indent=2)
+
+    failed = [run.name for run in runs if run.error]
+    if args.save_baseline:
+        if failed:
+            print(f"Not saving a baseline, failed: {', '.join(failed)}")
+            return 1
+        baseline = {"time_scale": args.time_scale, "sessions": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+            if baseline.get("time_scale") != args.time_scale:
+                baseline = {"time_scale": args.time_scale, "sessions": {}}
+        baseline["sessions"].update({run.name: run.as_baseline() for run in runs})
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline of {len(runs)} sessions saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, store one with --save-baseline")
+        return 1 if failed else 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("time_scale") != args.time_scale:
+        print(f"The baseline was recorded with --time-scale {baseline.get('time_scale')}, not {args.time_scale}")
+        return 2
+
+    regressed = False
+    for run in runs:
+        entry = baseline["sessions"].get(run.name)
+        if entry is None:
+            print(f"{run.name}: no baseline")
+            continue
+        problems = compare(run, entry, args.tolerance, args.min_delta_ms)
+        print(f"{run.name}: " + ("REGRESSION " + "; ".join(problems) if problems else "ok"))
+        regressed = regressed or bool(problems)
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+    return 1 if regressed or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+Browser profiles for the Selenium demos: how Chrome is started and what it loads.
+
+A profile bundles the options that decide how heavy a page load is: headless
+or windowed, which requests are blocked (images, fonts, third-party trackers,
+through the Chrome DevTools protocol so blocked requests fail immediately),
+extensions, the window size and the page load strategy. With "eager",
+driver.get returns at DOMContentLoaded instead of waiting for every
+subresource; the demos wait for the elements they need anyway.
+
+navigate() opens a page and records the time until the document became
+interactive, per profile, so profiles can be compared:
+
+    driver = driver_pool.new_chrome(browser_profile.get_profile("light"))
+    browser_profile.navigate(driver, URL)
+    print(browser_profile.timing_report())
+"""
+
+import statistics
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.options import Options
+
+import tracing
+
+# ---------------------------------------------------------------------------
+#   Configurations
+# ---------------------------------------------------------------------------
+
+DEFAULT_PROFILE = "light"
+
+IMAGE_PATTERNS = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico"]
+FONT_PATTERNS = ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"]
+TRACKER_PATTERNS = [
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*siteimprove*", "*piwik*", "*matomo*", "*hotjar*", "*facebook.net*",
+]
+
+NAVIGATION_JS = """
+var entry = performance.getEntriesByType('navigation')[0];
+if (entry) { return [entry.domInteractive, entry.domContentLoadedEventEnd]; }
+var t = performance.timing;
+return [t.domInteractive - t.navigationStart, t.domContentLoadedEventEnd - t.navigationStart];
+"""
+
+
+@dataclass(frozen=True)
+class BrowserProfile:
+    name: str
+    headless: bool = True
+    block_images: bool = True
+    block_fonts: bool = True
+    block_trackers: bool = True
+    disable_extensions: bool = True
+    page_load_strategy: str = "eager"           # "normal", "eager" or "none"
+    window_size: Optional[Tuple[int, int]] = (1280, 1200)  # None maximizes the window
+
+    def blocked_urls(self) -> List[str]:
+        patterns = []
+        if self.block_images:
+            patterns += IMAGE_PATTERNS
+        if self.block_fonts:
+            patterns += FONT_PATTERNS
+        if self.block_trackers:
+            patterns += TRACKER_PATTERNS
+        return patterns
+
+    def options(self) -> Options:
+        opts = Options()
+        if self.headless:
+            opts.add_argument("--headless=new")
+        if self.disable_extensions:
+            opts.add_argument("--disable-extensions")
+            opts.add_argument("--disable-component-extensions-with-background-pages")
+        if self.window_size is not None:
+            opts.add_argument(f"--window-size={self.window_size[0]},{self.window_size[1]}")
+        opts.page_load_strategy = self.page_load_strategy
+        return opts
+
+    def apply(self, driver):
+        """
+        Settings that need a running browser: request blocking and the window size
+        """
+        patterns = self.blocked_urls()
+        if patterns:
+            try:
+                driver.execute_cdp_cmd("Network.enable", {})
+                driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+            except (WebDriverException, AttributeError) as e:
+                print(f"[WARN] Request blocking not available for profile {self.name}: {e}")
+        if self.window_size is None:
+            driver.maximize_window()
+        else:
+            driver.set_window_size(*self.window_size)
+
+
+PROFILES: Dict[str, BrowserProfile] = {
+    # how the demos always ran: a visible window that loads everything
+    "full": BrowserProfile("full", headless=False, block_images=False, block_fonts=False, block_trackers=False,
+                           disable_extensions=False, page_load_strategy="normal", window_size=None),
+    # forms: nothing but the document and its scripts
+    "light": BrowserProfile("light"),
+    # Leaflet maps: tiles stay, an errored tile never gets "leaflet-tile-loaded" and the
+    # map_waits tile count would never drop to zero
+    "map": BrowserProfile("map", block_images=False, window_size=(1920, 1080)),
+}
+
+
+def get_profile(profile=DEFAULT_PROFILE) -> BrowserProfile:
+    """
+    :param profile: a profile or the name of one in PROFILES
+    """
+    if isinstance(profile, BrowserProfile):
+        return profile
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown browser profile {profile!r}, choose from {', '.join(PROFILES)}") from None
+
+
+# ---------------------------------------------------------------------------
+#   Navigation timing
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Navigation:
+    url: str
+    seconds: float                  # driver.get until it returned
+    interactive_ms: Optional[float]  # navigation start until domInteractive, from the page
+    content_loaded_ms: Optional[float]
+
+
+_timings: Dict[str, List[Navigation]] = {}
+_timings_lock = threading.Lock()
+
+
+def navigate(driver, url: str, profile=DEFAULT_PROFILE) -> Navigation:
+    """
+    driver.get with navigation-to-interactive timing recorded under the profile's name
+    :param profile: the profile the driver was started with
+    """
+    name = get_profile(profile).name
+    with tracing.span("browser.navigate", profile=name, url=url) as span:
+        start = time.perf_counter()
+        driver.get(url)
+        seconds = time.perf_counter() - start
+        try:
+            interactive, content_loaded = driver.execute_script(NAVIGATION_JS)
+        except WebDriverException:
+            interactive = content_loaded = None
+        if interactive is not None:
+            span.set(interactive_ms=float(interactive))
+    navigation = Navigation(url, seconds, interactive, content_loaded)
+    with _timings_lock:
+        _timings.setdefault(name, []).append(navigation)
+    interactive_text = f"{interactive:.0f} ms" if interactive is not None else "unknown"
+    print(f"[DEBUG] [{name}] {url} interactive after {interactive_text}, get returned after {seconds:.2f}s")
+    return navigation
+
+
+def timings(profile=None) -> Dict[str, List[Navigation]]:
+    with _timings_lock:
+        if profile is not None:
+            name = get_profile(profile).name
+            return {name: list(_timings.get(name, []))}
+        return {name: list(items) for name, items in _timings.items()}
+
+
+def timing_report() -> str:
+    """
+    Median navigation-to-interactive and driver.get time per profile
+    """
+    lines = []
+    for name, items in sorted(timings().items()):
+        interactive = [n.interactive_ms for n in items if n.interactive_ms is not None]
+        median_interactive = f"{statistics.median(interactive):7.0f} ms" if interactive else "      n/a"
+        median_get = statistics.median(n.seconds for n in items)
+        lines.append(f"{name:<8} {len(items):3d} loads  interactive {median_interactive}  get {median_get:6.2f}s")
+    return "\n".join(lines)
@@ -0,0 +1,296 @@
+"""
+Offline nearest-container search for afval, on an exported snapshot of the
+Amsterdam waste container locations.
+
+The snapshot is a GeoJSON FeatureCollection of points or a CSV file with
+lat/lon columns. The fraction of a container is read from a category id
+(12491 ... 12497, 13698, the ids of kaart.amsterdam.nl) or a fraction name
+("Glas", "Papier", ...). One KD-tree is built per fraction.
+
+A new snapshot can be dropped in place (write it next to the old one and
+rename it over it): get_index notices the change, builds the new index next
+to the running one and swaps it in, queries never wait for a reload.
+
+    index = container_index.get_index()
+    if index is not None and not index.is_stale():
+        nearest = index.nearest(12492, 52.3731, 4.8926)
+"""
+
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+import kdtree
+
+# ---------------------------------------------------------------------------
+#   Configurations
+# ---------------------------------------------------------------------------
+
+SNAPSHOT_PATH = os.path.join("data", "afvalcontainers.geojson")
+MAX_AGE_DAYS = 14           # older snapshots are stale, afval then uses the live map
+RELOAD_CHECK_INTERVAL = 5   # seconds between checks for a new snapshot file
+
+# category ids of kaart.amsterdam.nl
+FRACTIONS = {
+    12491: "residual waste",
+    12492: "glass",
+    12493: "paper",
+    12495: "textile containers",
+    12496: "organic waste",
+    12497: "bread and pastry waste",
+    13698: "textile collection",
+}
+
+# fraction names used in the open data exports
+_FRACTION_NAMES = {
+    "rest": 12491, "restafval": 12491,
+    "glas": 12492,
+    "papier": 12493, "papier en karton": 12493,
+    "textiel": 12495,
+    "gfe": 12496, "gft": 12496, "gfe/t": 12496, "gft/e": 12496,
+    "brood": 12497, "brood en banket": 12497,
+    "textielinzameling": 13698,
+}
+_FRACTION_NAMES.update({name: fraction for fraction, name in FRACTIONS.items()})
+
+_FRACTION_KEYS = ("fraction_id", "category", "category_id", "fraction", "fractie", "fractieOmschrijving")
+_ADDRESS_KEYS = ("address", "adres", "locatie")
+
+
+@dataclass
+class Container:
+    id: str
+    fraction: int
+    lat: float
+    lon: float
+    address: str | None = None
+
+
+@dataclass
+class Nearest:
+    container: Container
+    distance_m: float
+
+
+def fraction_id(value) -> int | None:
+    """
+    Category id for an id or a fraction name, None if it is not a known fraction
+    """
+    if value is None:
+        return None
+    text = str(value).strip().lower()
+    if text.isdigit():
+        return int(text) if int(text) in FRACTIONS else None
+    return _FRACTION_NAMES.get(text)
+
+
+# ----------------------------------------------------------------------
+# Snapshot loading
+# ----------------------------------------------------------------------
+def _from_properties(properties: dict, lat: float, lon: float, default_id: str) -> Container | None:
+    fraction = next((fraction_id(properties[key]) for key in _FRACTION_KEYS
+                     if properties.get(key) is not None), None)
+    if fraction is None:
+        return None
+    address = next((str(properties[key]) for key in _ADDRESS_KEYS if properties.get(key)), None)
+    if address is None and properties.get("straatnaam"):
+        address = f"{properties['straatnaam']} {properties.get('huisnummer') or ''}".strip()
+    return Container(str(properties.get("id") or default_id), fraction, float(lat), float(lon), address)
+
+
+def read_geojson(path: str) -> tuple[list[Container], float | None]:
+    """
+    :return: containers, and the export time if the file has a "generated" member
+    """
+    with open(path, encoding="utf-8") as f:
+        collection = json.load(f)
+    containers = []
+    for i, feature in enumerate(collection.get("features", [])):
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") != "Point":
+            continue
+        lon, lat = geometry["coordinates"][:2]
+        container = _from_properties(feature.get("properties") or {}, lat, lon, str(feature.get("id", i)))
+        if container is not None:
+            containers.append(container)
+    generated = collection.get("generated")
+    if isinstance(generated, str):
+        generated = datetime.fromisoformat(generated).timestamp()
+    return containers, generated
+
+
+def read_csv(path: str) -> tuple[list[Container], None]:
+    containers = []
+    with open(path, encoding="utf-8", newline="") as f:
+        for i, row in enumerate(csv.DictReader(f)):
+            lat = row.get("lat") or row.get("latitude")
+            lon = row.get("lon") or row.get("lng") or row.get("longitude")
+            if not lat or not lon:
+                continue
+            container = _from_properties(row, lat, lon, str(i))
+            if container is not None:
+                containers.append(container)
+    return containers, None
+
+
+# ---------------------------------------------------------------------------
+#   INDEX
+# ---------------------------------------------------------------------------
+
+class FractionIndex:
+    """Containers of one fraction: coordinates in arrays, one KD-tree."""
+
+    def __init__(self, containers: List[Container]):
+        self.ids = [c.id for c in containers]
+        self.addresses = [c.address for c in containers]
+        self.lat = np.array([c.lat for c in containers])
+        self.lon = np.array([c.lon for c in containers])
+        self.tree = kdtree.KDTree(kdtree.project(self.lat, self.lon))
+
+    def container(self, i: int, fraction: int) -> Container:
+        return Container(self.ids[i], fraction, float(self.lat[i]), float(self.lon[i]), self.addresses[i])
+
+
+class ContainerIndex:
+    def __init__(self, containers: Iterable[Container], created: float | None = None, source: str | None = None):
+        """
+        :param containers: the snapshot
+        :param created: export time of the snapshot (epoch seconds), defaults to now
+        :param source: file the snapshot was read from
+        """
+        by_fraction: Dict[int, List[Container]] = {}
+        for container in containers:
+            by_fraction.setdefault(container.fraction, []).append(container)
+        self._fractions = {fraction: FractionIndex(items) for fraction, items in by_fraction.items()}
+        self.created = created if created is not None else time.time()
+        self.source = source
+
+    @classmethod
+    def from_file(cls, path: str) -> "ContainerIndex":
+        if path.lower().endswith(".csv"):
+            containers, generated = read_csv(path)
+        else:
+            containers, generated = read_geojson(path)
+        return cls(containers, created=generated or os.path.getmtime(path), source=path)
+
+    @property
+    def fractions(self) -> list[int]:
+        return sorted(self._fractions)
+
+    def __len__(self):
+        return sum(len(index.ids) for index in self._fractions.values())
+
+    def fraction_index(self, fraction: int) -> Optional[FractionIndex]:
+        return self._fractions.get(fraction)
+
+    def age_days(self) -> float:
+        return (time.time() - self.created) / 86400
+
+    def is_stale(self, max_age_days: float = MAX_AGE_DAYS) -> bool:
+        return self.age_days() > max_age_days
+
+    def nearest(self, fraction: int, lat: float, lon: float, k: int = 1) -> list[Nearest]:
+        """
+        The k containers of a fraction nearest to a point, nearest first
+        :param fraction: category id, see FRACTIONS
+        """
+        index = self._fractions.get(fraction)
+        if index is None:
+            return []
+        distances, indices = index.tree.query(kdtree.project(lat, lon), k)
+        return [Nearest(index.container(int(i), fraction), float(d)) for d, i in zip(distances, indices)]
+
+    def query_radius(self, fraction: int, lat: float, lon: float, radius_m: float) -> list[Nearest]:
+        """
+        All containers of a fraction within radius_m metres of a point, nearest first
+        """
+        index = self._fractions.get(fraction)
+        if index is None:
+            return []
+        distances, indices = index.tree.query_radius(kdtree.project(lat, lon), radius_m)
+        return [Nearest(index.container(int(i), fraction), float(d)) for d, i in zip(distances, indices)]
+
+
+# ---------------------------------------------------------------------------
+#   Shared index with hot reload
+# ---------------------------------------------------------------------------
+
+_index: Optional[ContainerIndex] = None
+_index_mtime: float | None = None
+_last_check = 0.0
+_reload_lock = threading.Lock()
+
+
+def refresh(path: str = SNAPSHOT_PATH) -> Optional[ContainerIndex]:
+    """
+    Build an index from the snapshot and swap it in. Queries keep using the
+    old index until the new one is complete; a broken snapshot keeps the old one.
+    """
+    global _index, _index_mtime
+    with _reload_lock:
+        try:
+            mtime = os.path.getmtime(path)
+            index = ContainerIndex.from_file(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[WARN] Could not load container snapshot {path}: {e}")
+            return _index
+        _index, _index_mtime = index, mtime
+    print(f"[DEBUG] Loaded {len(index)} containers from {path}, {index.age_days():.1f} days old")
+    return index
+
+
+def get_index(path: str = SNAPSHOT_PATH) -> Optional[ContainerIndex]:
+    """
+    The current index, loaded on first use and reloaded when the snapshot file changes
+    :return: None if there is no snapshot
+    """
+    global _last_check
+    now = time.monotonic()
+    if _index is not None and _index.source == path and now - _last_check < RELOAD_CHECK_INTERVAL:
+        return _index
+    _last_check = now
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return _index if _index is not None and _index.source == path else None
+    if _index is None or _index.source != path or mtime != _index_mtime:
+        return refresh(path)
+    return _index
+
+
+# ---------------------------------------------------------------------------
+#   MAIN
+# ---------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find the nearest waste containers in a snapshot.")
+    parser.add_argument("lat", type=float)
+    parser.add_argument("lon", type=float)
+    parser.add_argument("--fraction", default="12491", help="category id or fraction name")
+    parser.add_argument("--snapshot", default=SNAPSHOT_PATH, help="GeoJSON or CSV export")
+    parser.add_argument("-k", type=int, default=3, help="number of containers")
+    args = parser.parse_args(argv)
+
+    index = ContainerIndex.from_file(args.snapshot)
+    fraction = fraction_id(args.fraction)
+    if fraction is None:
+        parser.error(f"Unknown fraction {args.fraction!r}")
+    start = time.perf_counter()
+    results = index.nearest(fraction, args.lat, args.lon, args.k)
+    elapsed = time.perf_counter() - start
+    for result in results:
+        c = result.container
+        print(f"{result.distance_m:7.0f} m  {c.address or f'{c.lat:.5f}, {c.lon:.5f}'}  ({c.id})")
+    print(f"[DEBUG] {len(index)} containers, query took {elapsed * 1e6:.0f} µs")
+
+
+if __name__ == "__main__":
+    main()
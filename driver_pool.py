@@ -0,0 +1,274 @@
+"""
+A pool of warm Chrome instances shared by the browser demos.
+
+Starting Chrome costs seconds per answer. The pool keeps started browsers
+around, resets them between borrowers (cookies, storage, extra windows, a blank
+page) and replaces a browser when it fails its health check or has been used
+max_uses times.
+
+Every pool starts its browsers with one browser_profile.BrowserProfile.
+
+    with driver_pool.get_pool("light").borrow() as driver:
+        browser_profile.navigate(driver, URL, "light")
+"""
+
+import atexit
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+
+import browser_profile
+import tracing
+
+# Fix for macOS
+if sys.platform == 'darwin':
+    from webdriver_manager.chrome import ChromeDriverManager
+
+# ---------------------------------------------------------------------------
+#   Configurations
+# ---------------------------------------------------------------------------
+
+POOL_SIZE = 1           # browsers kept warm per pool
+MAX_USES = 20           # a browser is replaced after this many borrows
+BORROW_TIMEOUT = 60     # seconds to wait for a free browser
+BLANK_PAGE = "about:blank"
+
+
+def new_chrome(profile=browser_profile.DEFAULT_PROFILE) -> webdriver.Chrome:
+    """
+    Start a Chrome with the options of a browser profile
+    :param profile: a BrowserProfile or the name of one
+    """
+    profile = browser_profile.get_profile(profile)
+    opts = profile.options()
+
+    # macOS fix
+    if sys.platform == 'darwin':
+        service = Service(ChromeDriverManager().install())
+        driver = webdriver.Chrome(service=service, options=opts)
+    else:
+        driver = webdriver.Chrome(options=opts)
+    profile.apply(driver)
+    return driver
+
+
+@dataclass
+class _PooledDriver:
+    driver: webdriver.Chrome
+    uses: int = 0
+
+
+# ---------------------------------------------------------------------------
+#   POOL
+# ---------------------------------------------------------------------------
+
+class DriverPool:
+    """
+    Thread-safe pool of at most `size` browsers, started on first demand or by warm().
+    """
+
+    def __init__(self, size: int = POOL_SIZE, profile=browser_profile.DEFAULT_PROFILE, max_uses: int = MAX_USES,
+                 factory: Optional[Callable[[], webdriver.Chrome]] = None):
+        """
+        :param size: maximum number of browsers alive at the same time
+        :param profile: browser profile (or its name) the browsers are started with
+        :param max_uses: borrows before a browser is quit and replaced, 0 for no limit
+        :param factory: starts a browser, defaults to new_chrome(profile)
+        """
+        self.size = size
+        self.profile = browser_profile.get_profile(profile)
+        self.max_uses = max_uses
+        self._factory = factory or (lambda: new_chrome(self.profile))
+        self._idle = queue.LifoQueue() # most recently used first, keeps the warmest browser busy
+        self._lock = threading.Lock()
+        self._alive = 0
+        self._closed = False
+
+    # ------------------------------------------------------------------
+    # Life cycle of a browser
+    # ------------------------------------------------------------------
+    def _start(self) -> _PooledDriver:
+        start = time.perf_counter()
+        try:
+            pooled = _PooledDriver(self._factory())
+        except Exception:
+            with self._lock:
+                self._alive -= 1
+            raise
+        print(f"[DEBUG] Started browser in {time.perf_counter() - start:.2f}s")
+        return pooled
+
+    def _discard(self, pooled: _PooledDriver):
+        with self._lock:
+            self._alive -= 1
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            print(f"[WARN] Quitting browser failed: {e}")
+
+    @staticmethod
+    def is_healthy(driver: webdriver.Chrome) -> bool:
+        """
+        Health check: the browser answers a script and still has a window
+        """
+        try:
+            return driver.execute_script("return 1") == 1 and bool(driver.window_handles)
+        except Exception:
+            return False
+
+    @staticmethod
+    def _visited_origins(driver: webdriver.Chrome) -> set[str]:
+        """
+        The http(s) origins in the navigation history of the current window
+        """
+        origins = set()
+        for entry in driver.execute_cdp_cmd("Page.getNavigationHistory", {}).get("entries", []):
+            parts = urlsplit(entry.get("url", ""))
+            if parts.scheme in ("http", "https"):
+                origins.add(f"{parts.scheme}://{parts.netloc}")
+        return origins
+
+    @classmethod
+    def reset(cls, driver: webdriver.Chrome):
+        """
+        Remove what a previous borrower left behind. Cookies and storage are cleared over
+        CDP for every site the borrower visited, not only for the page that is open.
+        """
+        handles = driver.window_handles
+        origins = set()
+        for handle in reversed(handles):
+            driver.switch_to.window(handle)
+            origins |= cls._visited_origins(driver)
+            if handle != handles[0]:
+                driver.close()
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        for origin in origins:
+            driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+        driver.get(BLANK_PAGE)
+        driver.execute_cdp_cmd("Page.resetNavigationHistory", {})
+
+    # ------------------------------------------------------------------
+    # Borrowing
+    # ------------------------------------------------------------------
+    def warm(self, count: Optional[int] = None, background: bool = True):
+        """
+        Start browsers ahead of the first borrow
+        :param count: browsers to start, defaults to the pool size
+        :param background: start them in a thread and return immediately
+        """
+        def start_all():
+            for _ in range(count or self.size):
+                with self._lock:
+                    if self._closed or self._alive >= self.size:
+                        return
+                    self._alive += 1
+                try:
+                    self._idle.put(self._start())
+                except Exception as e:
+                    print(f"[WARN] Warming up browser failed: {e}")
+                    return
+
+        if background:
+            threading.Thread(target=start_all, name="driver-pool-warm", daemon=True).start()
+        else:
+            start_all()
+
+    def acquire(self, timeout: float = BORROW_TIMEOUT) -> _PooledDriver:
+        deadline = time.monotonic() + timeout
+        while True:
+            if self._closed:
+                raise RuntimeError("Driver pool is closed")
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_start = self._alive < self.size
+                    if can_start:
+                        self._alive += 1
+                if can_start:
+                    return self._start()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No browser available within {timeout}s")
+                try:
+                    pooled = self._idle.get(timeout=min(remaining, 1.0))
+                except queue.Empty:
+                    continue # re-check whether a slot was freed by a discard
+
+            if self.is_healthy(pooled.driver):
+                return pooled
+            print("[WARN] Browser failed its health check, replacing it")
+            self._discard(pooled)
+
+    def release(self, pooled: _PooledDriver):
+        pooled.uses += 1
+        if self._closed or (self.max_uses and pooled.uses >= self.max_uses):
+            self._discard(pooled)
+            return
+        try:
+            self.reset(pooled.driver)
+        except Exception as e:
+            print(f"[WARN] Resetting browser failed, replacing it: {e}")
+            self._discard(pooled)
+            return
+        self._idle.put(pooled)
+
+    @contextmanager
+    def borrow(self, timeout: float = BORROW_TIMEOUT):
+        """
+        Borrow a clean browser, it goes back to the pool when the block ends
+        """
+        with tracing.span("browser.acquire", profile=self.profile.name):
+            pooled = self.acquire(timeout)
+        try:
+            yield pooled.driver
+        finally:
+            self.release(pooled)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+# ---------------------------------------------------------------------------
+#   Shared pools
+# ---------------------------------------------------------------------------
+
+_pools: Dict[str, DriverPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(profile=browser_profile.DEFAULT_PROFILE, size: Optional[int] = None) -> DriverPool:
+    """
+    The process-wide pool for a browser profile, created on first use
+    :param size: grow the pool to at least this many browsers
+    """
+    profile = browser_profile.get_profile(profile)
+    with _pools_lock:
+        pool = _pools.get(profile.name)
+        if pool is None:
+            pool = _pools[profile.name] = DriverPool(size=max(size or 0, POOL_SIZE), profile=profile)
+        elif size is not None and size > pool.size:
+            with pool._lock:
+                pool.size = size
+        return pool
+
+
+@atexit.register
+def close_all():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
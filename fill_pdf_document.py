@@ -1,7 +1,8 @@
-from pdfrw import PdfReader, PdfWriter, PdfName, PdfString
 from datetime import datetime
 import util
 import action_chain
+import pdf_form
+import voice_util
 from voice_util import say
 
 # ---------------------------------------------------------------------------
@@ -10,6 +11,7 @@ from voice_util import say
 
 INPUT_PDF  = "example.pdf"
 OUTPUT_PDF = "filled_example.pdf"
+INCREMENTAL_OUTPUT = True # append the filled fields to the template instead of rewriting it
 
 action_chain = action_chain.ActionChain()
 
@@ -103,63 +105,15 @@ def collect_pdf_user_data() -> dict[str, any]:
     return data
 
 
-# ----------------------------------------------------------------------
-# Helper: tick checkbox by appearance name
-# ----------------------------------------------------------------------
-def _set_checkbox(annot, want_label):
-    ap = annot.get("/AP")
-    if not ap or "/N" not in ap:
-        return False
-
-    normal_states = ap["/N"].keys()
-    label = PdfName(want_label)
-    if label in normal_states:
-        annot.AS = label       
-        annot.V = label        
-        print(f"Ticked checkbox with label: {label}")
-        return True
-    return False
-
-
 # ---------------------------------------------------------------------------
 #   MAIN PDF FILLER
 # ---------------------------------------------------------------------------
 
 def fill_pdf(data: dict[str, any]):
     say("Thank you! I've filled out your pdf document. The file is titled filled_example.pdf")
-    pdf = PdfReader(INPUT_PDF)
-
-    for page in pdf.pages:
-        annots = page.Annots
-        if not annots:
-            continue
-
-        for annot in annots:
-            if annot.Subtype != PdfName.Widget:
-                continue
-
-            # 1) text fields (have a /T key)
-            if annot.T:
-                key = annot.T.to_unicode().strip("()")
-                if key in data:
-                    value = str(data[key])
-                    print(f"Setting field '{key}' to '{value}'")
-                    annot.V = PdfString.encode(value)
-                    annot.AP = None
-
-            # 2) checkbox fields – matched by appearance label
-            else:
-                if data["TICK_2A_JA"]:
-                    _set_checkbox(annot, "Ja. Vul de datum in vanaf wanneer.")
-                else:
-                    _set_checkbox(annot, "Nee. Vul de datum in vanaf wanneer niet of niet meer, en ga daarna verder met vraag 3.")
-
-                if data["TICK_2B_JA"]:
-                    _set_checkbox(annot, "Ja")
-                else:
-                    _set_checkbox(annot, "Nee")
-
-    PdfWriter().write(OUTPUT_PDF, pdf)
+    template = pdf_form.FormTemplate(INPUT_PDF)
+    template.fill(data, verbose=True)
+    template.save(OUTPUT_PDF, incremental=INCREMENTAL_OUTPUT)
     return f"The form has been filled and saved as '{OUTPUT_PDF}'. Please remember to write the missing date next to the checkbox for question 2a on page two and sign the form."
 
 # ---------------------------------------------------------------------------
@@ -168,6 +122,7 @@ def fill_pdf(data: dict[str, any]):
 
 if __name__ == "__main__":
     ########## Task 1: Filling out pdf form ###########
+    voice_util.init() # health check and spaCy load while the welcome message plays
     user_data = collect_pdf_user_data()
     say("Thanks. I'm now filling in the PDF document.")
     result = fill_pdf(user_data)
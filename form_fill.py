@@ -0,0 +1,137 @@
+"""
+Fill a web form in one execute_script call instead of one WebDriver round-trip per field.
+
+A form is described as a plan: an ordered list of FieldStep (type into an
+input, choose an option, tick a checkbox, click a label or button). FILL_JS
+applies the steps in order inside the page and fires the events a user would
+(input, change, blur, or a real click for labels), so the page's own handlers
+reveal dependent questions before the next step runs.
+
+The script stops at the first step it cannot apply (element missing, hidden or
+disabled, option not found) and reports it. That step is handed to a per-field
+fallback in Python, which may wait for the element, and the script continues
+with the rest. A form without surprises is filled in a single round-trip.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from selenium.common.exceptions import WebDriverException
+
+TEXT, SELECT, CHECK, CLICK_LABEL, CLICK = "text", "select", "check", "label", "click"
+
+FILL_JS = r"""
+var steps = arguments[0], start = arguments[1];
+function visible(el) {
+  return !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+}
+function fire(el, type) { el.dispatchEvent(new Event(type, {bubbles: true})); }
+function find(step) {
+  if (step.kind === 'label') { return document.querySelector('label[for="' + step.target + '"]'); }
+  return document.getElementById(step.target);
+}
+function apply(step) {
+  var el = find(step);
+  if (!el) { return 'not found'; }
+  if (el.disabled) { return 'disabled'; }
+  switch (step.kind) {
+    case 'text':
+      if (!visible(el)) { return 'hidden'; }
+      el.focus();
+      var setter = Object.getOwnPropertyDescriptor(Object.getPrototypeOf(el), 'value');
+      if (setter && setter.set) { setter.set.call(el, step.value); } else { el.value = step.value; }
+      fire(el, 'input'); fire(el, 'change'); el.blur(); fire(el, 'blur');
+      return null;
+    case 'select':
+      var wanted = String(step.value), option = null;
+      for (var i = 0; i < el.options.length && !option; i++) {
+        if (el.options[i].value === wanted) { option = el.options[i]; }
+      }
+      for (var j = 0; j < el.options.length && !option; j++) {
+        if (el.options[j].text.trim() === wanted) { option = el.options[j]; }
+      }
+      if (!option) { return 'no option ' + wanted; }
+      if (!option.selected) { option.selected = true; fire(el, 'input'); fire(el, 'change'); }
+      return null;
+    case 'check':
+      if (el.checked !== step.value) { el.click(); }
+      return el.checked === step.value ? null : 'did not toggle';
+    case 'label':
+    case 'click':
+      if (!visible(el)) { return 'hidden'; }
+      el.click();
+      return null;
+  }
+  return 'unknown step ' + step.kind;
+}
+for (var k = start; k < steps.length; k++) {
+  var error;
+  try { error = apply(steps[k]); } catch (e) { error = String(e); }
+  if (error) { return [k, error]; }
+}
+return null;
+"""
+
+
+@dataclass
+class FieldStep:
+    kind: str          # TEXT, SELECT, CHECK, CLICK_LABEL or CLICK
+    target: str        # element id; for CLICK_LABEL the id the label is "for"
+    value: object = None
+    description: str = ""  # used in warnings, e.g. "Partner selection"
+
+    def as_js(self) -> dict:
+        return {"kind": self.kind, "target": self.target, "value": self.value}
+
+
+@dataclass
+class FillReport:
+    steps: int = 0
+    scripts: int = 0       # FILL_JS calls
+    fallbacks: int = 0     # steps applied field by field
+    failed: int = 0
+    seconds: float = 0.0
+
+    def __str__(self):
+        return (f"Filled {self.steps - self.failed}/{self.steps} fields with {self.scripts} script calls "
+                f"and {self.fallbacks} field-by-field steps in {self.seconds:.2f}s")
+
+
+def apply_plan(driver, steps: List[FieldStep], fallback: Callable[[FieldStep], None],
+               bulk: bool = True) -> FillReport:
+    """
+    Apply the steps in order
+    :param fallback: applies one step with regular WebDriver calls, raises on failure
+    :param bulk: False applies every step with the fallback, one at a time
+    """
+    report = FillReport(steps=len(steps))
+    start = time.perf_counter()
+    payload = [step.as_js() for step in steps]
+    position = 0
+    while position < len(steps):
+        failure: Optional[list] = None
+        if bulk:
+            report.scripts += 1
+            try:
+                failure = driver.execute_script(FILL_JS, payload, position)
+            except WebDriverException as e:
+                print(f"[WARN] Bulk form fill failed, continuing field by field: {e}")
+                bulk = False
+                failure = [position, "script failed"]
+            if failure is None:
+                break
+            position = int(failure[0])
+            print(f"[DEBUG] Bulk fill stopped at {steps[position].description or steps[position].target}: "
+                  f"{failure[1]}")
+
+        step = steps[position]
+        report.fallbacks += 1
+        try:
+            fallback(step)
+        except Exception as e:
+            report.failed += 1
+            print(f"[WARN] {step.description or step.target} failed: {e}")
+        position += 1
+    report.seconds = time.perf_counter() - start
+    return report
@@ -0,0 +1,385 @@
+"""
+Local huurtoeslag (rent benefit) rules for 2021-2025, beside the Selenium path of toeslagen.
+
+The yearly parameters are kept in one table per year (RULES), versioned with
+RULES_VERSION. Two kinds of parameters are in there:
+
+- published limits, used for hard eligibility checks: the savings limit
+  (single and with a partner), the maximum rent, the rent limit for applicants
+  under 23 (kwaliteitskortingsgrens), the two capping limits
+  (aftoppingsgrenzen) and the AOW age;
+- an estimate of the basic rent (basishuur) the applicant pays themselves.
+  The official basic rent is a quadratic function of income with factors per
+  household type, which are NOT in this table; a floor and a linear slope
+  stand in for it (fields marked APPROXIMATE).
+
+So assess() is exact when it says "not eligible" because of savings, rent,
+age or a room that does not qualify, and only an estimate otherwise. toeslagen
+uses it to answer the clear refusals without a browser. The estimate's error
+is measured against the live calculator, or a recording of it, with:
+
+    python huurtoeslag_rules.py record --fixture data/huurtoeslag_fixture.jsonl
+    python huurtoeslag_rules.py verify --fixture data/huurtoeslag_fixture.jsonl
+
+The committed fixture is a seed without a browser recording: only the sample
+profiles that a published limit refuses, marked "recorded": false. verify
+fails on it with "Nothing verified" until record has replaced it with live
+answers, amounts included.
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+# ---------------------------------------------------------------------------
+#   Configurations
+# ---------------------------------------------------------------------------
+
+RULES_VERSION = "2025.1"
+FIXTURE_PATH = "data/huurtoeslag_fixture.jsonl"
+AMOUNT_TOLERANCE = 15.0     # euro per month an estimate may differ in verify
+YOUNG_AGE = 23              # below this age only rent up to max_rent_young counts
+MIN_AGE = 18
+
+
+@dataclass(frozen=True)
+class YearRules:
+    year: int
+    savings_limit: float            # single applicant
+    savings_limit_partner: float
+    max_rent: float                 # maximale huurgrens, per month
+    max_rent_young: float           # kwaliteitskortingsgrens
+    cap_small: float                # aftoppingsgrens, households of 1 or 2
+    cap_large: float                # aftoppingsgrens, households of 3 or more
+    aow_age: tuple[int, int]        # years, months
+    # APPROXIMATE: stand-ins for the quadratic basic rent formula
+    basic_rent_floor: float         # minimum basic rent per month
+    income_floor: float             # yearly income up to which the floor applies
+    basic_rent_slope: float         # extra basic rent per month per euro yearly income above income_floor
+
+
+RULES: Dict[int, YearRules] = {
+    2021: YearRules(2021, 31340, 62680, 752.33, 442.46, 633.25, 678.66, (66, 4), 237.62, 17000, 0.0205),
+    2022: YearRules(2022, 31747, 63494, 763.47, 442.46, 633.25, 678.66, (66, 7), 237.62, 17300, 0.0205),
+    2023: YearRules(2023, 33748, 67496, 808.06, 452.20, 647.19, 693.60, (66, 10), 232.00, 18500, 0.0210),
+    2024: YearRules(2024, 36952, 73904, 879.66, 477.20, 682.96, 731.93, (67, 0), 205.00, 19500, 0.0215),
+    2025: YearRules(2025, 37395, 74790, 900.07, 489.43, 697.07, 747.21, (67, 0), 210.00, 20000, 0.0215),
+}
+
+# share of the rent above the basic rent that is paid, per band
+SHARE_BELOW_YOUNG_LIMIT = 1.0
+SHARE_TO_CAP = 0.65
+SHARE_ABOVE_CAP = 0.40          # only single-person and AOW households
+
+
+@dataclass
+class Assessment:
+    year: int
+    eligible: bool
+    exact: bool                     # True when decided by a published limit, not by the estimate
+    monthly: float = 0.0            # estimated benefit per month
+    reasons: List[str] = field(default_factory=list)
+    rules_version: str = RULES_VERSION
+
+    @property
+    def yearly(self) -> float:
+        return round(self.monthly * 12)
+
+    def answer(self) -> str:
+        """The spoken answer, in the words of the live calculator's result"""
+        if not self.eligible:
+            return f"You are not entitled to rent benefit in {self.year}: {'; '.join(self.reasons)}."
+        return (f"You may be entitled to about € {self.yearly:,.0f} rent benefit in {self.year} "
+                f"(€ {self.monthly:,.0f} per month). This is an estimate, the official calculation may differ.")
+
+
+# ----------------------------------------------------------------------
+# Input
+# ----------------------------------------------------------------------
+def _int(value, default: int = 0) -> int:
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return default
+
+
+def age_on(day: int, month: int, year: int, reference: date) -> tuple[int, int]:
+    """
+    Age in whole years and months on the reference date
+    """
+    months = (reference.year - year) * 12 + reference.month - month - (reference.day < day)
+    return months // 12, months % 12
+
+
+def household_size(data: Dict[str, Any]) -> int:
+    size = 1 + bool(data.get("has_partner"))
+    if data.get("has_children"):
+        size += _int(data.get("num_children"), len(data.get("children_birthdays") or []))
+    if data.get("has_housemates"):
+        size += _int(data.get("num_housemates"), len(data.get("housemate_birthdays") or []))
+    return size
+
+
+def household_income(data: Dict[str, Any]) -> float:
+    income = float(data.get("annual_income") or 0)
+    if data.get("has_partner") and data.get("same_address", True):
+        income += float(data.get("partner_income") or 0)
+    for housemate_income in (data.get("housemate_incomes") or []) if data.get("has_housemates") else []:
+        income += float(housemate_income or 0)
+    return income
+
+
+def service_costs(data: Dict[str, Any]) -> float:
+    """Service costs that count as rent (per month)"""
+    if not data.get("pays_service_costs"):
+        return 0.0
+    return sum(min(float(data.get(f"service_{key}") or 0), 12.0)
+               for key in ("energy", "cleaning", "janitor", "recreation"))
+
+
+# ---------------------------------------------------------------------------
+#   RULES
+# ---------------------------------------------------------------------------
+
+def assess(data: Dict[str, Any]) -> Assessment:
+    """
+    Eligibility and estimate for a toeslagen answer set (see toeslagen.EXAMPLE_DATA)
+    :raises KeyError: for a year without rules
+    """
+    year = _int(data.get("year"))
+    rules = RULES[year]
+    reference = date(year, 1, 1)
+    birthday = (_int(data.get("birth_day"), 1), _int(data.get("birth_month"), 1), _int(data.get("birth_year"), 1990))
+    age, age_months = age_on(*birthday, reference)
+    partner = bool(data.get("has_partner"))
+    size = household_size(data)
+    rent = float(data.get("basic_rent") or 0) + service_costs(data)
+    reasons = []
+
+    # Hard limits, published per year
+    savings = data.get("savings")
+    limit = rules.savings_limit_partner if partner else rules.savings_limit
+    if savings is not None and float(savings) > limit:
+        reasons.append(f"savings above € {limit:,.0f}")
+    elif savings is None and data.get("high_savings"):
+        reasons.append("savings above the limit")
+    # the benefit starts the month after the 18th birthday: only refuse for someone who
+    # is still younger on the last day of the year, the calculator decides the others
+    if age_on(*birthday, date(year, 12, 31))[0] < MIN_AGE:
+        reasons.append(f"younger than {MIN_AGE} all of {year}")
+    if age >= YOUNG_AGE and rent > rules.max_rent and not data.get("disability_adjusted_home"):
+        reasons.append(f"rent above the maximum of € {rules.max_rent:.2f}")
+    if data.get("lives_in_room") and not data.get("room_eligible_for_rent_allowance"):
+        reasons.append("a room without its own front door")
+    if reasons:
+        return Assessment(year, False, True, reasons=reasons)
+
+    # Estimate
+    income = household_income(data)
+    basic_rent = rules.basic_rent_floor + rules.basic_rent_slope * max(0.0, income - rules.income_floor)
+    retired = (age, age_months) >= rules.aow_age
+    cap = rules.cap_small if size <= 2 else rules.cap_large
+    if age < YOUNG_AGE:
+        rent = min(rent, rules.max_rent_young)
+    else:
+        rent = min(rent, rules.max_rent)
+
+    low = min(rent, rules.max_rent_young)
+    monthly = max(0.0, low - basic_rent) * SHARE_BELOW_YOUNG_LIMIT
+    start = max(basic_rent, rules.max_rent_young)
+    monthly += max(0.0, min(rent, cap) - start) * SHARE_TO_CAP
+    if size == 1 or retired:
+        monthly += max(0.0, rent - max(cap, basic_rent)) * SHARE_ABOVE_CAP
+    if monthly < 1.0:
+        return Assessment(year, False, False, reasons=["income too high for the rent"])
+    return Assessment(year, True, False, monthly=round(monthly, 2))
+
+
+# ---------------------------------------------------------------------------
+#   Verification
+# ---------------------------------------------------------------------------
+
+_AMOUNT = re.compile(r"€\s?(\d{1,3}(?:[.,]\d{3})*|\d+)")
+_REFUSAL = re.compile(r"\b(not entitled|no right|geen recht|geen huurtoeslag|no rent benefit)\b", re.IGNORECASE)
+
+
+def parse_live_answer(text: str) -> Optional[tuple[bool, float]]:
+    """
+    (eligible, euro per month) from a result text of the live calculator
+    :return: None if the text cannot be read
+    """
+    if not text:
+        return None
+    if _REFUSAL.search(text):
+        return False, 0.0
+    match = _AMOUNT.search(text)
+    if match is None:
+        return None
+    amount = float(re.sub(r"[.,]", "", match.group(1)))
+    per_month = re.match(r"\s*(per|/|a|each)\s*(maand|month)", text[match.end():], re.IGNORECASE) is not None
+    return True, amount if per_month else amount / 12
+
+
+def sample_profiles(base: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Answer sets around the base: every year, a range of rents and incomes, high savings, a partner, a young applicant
+    """
+    profiles = []
+    for year in sorted(RULES):
+        for rent in (400, 550, 700, 850, 950):
+            for income in (12000, 22000, 32000):
+                profiles.append({**base, "year": year, "basic_rent": rent, "monthly_rent": rent,
+                                 "annual_income": income})
+        profiles.append({**base, "year": year, "high_savings": True})
+        profiles.append({**base, "year": year, "birth_year": str(year - 20), "basic_rent": 500})
+        profiles.append({**base, "year": year, "has_partner": True, "same_address": True, "partner_income": 10000,
+                         "partner_birth_day": "1", "partner_birth_month": "1", "partner_birth_year": "1990"})
+    return profiles
+
+
+@dataclass
+class VerifyReport:
+    total: int = 0
+    eligibility_mismatches: int = 0
+    amount_mismatches: int = 0
+    unreadable: int = 0
+    unrecorded: int = 0             # records of the seed fixture, not answered by the live calculator
+    max_error: float = 0.0
+    mean_assess_us: float = 0.0
+    failures: List[str] = field(default_factory=list)
+
+    def __str__(self):
+        lines = [f"{self.total} profiles, rules {RULES_VERSION}: {self.eligibility_mismatches} eligibility and "
+                 f"{self.amount_mismatches} amount mismatches (> € {AMOUNT_TOLERANCE:.0f}/month), "
+                 f"{self.unreadable} unreadable answers, largest error € {self.max_error:.0f}/month, "
+                 f"assess takes {self.mean_assess_us:.1f} µs"]
+        if self.unrecorded:
+            lines.append(f"{self.unrecorded} profiles were not recorded live, record a fixture to check the amounts")
+        return "\n".join(lines + self.failures)
+
+
+def verify(records: List[Dict[str, Any]]) -> VerifyReport:
+    """
+    Compare assess with recorded live answers
+    :param records: {"data": answer set, "answer": live result text}
+    """
+    report = VerifyReport(total=len(records))
+    elapsed = 0.0
+    for record in records:
+        start = time.perf_counter()
+        local = assess(record["data"])
+        elapsed += time.perf_counter() - start
+        report.unrecorded += record.get("recorded") is False
+        live = parse_live_answer(record.get("answer") or "")
+        label = f"{record['data'].get('year')} rent {record['data'].get('basic_rent')} " \
+                f"income {record['data'].get('annual_income')}"
+        if live is None:
+            report.unreadable += 1
+            continue
+        eligible, monthly = live
+        if eligible != local.eligible:
+            report.eligibility_mismatches += 1
+            report.failures.append(f"  {label}: live {'eligible' if eligible else 'not eligible'}, "
+                                   f"local {'eligible' if local.eligible else 'not eligible'} {local.reasons}")
+            continue
+        error = abs(monthly - local.monthly)
+        report.max_error = max(report.max_error, error)
+        if error > AMOUNT_TOLERANCE:
+            report.amount_mismatches += 1
+            report.failures.append(f"  {label}: live € {monthly:.0f}, local € {local.monthly:.0f} per month")
+    report.mean_assess_us = elapsed / max(1, len(records)) * 1e6
+    return report
+
+
+def live_answers(profiles: List[Dict[str, Any]]):
+    """
+    Answer the profiles with the live calculator, yields (answer set, result text)
+    toeslagen would answer from these rules or its result cache, so both are off while this runs
+    """
+    import toeslagen  # needs a browser and the speech stack, only for recording
+
+    saved = toeslagen.USE_LOCAL_RULES, toeslagen.USE_RESULT_CACHE
+    toeslagen.USE_LOCAL_RULES = toeslagen.USE_RESULT_CACHE = False
+    try:
+        for data in profiles:
+            yield data, toeslagen.run_calculation(dict(data))
+    finally:
+        toeslagen.USE_LOCAL_RULES, toeslagen.USE_RESULT_CACHE = saved
+
+
+def record_live(profiles: List[Dict[str, Any]], path: str):
+    """
+    Run the profiles through the live calculator and store the answers as a fixture
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        for data, answer in live_answers(profiles):
+            f.write(json.dumps({"data": data, "answer": answer}, ensure_ascii=False) + "\n")
+            print(f"[DEBUG] {data['year']} rent {data['basic_rent']}: {answer}")
+
+
+def read_fixture(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# ---------------------------------------------------------------------------
+#   MAIN
+# ---------------------------------------------------------------------------
+
+def _base_profile() -> Dict[str, Any]:
+    # toeslagen.EXAMPLE_DATA, without importing the speech stack toeslagen needs
+    return {"year": 2024, "birth_day": "12", "birth_month": "03", "birth_year": "1990", "country": "Nederland",
+            "basic_rent": 720, "monthly_rent": 720, "high_savings": False, "has_partner": False,
+            "annual_income": 16000, "has_children": False, "has_housemates": False, "lives_in_room": False,
+            "lives_in_group_housing": False, "disability_adjusted_home": False, "pays_service_costs": False}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local huurtoeslag rules: assess, record and verify.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check = sub.add_parser("assess", help="assess one answer set")
+    check.add_argument("data", help="JSON answer set, merged into the example answers")
+    rec = sub.add_parser("record", help="answer the sample profiles with the live calculator")
+    rec.add_argument("--fixture", default=FIXTURE_PATH)
+    ver = sub.add_parser("verify", help="compare with recorded (or live) answers")
+    ver.add_argument("--fixture", default=FIXTURE_PATH)
+    ver.add_argument("--live", action="store_true", help="ask the live calculator instead of the fixture")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "assess":
+            result = assess({**_base_profile(), **json.loads(args.data)})
+            print(result.answer())
+            print(f"[DEBUG] exact: {result.exact}, reasons: {result.reasons}")
+            return 0
+        if args.command == "record":
+            record_live(sample_profiles(_base_profile()), args.fixture)
+            return 0
+        if args.live:
+            records = [{"data": data, "answer": answer} for data, answer in live_answers(sample_profiles(_base_profile()))]
+        else:
+            records = read_fixture(args.fixture)
+        report = verify(records)
+    except KeyError as e:
+        if not isinstance(e.args[0], int):
+            raise
+        print(f"No huurtoeslag rules for {e.args[0]}, RULES covers {min(RULES)}-{max(RULES)}")
+        return 2
+    except FileNotFoundError as e:
+        print(f"No fixture at {e.filename}, record one with: python huurtoeslag_rules.py record --fixture {e.filename}")
+        return 2
+    print(report)
+    if report.unrecorded == report.total:
+        print("Nothing verified: no record comes from the live calculator, "
+              f"record a fixture with: python huurtoeslag_rules.py record --fixture {args.fixture}")
+        return 1
+    return 0 if not report.eligibility_mismatches and not report.amount_mismatches else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
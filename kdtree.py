@@ -0,0 +1,167 @@
+"""
+A small static KD-tree on NumPy arrays, for nearest-point lookups on a city map.
+
+Coordinates are projected to metres around Amsterdam first (project), which is
+exact to well under a metre within the city and lets the tree use plain
+euclidean distances.
+
+    tree = KDTree(project(lats, lons))
+    distances, indices = tree.query(project(52.37, 4.89), k=3)
+"""
+
+import heapq
+import math
+
+import numpy as np
+
+LEAF_SIZE = 16              # points per leaf, scanned with one vectorised distance call
+EARTH_RADIUS = 6371008.8    # metres
+ORIGIN = (52.37, 4.90)      # projection origin, the centre of Amsterdam
+
+_COS_ORIGIN = math.cos(math.radians(ORIGIN[0]))
+
+
+def project(lat, lon) -> np.ndarray:
+    """
+    Latitude/longitude in degrees to x/y metres around ORIGIN
+    :param lat: number or array
+    :param lon: number or array
+    :return: array of shape (2,) for a single point, (n, 2) for arrays
+    """
+    lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+    x = np.radians(lon - ORIGIN[1]) * _COS_ORIGIN * EARTH_RADIUS
+    y = np.radians(lat - ORIGIN[0]) * EARTH_RADIUS
+    return np.stack((x, y), axis=-1)
+
+
+def unproject(points) -> np.ndarray:
+    """
+    Inverse of project: x/y metres to latitude/longitude
+    """
+    points = np.asarray(points, dtype=np.float64)
+    lat = ORIGIN[0] + np.degrees(points[..., 1] / EARTH_RADIUS)
+    lon = ORIGIN[1] + np.degrees(points[..., 0] / (EARTH_RADIUS * _COS_ORIGIN))
+    return np.stack((lat, lon), axis=-1)
+
+
+class KDTree:
+    """
+    Balanced KD-tree with bounding boxes per node. Built once, never modified:
+    build a new tree and swap it in to change the points.
+    """
+
+    def __init__(self, points, leaf_size: int = LEAF_SIZE):
+        """
+        :param points: array of shape (n, 2), e.g. from project
+        :param leaf_size: maximum number of points in a leaf
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        order = np.arange(len(points))
+        ranges, boxes, children = [], [], []
+
+        stack = [(0, len(points), None)]
+        while stack:
+            start, end, parent = stack.pop()
+            node = len(ranges)
+            if parent is not None:
+                # children are pushed right first, so the left child always comes first
+                parent_children = children[parent]
+                children[parent] = (node, parent_children[1]) if parent_children[0] < 0 else (parent_children[0], node)
+            pts = points[order[start:end]]
+            low, high = (pts.min(axis=0), pts.max(axis=0)) if end > start else (np.zeros(2), np.zeros(2))
+            ranges.append((start, end))
+            boxes.append((low[0], low[1], high[0], high[1]))
+            children.append((-1, -1))
+            if end - start > leaf_size:
+                dim = int(np.argmax(high - low))
+                mid = (start + end) // 2
+                part = np.argpartition(pts[:, dim], mid - start)
+                order[start:end] = order[start:end][part]
+                stack.append((mid, end, node))
+                stack.append((start, mid, node))
+
+        self._points = points[order]
+        self._index = order
+        self._ranges = ranges
+        self._boxes = [tuple(map(float, box)) for box in boxes]
+        self._children = children
+
+    def __len__(self):
+        return len(self._index)
+
+    def _box_distance(self, node: int, x: float, y: float) -> float:
+        """Squared distance from the point to the bounding box of a node."""
+        x0, y0, x1, y1 = self._boxes[node]
+        dx = x0 - x if x < x0 else x - x1 if x > x1 else 0.0
+        dy = y0 - y if y < y0 else y - y1 if y > y1 else 0.0
+        return dx * dx + dy * dy
+
+    def query(self, point, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The k points nearest to point
+        :param point: x/y in the same projection as the tree
+        :return: (distances, indices into the original points), nearest first;
+                 fewer than k if the tree is smaller
+        """
+        if not len(self):
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        x, y = float(point[0]), float(point[1])
+        p = np.array((x, y))
+        best_d = np.full(k, np.inf)
+        best_i = np.full(k, -1, dtype=np.int64)
+        heap = [(self._box_distance(0, x, y), 0)]
+        while heap:
+            dist, node = heapq.heappop(heap)
+            if dist > best_d[-1]:
+                break
+            left, right = self._children[node]
+            if left < 0:
+                start, end = self._ranges[node]
+                diff = self._points[start:end] - p
+                d = np.einsum("ij,ij->i", diff, diff)
+                if k == 1:
+                    j = int(d.argmin())
+                    if d[j] < best_d[0]:
+                        best_d[0], best_i[0] = d[j], self._index[start + j]
+                    continue
+                all_d = np.concatenate((best_d, d))
+                all_i = np.concatenate((best_i, self._index[start:end]))
+                keep = np.argsort(all_d, kind="stable")[:k]
+                best_d, best_i = all_d[keep], all_i[keep]
+            else:
+                heapq.heappush(heap, (self._box_distance(left, x, y), left))
+                heapq.heappush(heap, (self._box_distance(right, x, y), right))
+        found = best_i >= 0
+        return np.sqrt(best_d[found]), best_i[found]
+
+    def query_radius(self, point, radius: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        All points within radius of point
+        :return: (distances, indices into the original points), nearest first
+        """
+        if not len(self):
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        x, y = float(point[0]), float(point[1])
+        p = np.array((x, y))
+        limit = radius * radius
+        found_d, found_i = [], []
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if self._box_distance(node, x, y) > limit:
+                continue
+            left, right = self._children[node]
+            if left < 0:
+                start, end = self._ranges[node]
+                diff = self._points[start:end] - p
+                d = np.einsum("ij,ij->i", diff, diff)
+                inside = d <= limit
+                found_d.append(d[inside])
+                found_i.append(self._index[start:end][inside])
+            else:
+                stack.extend((right, left))
+        if not found_d:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        d, i = np.concatenate(found_d), np.concatenate(found_i)
+        order = np.argsort(d, kind="stable")
+        return np.sqrt(d[order]), i[order]
@@ -0,0 +1,162 @@
+"""
+Read marker positions straight from the Leaflet map instead of clicking through it.
+
+One execute_script call collects every marker of the map, including the ones
+hidden inside marker clusters (MarkerClusterGroup.getLayers), together with the
+map centre, which is the geocoded address after a search. The nearest marker is
+picked in Python and opened with a second call: the cluster zooms to show it
+(zoomToShowLayer) and the marker is clicked. The cost is a constant number of
+WebDriver round-trips, however many zoom levels and clusters there are.
+find_nearest stops after the first call, for callers that only need the
+marker's position.
+
+The map object comes from the map_waits probe, so map_waits.install has to run
+before the page is opened.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from selenium.common.exceptions import WebDriverException
+
+POI_CLASS = "marker-poi" # icon class of the container markers, as opposed to the searched address
+
+READ_MARKERS_JS = r"""
+var probe = window.__mapProbe;
+if (!probe || !probe.state) { return null; }
+probe.state(); // attaches maps stored on globals if the probe came late
+var map = probe.maps[0];
+if (!map) { return null; }
+
+var markers = [], seen = {};
+function add(layer, group) {
+  var id = L.stamp(layer);
+  if (seen[id] || !layer.getLatLng) { return; }
+  seen[id] = true;
+  var icon = layer.options && layer.options.icon && layer.options.icon.options;
+  markers.push({layer: layer, group: group, latlng: layer.getLatLng(),
+                cls: (icon && icon.className) || ''});
+}
+map.eachLayer(function (layer) {
+  if (layer.getLayers && layer.zoomToShowLayer) {
+    layer.getLayers().forEach(function (child) { add(child, layer); });
+  } else if (layer.getLatLng && !layer.getChildCount) {
+    add(layer, null);
+  }
+});
+probe.markers = markers;
+
+var center = map.getCenter();
+return {
+  center: [center.lat, center.lng],
+  markers: markers.map(function (m, i) { return [i, m.latlng.lat, m.latlng.lng, m.cls]; })
+};
+"""
+
+OPEN_MARKER_JS = r"""
+var index = arguments[0], done = arguments[arguments.length - 1];
+var probe = window.__mapProbe, entry = probe && probe.markers && probe.markers[index];
+if (!entry) { done(false); return; }
+function click() {
+  if (entry.layer._icon) { entry.layer._icon.click(); } else { entry.layer.fire('click'); }
+  done(true);
+}
+if (entry.group) { entry.group.zoomToShowLayer(entry.layer, click); } else { click(); }
+"""
+
+
+@dataclass
+class Marker:
+    index: int        # position in the page's marker list, used to open it
+    lat: float
+    lng: float
+    icon_class: str
+
+    @property
+    def is_poi(self) -> bool:
+        return POI_CLASS in self.icon_class
+
+
+# ----------------------------------------------------------------------
+# Geometry
+# ----------------------------------------------------------------------
+def distance_m(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """
+    Equirectangular distance in metres, exact enough within a city
+    """
+    lat = math.radians((a[0] + b[0]) / 2)
+    dx = math.radians(b[1] - a[1]) * math.cos(lat)
+    dy = math.radians(b[0] - a[0])
+    return 6371000 * math.hypot(dx, dy)
+
+
+def nearest(point: Tuple[float, float], markers: List[Marker]) -> Optional[Marker]:
+    """
+    The container marker closest to point. Other markers, such as the pin of the
+    searched address, are never returned.
+    :return: None if the map shows no container marker
+    """
+    candidates = [m for m in markers if m.is_poi]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda m: distance_m(point, (m.lat, m.lng)))
+
+
+# ---------------------------------------------------------------------------
+#   Page access
+# ---------------------------------------------------------------------------
+
+def read_markers(driver) -> Optional[Tuple[Tuple[float, float], List[Marker]]]:
+    """
+    :return: (map centre, markers), or None if no Leaflet map could be reached
+    """
+    try:
+        result = driver.execute_script(READ_MARKERS_JS)
+    except WebDriverException as e:
+        print(f"[WARN] Reading markers from the map failed: {e}")
+        return None
+    if not result:
+        return None
+    markers = [Marker(int(i), float(lat), float(lng), cls) for i, lat, lng, cls in result["markers"]]
+    return tuple(result["center"]), markers
+
+
+def open_marker(driver, marker: Marker, timeout: float = 15) -> bool:
+    """
+    Bring the marker out of its cluster and click it
+    :return: False if the page no longer knows the marker
+    """
+    driver.set_script_timeout(timeout)
+    try:
+        return bool(driver.execute_async_script(OPEN_MARKER_JS, marker.index))
+    except WebDriverException as e:
+        print(f"[WARN] Opening marker {marker.index} failed: {e}")
+        return False
+
+
+def find_nearest(driver, point: Optional[Tuple[float, float]] = None) -> Optional[Marker]:
+    """
+    The container marker nearest to point (default: the map centre), without opening it
+    :return: None if the map could not be queried or shows no container marker
+    """
+    result = read_markers(driver)
+    if result is None:
+        return None
+    center, markers = result
+    point = point or center
+    target = nearest(point, markers)
+    if target is not None:
+        print(f"[DEBUG] Nearest of {len(markers)} markers is {distance_m(point, (target.lat, target.lng)):.0f} m away")
+    return target
+
+
+def open_nearest(driver, point: Optional[Tuple[float, float]] = None) -> Optional[Marker]:
+    """
+    Open the container marker nearest to point (default: the map centre)
+    :return: the opened marker, None if the map could not be queried or shows no container marker
+    """
+    target = find_nearest(driver, point)
+    if target is None:
+        return None
+    return target if open_marker(driver, target) else None
@@ -0,0 +1,308 @@
+"""
+Wait conditions for Leaflet maps, to replace fixed time.sleep calls.
+
+A small probe is injected into the page. It hooks every Leaflet map that is
+created (L.Map.addInitHook, installed before the page scripts run through the
+Chrome DevTools protocol) and counts zoom, move and tile events; a
+MutationObserver on the marker pane records when markers were re-rendered.
+When no map could be hooked (the probe was injected after the map was made)
+the DOM alone is used: pending tiles, the zoom animation class and marker
+pane mutations.
+
+Conditions are callables for WebDriverWait, like selenium's expected_conditions.
+Most take a snapshot taken before the action, so they can tell "the map has
+reacted" from "nothing has happened yet":
+
+    before = map_waits.snapshot(driver)
+    zoom_button.click()
+    timer.wait("zoom in", map_waits.zoom_finished(before), replaced=0.5)
+"""
+
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.support.ui import WebDriverWait
+
+import tracing
+
+# ---------------------------------------------------------------------------
+#   Configurations
+# ---------------------------------------------------------------------------
+
+DEFAULT_TIMEOUT = 15
+POLL_FREQUENCY = 0.05   # seconds between checks, the page is asked in a single script call
+QUIET = 0.25            # seconds without marker or tile activity that count as "settled"
+SETTLE = 0.6            # seconds after which an action that caused no event counts as done
+
+PROBE_JS = r"""
+(function () {
+  if (window.__mapProbe) { return; }
+  var probe = window.__mapProbe = {
+    maps: [], zooming: false, zoomEnds: 0, moveEnds: 0, tilesPending: 0,
+    markerChanges: 0, lastMarkerChange: 0, lastTileEvent: 0
+  };
+  var now = function () { return performance.now(); };
+
+  function watchLayer(layer) {
+    if (!layer || !layer.on || layer.__probed || !layer.createTile) { return; }
+    layer.__probed = true;
+    layer.on('tileloadstart', function () { probe.tilesPending++; probe.lastTileEvent = now(); });
+    layer.on('tileload tileerror tileabort', function () {
+      probe.tilesPending = Math.max(0, probe.tilesPending - 1); probe.lastTileEvent = now();
+    });
+  }
+
+  function attach(map) {
+    if (!map || map.__probed) { return; }
+    map.__probed = true;
+    probe.maps.push(map);
+    map.on('zoomstart', function () { probe.zooming = true; });
+    map.on('zoomend', function () { probe.zooming = false; probe.zoomEnds++; });
+    map.on('moveend', function () { probe.moveEnds++; });
+    map.on('layeradd', function (e) { watchLayer(e.layer); });
+    if (map.eachLayer) { map.eachLayer(watchLayer); }
+  }
+  probe.attach = attach;
+
+  function hook(L) {
+    if (!L || !L.Map || !L.Map.addInitHook || L.__probed) { return; }
+    L.__probed = true;
+    L.Map.addInitHook(function () { attach(this); });
+  }
+
+  if (window.L) {
+    hook(window.L);
+  } else {
+    var current;
+    try {
+      Object.defineProperty(window, 'L', {
+        configurable: true,
+        get: function () { return current; },
+        set: function (value) { current = value; hook(value); }
+      });
+    } catch (e) { /* L is not configurable, rely on the DOM */ }
+  }
+
+  // markers are re-rendered by adding and removing icons in the marker pane
+  new MutationObserver(function (records) {
+    for (var i = 0; i < records.length; i++) {
+      var target = records[i].target;
+      if (target.closest && target.closest('.leaflet-marker-pane')) {
+        probe.markerChanges++; probe.lastMarkerChange = now(); return;
+      }
+    }
+  }).observe(document, {childList: true, subtree: true});
+
+  probe.state = function () {
+    if (!probe.maps.length && now() - (probe.lastScan || -1e9) > 1000) {
+      // probe came late: find maps that were stored on a global, at most once a second
+      probe.lastScan = now();
+      for (var key in window) {
+        try {
+          var value = window[key];
+          if (value && value._leaflet_id && value.getZoom && value.on) { attach(value); }
+        } catch (e) { /* cross-origin or throwing getter */ }
+      }
+    }
+    var tiles = document.querySelectorAll('img.leaflet-tile:not(.leaflet-tile-loaded)').length;
+    return {
+      now: now(), has_map: probe.maps.length > 0,
+      zooming: probe.zooming || !!document.querySelector('.leaflet-zoom-anim'),
+      zoom_ends: probe.zoomEnds, move_ends: probe.moveEnds,
+      tiles_pending: Math.max(probe.tilesPending, tiles), last_tile_event: probe.lastTileEvent,
+      marker_changes: probe.markerChanges, last_marker_change: probe.lastMarkerChange
+    };
+  };
+})();
+"""
+
+_STATE_JS = PROBE_JS + "\nreturn window.__mapProbe.state();"
+
+_installed = weakref.WeakSet() # drivers that inject the probe into every new document
+
+
+# ----------------------------------------------------------------------
+# Probe
+# ----------------------------------------------------------------------
+@dataclass
+class MapState:
+    now: float = 0.0              # page clock, milliseconds
+    has_map: bool = False         # a Leaflet map was hooked, events are counted
+    zooming: bool = False
+    zoom_ends: int = 0
+    move_ends: int = 0
+    tiles_pending: int = 0
+    last_tile_event: float = 0.0
+    marker_changes: int = 0
+    last_marker_change: float = 0.0
+
+
+def install(driver):
+    """
+    Inject the probe before the scripts of every page the driver opens from now on,
+    and into the current page. Safe to call more than once.
+    """
+    if driver not in _installed:
+        try:
+            driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": PROBE_JS})
+            _installed.add(driver)
+        except (AttributeError, WebDriverException) as e:
+            # not a Chromium driver: the probe is injected on first use, maps are found via globals
+            print(f"[WARN] Could not register the map probe for new pages: {e}")
+    try:
+        driver.execute_script(PROBE_JS)
+    except WebDriverException:
+        pass # no document yet
+
+
+def snapshot(driver) -> MapState:
+    """
+    The current map state, injects the probe if the page does not have it yet
+    """
+    return MapState(**driver.execute_script(_STATE_JS))
+
+
+# ---------------------------------------------------------------------------
+#   Conditions
+# ---------------------------------------------------------------------------
+
+def _elapsed(state: MapState, since: float) -> float:
+    return (state.now - since) / 1000
+
+
+def _tiles_idle(state: MapState, quiet: float) -> bool:
+    return state.tiles_pending == 0 and _elapsed(state, state.last_tile_event) >= quiet
+
+
+def _zoom_finished(state: MapState, before: MapState, settle: float) -> bool:
+    if state.zooming:
+        return False
+    return state.zoom_ends > before.zoom_ends or _elapsed(state, before.now) >= settle
+
+
+def _markers_rerendered(state: MapState, before: MapState, quiet: float, settle: float) -> bool:
+    if state.zooming:
+        return False
+    if state.marker_changes > before.marker_changes:
+        return _elapsed(state, state.last_marker_change) >= quiet
+    return _elapsed(state, before.now) >= settle
+
+
+def tiles_idle(quiet: float = QUIET) -> Callable:
+    """
+    No tile is loading and none has finished loading for `quiet` seconds
+    """
+    return lambda driver: _tiles_idle(snapshot(driver), quiet)
+
+
+def zoom_finished(before: MapState, settle: float = SETTLE) -> Callable:
+    """
+    The zoom started after `before` has ended. A click that did not zoom at all
+    (e.g. already at the maximum zoom) counts as done after `settle` seconds.
+    """
+    return lambda driver: _zoom_finished(snapshot(driver), before, settle)
+
+
+def markers_rerendered(before: MapState, quiet: float = QUIET, settle: float = SETTLE) -> Callable:
+    """
+    The marker layer changed after `before` and has been quiet for `quiet` seconds.
+    If it did not change at all it counts as rendered after `settle` seconds.
+    """
+    return lambda driver: _markers_rerendered(snapshot(driver), before, quiet, settle)
+
+
+def map_idle(before: MapState, quiet: float = QUIET, settle: float = SETTLE) -> Callable:
+    """
+    Zoom finished, markers re-rendered and tiles loaded, checked in one round-trip
+    """
+    def condition(driver):
+        state = snapshot(driver)
+        return (_zoom_finished(state, before, settle) and _markers_rerendered(state, before, quiet, settle)
+                and _tiles_idle(state, quiet))
+    return condition
+
+
+def document_ready(driver) -> bool:
+    """
+    The page and its subresources have loaded
+    """
+    return driver.execute_script("return document.readyState") == "complete"
+
+
+def attribute_present(locator, attribute: str) -> Callable:
+    """
+    The element exists and has a non-empty attribute, returns the element
+    """
+    def condition(driver):
+        elements = driver.find_elements(*locator)
+        if elements and elements[0].get_attribute(attribute):
+            return elements[0]
+        return False
+    return condition
+
+
+# ---------------------------------------------------------------------------
+#   Step timing
+# ---------------------------------------------------------------------------
+
+@dataclass
+class _Step:
+    waits: int = 0
+    waited: float = 0.0
+    replaced: float = 0.0
+    timeouts: int = 0
+
+
+@dataclass
+class StepTimer:
+    """
+    Runs the waits of one lookup and keeps, per step, how long was waited
+    compared to the sleep the wait replaced.
+    """
+    driver: object
+    timeout: float = DEFAULT_TIMEOUT
+    steps: Dict[str, _Step] = field(default_factory=dict)
+
+    def wait(self, step: str, condition: Callable, replaced: float = 0.0,
+             timeout: Optional[float] = None) -> bool:
+        """
+        Wait until condition(driver) is truthy. A timeout is reported, not raised:
+        the old code did not check the page state either.
+        :param step: name to aggregate the timing under
+        :param condition: a condition from this module or selenium's expected_conditions
+        :param replaced: seconds of time.sleep this wait replaces
+        :return: False if the wait timed out
+        """
+        stats = self.steps.setdefault(step, _Step())
+        start = time.perf_counter()
+        with tracing.span("wait", step=step) as span:
+            try:
+                WebDriverWait(self.driver, timeout or self.timeout, poll_frequency=POLL_FREQUENCY).until(condition)
+                ok = True
+            except TimeoutException:
+                print(f"[WARN] Wait for '{step}' timed out, continuing")
+                stats.timeouts += 1
+                ok = False
+            span.set(timed_out=not ok)
+        stats.waits += 1
+        stats.waited += time.perf_counter() - start
+        stats.replaced += replaced
+        return ok
+
+    @property
+    def saved(self) -> float:
+        return sum(step.replaced - step.waited for step in self.steps.values())
+
+    def report(self) -> str:
+        lines = []
+        for name, step in self.steps.items():
+            line = (f"{name}: waited {step.waited:.2f}s in {step.waits} wait(s) "
+                    f"instead of {step.replaced:.2f}s, saved {step.replaced - step.waited:.2f}s")
+            if step.timeouts:
+                line += f" ({step.timeouts} timed out)"
+            lines.append(line)
+        lines.append(f"total saved: {self.saved:.2f}s")
+        return "\n".join(lines)
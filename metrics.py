@@ -0,0 +1,278 @@
+"""
+In-process metrics for the voice demos: counters and latency histograms.
+
+Counters count what goes wrong in a conversation: answers an extractor could
+not read (per INPUT_TYPE), "I didn't understand that" retries in
+get_user_input and "Sorry, lets try that again" loops in Action.run.
+Histograms keep the latency of every traced stage (the tracing spans: speech
+synthesis, playback, listening, recognition, LLM, browser steps), so the p50,
+p95 and p99 of each external call can be read without keeping samples.
+
+The histograms are HDR-style: log-linear buckets with SUB_BUCKETS buckets per
+power of two, so every quantile is within 1 / (2 * SUB_BUCKETS) of the true
+value (1.6 % with 32) at any scale, in a few hundred integers per series.
+
+The registry is exported as Prometheus text, written to METRICS_PATH every
+DUMP_INTERVAL seconds and at exit, and served on http://localhost:METRICS_PORT/metrics
+when a port is set. start() is called once by voice_util.init().
+"""
+
+import atexit
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import tracing
+
+# ---------------------------------------------------------------------------
+#   Configurations
+# ---------------------------------------------------------------------------
+
+PREFIX = "voice_"
+METRICS_PATH = os.path.join("data", "metrics.prom")  # None disables the file dump
+DUMP_INTERVAL = 15          # seconds between file dumps
+METRICS_PORT: Optional[int] = None  # e.g. 9464 to serve /metrics
+SUB_BUCKETS = 32            # histogram buckets per power of two
+QUANTILES = (0.5, 0.95, 0.99)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+# ---------------------------------------------------------------------------
+#   METRICS
+# ---------------------------------------------------------------------------
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {PREFIX}{self.name} {self.help}", f"# TYPE {PREFIX}{self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{PREFIX}{self.name}{_format_labels(key)} {value:g}" for key, value in items]
+        return lines
+
+
+class HdrHistogram:
+    """
+    Log-linear histogram of positive values: exact count, sum, min and max,
+    quantiles within the relative error of one bucket
+    """
+
+    def __init__(self, sub_buckets: int = SUB_BUCKETS):
+        self.sub_buckets = sub_buckets
+        self.buckets: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if value <= 0:
+            self.zeros += 1
+            return
+        mantissa, exponent = math.frexp(value)  # value = mantissa * 2**exponent, 0.5 <= mantissa < 1
+        index = exponent * self.sub_buckets + int((mantissa - 0.5) * 2 * self.sub_buckets)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def _bucket_value(self, index: int) -> float:
+        exponent, sub = divmod(index, self.sub_buckets)
+        return math.ldexp(0.5 + (sub + 0.5) / (2 * self.sub_buckets), exponent)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return math.nan
+        rank = max(1, math.ceil(q * self.count))
+        if rank <= self.zeros:
+            return 0.0
+        seen = self.zeros
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(max(self._bucket_value(index), self.min), self.max)
+        return self.max
+
+
+class Histogram:
+    """A family of HdrHistograms, one per label set, exported as a Prometheus summary"""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._series: Dict[LabelKey, HdrHistogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = HdrHistogram()
+            series.record(value)
+
+    def series(self, **labels) -> Optional[HdrHistogram]:
+        return self._series.get(_label_key(labels))
+
+    def expose(self) -> List[str]:
+        name = PREFIX + self.name
+        lines = [f"# HELP {name} {self.help}", f"# TYPE {name} summary"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for q in QUANTILES:
+                    lines.append(f"{name}{_format_labels(key, (('quantile', f'{q:g}'),))} {series.quantile(q):.6g}")
+                lines.append(f"{name}_sum{_format_labels(key)} {series.sum:.6g}")
+                lines.append(f"{name}_count{_format_labels(key)} {series.count}")
+        return lines
+
+
+# ---------------------------------------------------------------------------
+#   Registry
+# ---------------------------------------------------------------------------
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+
+def counter(name: str, help_text: str) -> Counter:
+    with _registry_lock:
+        return _registry.setdefault(name, Counter(name, help_text))
+
+
+def histogram(name: str, help_text: str) -> Histogram:
+    with _registry_lock:
+        return _registry.setdefault(name, Histogram(name, help_text))
+
+
+def expose() -> str:
+    """
+    The registry in the Prometheus text format
+    """
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return "\n".join(line for metric in metrics for line in metric.expose()) + "\n"
+
+
+EXTRACTIONS = counter("extractions_total", "Answers passed to an extractor, per INPUT_TYPE")
+EXTRACTION_FAILURES = counter("extraction_failures_total", "Answers an extractor could not read, per INPUT_TYPE")
+INPUT_RETRIES = counter("input_retries_total",
+                        "\"I didn't understand that\" retries in get_user_input, per INPUT_TYPE and reason")
+CONFIRMATION_RETRIES = counter("confirmation_retries_total",
+                               "\"Sorry, lets try that again\" loops in Action.run, per INPUT_TYPE")
+STAGE_LATENCY = histogram("stage_latency_ms", "Duration of traced stages in milliseconds, per span name")
+STAGE_ERRORS = counter("stage_errors_total", "Traced stages that raised, per span name")
+
+
+def _observe_span(span: tracing.Span):
+    STAGE_LATENCY.observe(span.duration_ms, stage=span.name)
+    if span.error is not None:
+        STAGE_ERRORS.inc(stage=span.name)
+
+
+tracing.add_listener(_observe_span)
+
+
+# ---------------------------------------------------------------------------
+#   Export
+# ---------------------------------------------------------------------------
+
+def dump(path: Optional[str] = None):
+    """
+    Write the registry to a file, replacing the previous dump in one rename
+    """
+    path = path or METRICS_PATH
+    if not path:
+        return
+    try:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(expose())
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[WARN] Writing metrics to {path} failed: {e}")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = expose().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # scrapes every few seconds would drown the demo output
+
+
+_started = False
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def serve(port: int) -> ThreadingHTTPServer:
+    """
+    Serve /metrics on localhost in a background thread
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"[DEBUG] Metrics on http://127.0.0.1:{server.server_port}/metrics")
+    return server
+
+
+def start():
+    """
+    Start the configured exporters once: the periodic file dump and the HTTP endpoint
+    """
+    global _started, _server
+    if _started:
+        return
+    _started = True
+    if METRICS_PATH:
+        def dump_periodically():
+            while True:
+                time.sleep(DUMP_INTERVAL)
+                dump()
+
+        threading.Thread(target=dump_periodically, name="metrics-dump", daemon=True).start()
+        atexit.register(dump)
+    if METRICS_PORT is not None:
+        try:
+            _server = serve(METRICS_PORT)
+        except OSError as e:
+            print(f"[WARN] Could not serve metrics on port {METRICS_PORT}: {e}")
@@ -0,0 +1,288 @@
+"""
+Precomputed nearest container per address and fraction.
+
+For every address of the address index and every container fraction the
+nearest container and its distance are stored, one column file per fraction:
+
+    meta.json              fractions, number and build id of the addresses, snapshot time
+    containers.json        the containers the table points into
+    nearest_<fraction>.npy int32, row in containers.json per address row
+    distance_<fraction>.npy float32, metres
+
+The columns are memory-mapped, so an online lookup is a single array index.
+
+Building runs per grid cell of addresses: the containers that can be nearest to
+any address in the cell are found with one KD-tree query around the cell centre
+and compared in one vectorised step. When the container snapshot changes the
+table is updated instead of rebuilt: only addresses whose container was removed
+(or moved), and addresses that a new container is closer to, are recomputed.
+
+    python nearest_table.py build
+"""
+
+import argparse
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import numpy as np
+
+import address_index
+import container_index
+import kdtree
+
+# ---------------------------------------------------------------------------
+#   Configurations
+# ---------------------------------------------------------------------------
+
+TABLE_DIR = os.path.join("data", "nearest")
+CELL_SIZE = 250.0   # metres, addresses are processed per grid cell of this size
+
+
+@dataclass
+class BuildReport:
+    full: bool = True
+    seconds: float = 0.0
+    recomputed: Dict[int, int] = field(default_factory=dict)  # fraction -> addresses recomputed
+
+    def __str__(self):
+        kind = "Built" if self.full else "Updated"
+        counts = ", ".join(f"{container_index.FRACTIONS.get(f, f)}: {n}" for f, n in self.recomputed.items())
+        return f"{kind} nearest table in {self.seconds:.2f}s ({counts})"
+
+
+# ----------------------------------------------------------------------
+# Nearest search for many points
+# ----------------------------------------------------------------------
+def nearest_many(points: np.ndarray, fraction: container_index.FractionIndex) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Exact nearest container for each point
+    :param points: (n, 2) projected coordinates
+    :return: (container rows as int32, distances as float32); -1 and inf without containers
+    """
+    rows = np.full(len(points), -1, dtype=np.int32)
+    distances = np.full(len(points), np.inf, dtype=np.float32)
+    if not len(points) or not len(fraction.tree):
+        return rows, distances
+    containers = kdtree.project(fraction.lat, fraction.lon)
+    cells = np.floor(points / CELL_SIZE).astype(np.int64)
+    _, cell_of, counts = np.unique(cells, axis=0, return_inverse=True, return_counts=True)
+    order = np.argsort(cell_of.ravel(), kind="stable")
+    diagonal = CELL_SIZE * math.sqrt(2)
+    start = 0
+    for count in counts:
+        members = order[start:start + count]
+        start += count
+        center = (cells[members[0]] + 0.5) * CELL_SIZE
+        # every point of the cell is within diagonal / 2 of the centre, so its nearest
+        # container is within (distance of the centre's nearest) + diagonal of the centre
+        d0, _ = fraction.tree.query(center, 1)
+        _, candidates = fraction.tree.query_radius(center, float(d0[0]) + diagonal)
+        diff = points[members, None, :] - containers[None, candidates, :]
+        d2 = np.einsum("ijk,ijk->ij", diff, diff)
+        best = d2.argmin(axis=1)
+        rows[members] = candidates[best]
+        distances[members] = np.sqrt(d2[np.arange(len(members)), best])
+    return rows, distances
+
+
+# ---------------------------------------------------------------------------
+#   TABLE
+# ---------------------------------------------------------------------------
+
+class NearestTable:
+    def __init__(self, directory: str = TABLE_DIR):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(directory, "containers.json"), encoding="utf-8") as f:
+            self.containers = {int(fraction): rows for fraction, rows in json.load(f).items()}
+        self.nearest = {}
+        self.distance = {}
+        for fraction in self.meta["fractions"]:
+            self.nearest[fraction] = np.load(self._path("nearest", fraction), mmap_mode="r")
+            self.distance[fraction] = np.load(self._path("distance", fraction), mmap_mode="r")
+
+    def _path(self, column: str, fraction: int) -> str:
+        return os.path.join(self.directory, f"{column}_{fraction}.npy")
+
+    @property
+    def snapshot_created(self) -> float:
+        return self.meta["snapshot_created"]
+
+    def matches(self, addresses: address_index.AddressIndex, containers: container_index.ContainerIndex) -> bool:
+        """
+        The table was built from these address and container data
+        """
+        return self.built_for(addresses) and self.snapshot_created == containers.created
+
+    def built_for(self, addresses: address_index.AddressIndex) -> bool:
+        """
+        The rows of the table are the rows of this address index. The count alone is not
+        enough: a rebuilt index with as many addresses can have other addresses per row.
+        """
+        return self.meta["addresses"] == len(addresses) and self.meta.get("addresses_id") == addresses.build_id
+
+    def lookup(self, row: int, fraction: int) -> Optional[container_index.Nearest]:
+        """
+        Nearest container of a fraction for an address row of the address index
+        """
+        column = self.nearest.get(fraction)
+        if column is None:
+            return None
+        i = int(column[row])
+        if i < 0:
+            return None
+        container_id, lat, lon, address = self.containers[fraction][i]
+        return container_index.Nearest(container_index.Container(container_id, fraction, lat, lon, address),
+                                       float(self.distance[fraction][row]))
+
+
+def _container_rows(fraction: container_index.FractionIndex) -> list:
+    return [[fraction.ids[i], float(fraction.lat[i]), float(fraction.lon[i]), fraction.addresses[i]]
+            for i in range(len(fraction.ids))]
+
+
+def _write_json(path: str, value, **kwargs):
+    # same as _save: a reader or an interrupted build never sees a half-written file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(value, f, **kwargs)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _save(path: str, array: np.ndarray):
+    # write next to the old column and rename over it, readers keep their mapping of the old file
+    tmp = path + ".tmp.npy"
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+def _update_fraction(points: np.ndarray, old_rows: list, old_nearest: np.ndarray, old_distance: np.ndarray,
+                     fraction: container_index.FractionIndex) -> tuple[np.ndarray, np.ndarray, int]:
+    """
+    Carry the old column over to the new snapshot, recomputing only the affected addresses
+    :return: new nearest column, new distance column, number of recomputed addresses
+    """
+    new_rows = _container_rows(fraction)
+    new_position = {(row[0], row[1], row[2]): i for i, row in enumerate(new_rows)}
+    # old container row -> new row, -1 if it was removed or moved
+    remap = np.array([new_position.get((row[0], row[1], row[2]), -1) for row in old_rows] + [-1], dtype=np.int32)
+    nearest = remap[old_nearest]  # -1 (no container before) maps to the appended -1
+    distance = np.array(old_distance, dtype=np.float32)
+    affected = nearest < 0
+
+    kept = set(int(i) for i in remap if i >= 0)
+    added = [i for i in range(len(new_rows)) if i not in kept]
+    if added:
+        added_points = kdtree.project(fraction.lat[added], fraction.lon[added])
+        for point in added_points:
+            diff = points - point
+            affected |= np.einsum("ij,ij->i", diff, diff) < distance.astype(np.float64) ** 2
+
+    where = np.nonzero(affected)[0]
+    rows, distances = nearest_many(points[where], fraction)
+    nearest[where], distance[where] = rows, distances
+    return nearest, distance, len(where)
+
+
+def build_table(addresses: address_index.AddressIndex, containers: container_index.ContainerIndex,
+                directory: str = TABLE_DIR, full: bool = False) -> BuildReport:
+    """
+    Build the table, or update an existing one for a new container snapshot
+    :param full: recompute every address even if an up-to-date table for these addresses exists
+    """
+    start = time.perf_counter()
+    points = kdtree.project(addresses.coords[:, 0], addresses.coords[:, 1])
+    old = None
+    if not full and os.path.exists(os.path.join(directory, "meta.json")):
+        old = NearestTable(directory)
+        if not old.built_for(addresses):
+            old = None  # the addresses changed, rows do not line up any more
+    report = BuildReport(full=old is None)
+
+    os.makedirs(directory, exist_ok=True)
+    # the columns are replaced one by one: without meta.json an interrupted build reads as no table
+    # (the old columns stay readable through their memory maps until the update is done)
+    try:
+        os.remove(os.path.join(directory, "meta.json"))
+    except FileNotFoundError:
+        pass
+    container_rows = {}
+    for fraction in containers.fractions:
+        index = containers.fraction_index(fraction)
+        if old is not None and fraction in old.nearest:
+            nearest, distance, count = _update_fraction(points, old.containers[fraction], old.nearest[fraction],
+                                                        old.distance[fraction], index)
+        else:
+            nearest, distance = nearest_many(points, index)
+            count = len(points)
+        _save(os.path.join(directory, f"nearest_{fraction}.npy"), nearest)
+        _save(os.path.join(directory, f"distance_{fraction}.npy"), distance)
+        container_rows[fraction] = _container_rows(index)
+        report.recomputed[fraction] = count
+
+    _write_json(os.path.join(directory, "containers.json"), container_rows)
+    # meta.json last, once every column and containers.json is complete
+    meta = {"fractions": containers.fractions, "addresses": len(addresses), "addresses_id": addresses.build_id,
+            "snapshot_created": containers.created, "snapshot": containers.source, "built": time.time()}
+    _write_json(os.path.join(directory, "meta.json"), meta, indent=2)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+# ---------------------------------------------------------------------------
+#   Shared table
+# ---------------------------------------------------------------------------
+
+_table: Optional[NearestTable] = None
+_table_mtime: float | None = None
+_table_lock = threading.Lock()
+
+
+def get_table(directory: str = TABLE_DIR) -> Optional[NearestTable]:
+    """
+    The table, reopened when it has been rebuilt
+    :return: None if no table has been built
+    """
+    global _table, _table_mtime
+    meta = os.path.join(directory, "meta.json")
+    with _table_lock:
+        try:
+            mtime = os.path.getmtime(meta)
+        except OSError:
+            return None
+        if _table is None or _table.directory != directory or mtime != _table_mtime:
+            _table, _table_mtime = NearestTable(directory), mtime
+        return _table
+
+
+# ---------------------------------------------------------------------------
+#   MAIN
+# ---------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute the nearest container of every address.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--addresses", default=address_index.INDEX_DIR, help="address index directory")
+    parser.add_argument("--snapshot", default=container_index.SNAPSHOT_PATH, help="container snapshot")
+    parser.add_argument("--out", default=TABLE_DIR, help="table directory")
+    parser.add_argument("--full", action="store_true", help="recompute every address")
+    args = parser.parse_args(argv)
+
+    report = build_table(address_index.AddressIndex(args.addresses),
+                         container_index.ContainerIndex.from_file(args.snapshot), args.out, full=args.full)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Appearance streams for filled text fields.
+
+Without an /AP stream a viewer has to lay out every field itself on every open
+(/NeedAppearances), which is slow and some viewers and screen readers skip it.
+build_appearance lays out a single line of text the way Acrobat does for plain
+and comb fields; the glyph widths it needs are cached per font and shared
+across fields and documents.
+
+The text is drawn in the codes of the field's font encoding (its base encoding
+and /Differences). A value with a character the font cannot encode gets no
+stream, so the viewer lays it out from /V instead of printing something else.
+"""
+
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+
+from pdfrw import PdfArray, PdfDict, PdfName
+
+PADDING = 2           # inset of the text from the field border, in points
+MAX_AUTO_FONT_SIZE = 12
+COMB_FLAG = 1 << 24   # field flag bit 25: split the field into MaxLen equal cells
+
+_DA_FONT = re.compile(r"/([^\s/\[\]()<>]+)\s+([\d.]+)\s+Tf")
+
+# Glyph widths of Helvetica (standard 14 font, no /Widths in the pdf) for ASCII 32..126
+_HELVETICA_ASCII = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)
+_STANDARD_WIDTHS = {
+    "Helvetica": dict(zip(range(32, 127), _HELVETICA_ASCII)),
+}
+
+# Base encodings with a Python codec; StandardEncoding (and no /Encoding) is only trusted for ASCII
+_BASE_CODECS = {"WinAnsiEncoding": "cp1252", "MacRomanEncoding": "mac_roman"}
+# glyph names of /Differences that are not a letter with an accent
+_GLYPH_CHARS = {
+    "space": " ", "quotesingle": "'", "grave": "`", "Euro": "\u20ac", "bullet": "\u2022",
+    "dagger": "\u2020", "daggerdbl": "\u2021", "ellipsis": "\u2026", "emdash": "\u2014",
+    "endash": "\u2013", "florin": "\u0192", "guilsinglleft": "\u2039", "guilsinglright": "\u203a",
+    "minus": "\u2212", "perthousand": "\u2030", "quotedblbase": "\u201e", "quotedblleft": "\u201c",
+    "quotedblright": "\u201d", "quoteleft": "\u2018", "quoteright": "\u2019", "quotesinglbase": "\u201a",
+    "trademark": "\u2122", "AE": "\u00c6", "ae": "\u00e6", "OE": "\u0152", "oe": "\u0153",
+    "Eth": "\u00d0", "eth": "\u00f0", "Thorn": "\u00de", "thorn": "\u00fe", "germandbls": "\u00df",
+    "Lslash": "\u0141", "lslash": "\u0142", "dotlessi": "\u0131", "Oslash": "\u00d8", "oslash": "\u00f8",
+    "currency": "\u00a4", "brokenbar": "\u00a6", "copyright": "\u00a9", "registered": "\u00ae",
+    "degree": "\u00b0", "plusminus": "\u00b1", "mu": "\u00b5", "periodcentered": "\u00b7",
+    "multiply": "\u00d7", "divide": "\u00f7", "sterling": "\u00a3", "yen": "\u00a5", "section": "\u00a7",
+    "paragraph": "\u00b6", "cent": "\u00a2", "exclamdown": "\u00a1", "questiondown": "\u00bf",
+    "guillemotleft": "\u00ab", "guillemotright": "\u00bb", "ordfeminine": "\u00aa", "ordmasculine": "\u00ba",
+    "logicalnot": "\u00ac", "onequarter": "\u00bc", "onehalf": "\u00bd", "threequarters": "\u00be",
+    "onesuperior": "\u00b9", "twosuperior": "\u00b2", "threesuperior": "\u00b3",
+}
+_ACCENTED_GLYPH = re.compile(r"([A-Za-z])(grave|acute|circumflex|tilde|dieresis|ring|cedilla|caron|breve|ogonek|macron)")
+_ACCENT_NAMES = {"dieresis": "DIAERESIS", "ring": "RING ABOVE"}
+
+
+# ----------------------------------------------------------------------
+# Font metrics
+# ----------------------------------------------------------------------
+class FontMetrics:
+    """Glyph widths of one font, in 1/1000 of the font size."""
+
+    def __init__(self, widths: dict[int, int], default: int):
+        self._widths = widths
+        self._default = default
+        self._char_cache = {}
+
+    def char_width(self, char: str) -> int:
+        width = self._char_cache.get(char)
+        if width is None:
+            code = ord(char)
+            width = self._widths.get(code)
+            if width is None:
+                # accented letters are as wide as their base letter
+                base = unicodedata.normalize("NFD", char)[:1]
+                width = self._widths.get(ord(base), self._default) if base != char else self._default
+            self._char_cache[char] = width
+        return width
+
+    def text_width(self, text: str, size: float) -> float:
+        return sum(self.char_width(c) for c in text) * size / 1000
+
+
+@lru_cache(maxsize=64)
+def font_metrics(base_font: str, first_char: int | None = None, widths: tuple | None = None) -> FontMetrics:
+    """
+    Metrics for a font, cached for the whole process: the same font in the next
+    field or the next document costs a dictionary lookup
+    :param base_font: /BaseFont without the slash, e.g. "Helvetica"
+    :param first_char: /FirstChar of a font with a /Widths array
+    :param widths: the /Widths array as a tuple of numbers
+    """
+    if widths:
+        table = {first_char + i: int(float(w)) for i, w in enumerate(widths)}
+        return FontMetrics(table, default=int(sum(table.values()) / len(table)))
+    # subset fonts are named ABCDEF+Helvetica
+    name = base_font.split("+")[-1]
+    family = "Helvetica" if name.startswith(("Helvetica", "Arial")) else name
+    return FontMetrics(_STANDARD_WIDTHS.get(family, _STANDARD_WIDTHS["Helvetica"]), default=556)
+
+
+def parse_da(da: str) -> tuple[str, float, str]:
+    """
+    Split a default appearance string like "/Helv 10 Tf 0 g"
+    :return: font resource name, font size (0 = auto), the remaining operators (colour)
+    """
+    match = _DA_FONT.search(da or "")
+    if not match:
+        return "Helv", 0.0, "0 g"
+    rest = (da[:match.start()] + da[match.end():]).strip() or "0 g"
+    return match.group(1), float(match.group(2)), rest
+
+
+# ----------------------------------------------------------------------
+# Font encoding
+# ----------------------------------------------------------------------
+def _glyph_char(name: str) -> str | None:
+    """The character of a glyph name, None if it is not known here."""
+    if len(name) == 1:
+        return name
+    if name.startswith("uni") and len(name) == 7:
+        try:
+            return chr(int(name[3:], 16))
+        except ValueError:
+            return None
+    if name in _GLYPH_CHARS:
+        return _GLYPH_CHARS[name]
+    match = _ACCENTED_GLYPH.fullmatch(name)
+    if match:
+        letter, accent = match.groups()
+        case = "CAPITAL" if letter.isupper() else "SMALL"
+        try:
+            return unicodedata.lookup(f"LATIN {case} LETTER {letter.upper()} WITH "
+                                      f"{_ACCENT_NAMES.get(accent, accent.upper())}")
+        except KeyError:
+            return None
+    return None
+
+
+@lru_cache(maxsize=64)
+def font_encoding(base: str | None = None, differences: tuple | None = None) -> dict[str, int]:
+    """
+    Character -> code of a simple font, cached like font_metrics
+    :param base: the /Encoding name (or the /BaseEncoding of an encoding dict) without the slash
+    :param differences: the /Differences array as a tuple of codes (int) and glyph names (str)
+    """
+    codec = _BASE_CODECS.get(base)
+    codes = {}
+    for code in range(32, 256 if codec else 127):
+        try:
+            codes[bytes([code]).decode(codec or "ascii")] = code
+        except UnicodeDecodeError:
+            pass # unused code of the encoding
+    by_code = {code: char for char, code in codes.items()}
+    code = 0
+    for item in differences or ():
+        if isinstance(item, int):
+            code = item
+            continue
+        old = by_code.pop(code, None)
+        if old is not None:
+            del codes[old]
+        char = _glyph_char(item)
+        if char is not None and char not in codes:
+            codes[char] = code
+            by_code[code] = char
+        code += 1
+    return codes
+
+
+def encode_text(value: str, encoding: dict[str, int]) -> str | None:
+    """
+    The value as the codes of a font encoding, one character per code (see build_appearance)
+    :param encoding: from font_encoding
+    :return: None if the font cannot show a character of the value
+    """
+    try:
+        return "".join(chr(encoding[char]) for char in value)
+    except KeyError:
+        return None
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+# ---------------------------------------------------------------------------
+#   Layout
+# ---------------------------------------------------------------------------
+
+@dataclass
+class Appearance:
+    content: str     # the content stream
+    bbox: tuple      # (0, 0, width, height)
+    font_name: str   # resource name the stream refers to
+
+
+def build_appearance(value: str, rect, da: str, metrics: FontMetrics,
+                     quadding: int = 0, comb_cells: int = 0) -> Appearance:
+    """
+    Lay out a single-line text field
+    :param value: the field value in the codes of the font (encode_text)
+    :param rect: the widget /Rect
+    :param da: default appearance string of the field
+    :param metrics: FontMetrics of the font named in da
+    :param quadding: /Q, 0 left, 1 centred, 2 right
+    :param comb_cells: MaxLen of a comb field, 0 for a normal field
+    """
+    x1, y1, x2, y2 = (float(v) for v in rect)
+    width, height = abs(x2 - x1), abs(y2 - y1)
+    font_name, size, colour = parse_da(da)
+
+    if comb_cells:
+        value = value[:comb_cells]
+    if not size:
+        size = min(MAX_AUTO_FONT_SIZE, (height - 2 * PADDING) / 1.15)
+        if not comb_cells:
+            text_width = metrics.text_width(value, 1)
+            if text_width:
+                size = min(size, (width - 2 * PADDING) / text_width)
+        size = round(max(size, 4.0), 2)
+
+    baseline = round((height - size) / 2 + 0.22 * size, 2)
+    ops = [f"/{font_name} {size:g} Tf", colour]
+    if comb_cells:
+        # one glyph centred in each cell
+        cell = width / comb_cells
+        x_prev = 0.0
+        for i, char in enumerate(value):
+            x = round(i * cell + (cell - metrics.text_width(char, size)) / 2, 2)
+            first = f"{x:g} {baseline:g} Td" if i == 0 else f"{x - x_prev:g} 0 Td"
+            ops.append(f"{first} ({_escape(char)}) Tj")
+            x_prev = x
+    else:
+        text_width = metrics.text_width(value, size)
+        if quadding == 1:
+            x = (width - text_width) / 2
+        elif quadding == 2:
+            x = width - PADDING - text_width
+        else:
+            x = PADDING
+        ops.append(f"{round(max(x, PADDING), 2):g} {baseline:g} Td ({_escape(value)}) Tj")
+
+    content = (f"/Tx BMC\nq\n{PADDING - 1} {PADDING - 1} {width - 2 * PADDING + 2:g} {height - 2 * PADDING + 2:g} re W n\n"
+               "BT\n" + "\n".join(ops) + "\nET\nQ\nEMC")
+    return Appearance(content, (0, 0, round(width, 3), round(height, 3)), font_name)
+
+
+# ---------------------------------------------------------------------------
+#   pdfrw
+# ---------------------------------------------------------------------------
+
+_pdfrw_fonts = {} # id(font dict) -> (font dict, FontMetrics, encoding), skips re-reading /Widths per field
+
+
+def _pdfrw_font(font) -> tuple[FontMetrics, dict[str, int]]:
+    cached = _pdfrw_fonts.get(id(font))
+    if cached is not None and cached[0] is font:
+        return cached[1], cached[2]
+    base_font = str(font.BaseFont or "/Helvetica")[1:]
+    widths = font.Widths
+    if widths and font.FirstChar is not None:
+        metrics = font_metrics(base_font, int(font.FirstChar), tuple(float(w) for w in widths))
+    else:
+        metrics = font_metrics(base_font)
+    encoding = font.Encoding
+    if isinstance(encoding, PdfDict):
+        base = encoding.BaseEncoding
+        differences = tuple(int(item) if item.isdigit() else item[1:] for item in encoding.Differences or ())
+        encoding = font_encoding(base[1:] if base else None, differences)
+    else:
+        encoding = font_encoding(encoding[1:] if encoding else None)
+    if len(_pdfrw_fonts) > 256:
+        _pdfrw_fonts.clear()
+    _pdfrw_fonts[id(font)] = (font, metrics, encoding)
+    return metrics, encoding
+
+
+_XOBJECT, _FORM = PdfName.XObject, PdfName.Form
+
+
+def set_appearance(annot, value: str, form) -> bool:
+    """
+    Give a pdfrw text widget a freshly generated /AP /N stream
+    :param annot: the widget
+    :param value: the text that was filled in
+    :param form: the AcroForm (default appearance and font resources)
+    :return: False if the font of the field could not be found or cannot encode the value
+    """
+    field = annot.inheritable
+    da = field.DA or (form.DA if form is not None else None)
+    da = da.to_unicode() if da else ""
+    font_name, _, _ = parse_da(da)
+    fonts = form.DR.Font if form is not None and form.DR else None
+    font = fonts[PdfName(font_name)] if fonts else None
+    if font is None:
+        return False
+    metrics, encoding = _pdfrw_font(font)
+    text = encode_text(value, encoding)
+    if text is None:
+        return False
+
+    comb = int(field.MaxLen or 0) if int(field.Ff or 0) & COMB_FLAG else 0
+    appearance = build_appearance(text, annot.Rect, da, metrics,
+                                  quadding=int(field.Q or 0), comb_cells=comb)
+
+    stream = PdfDict(Type=_XOBJECT, Subtype=_FORM, BBox=PdfArray(appearance.bbox),
+                     Resources=PdfDict(Font=PdfDict({PdfName(appearance.font_name): font})))
+    stream.stream = appearance.content
+    stream.indirect = True
+    annot.AP = PdfDict(N=stream)
+    return True
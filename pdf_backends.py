@@ -0,0 +1,259 @@
+"""
+One form-filling interface over the two pdf libraries used in this project.
+
+Both backends treat appearances the same way: a filled text widget gets an
+appearance stream from pdf_appearance, or with appearances=False loses its stale
+one and the AcroForm gets /NeedAppearances, so the output of either backend
+renders the same.
+
+    backend = get_backend("pypdf")("example.pdf")
+    backend.fill_text("1_BSN", "123456789")
+    backend.set_checkbox("Ja")
+    backend.save("filled.pdf")
+"""
+
+import io
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+from pdfrw import PdfName, PdfString
+from pypdf import PdfWriter
+from pypdf.generic import (ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject,
+                           NameObject, TextStringObject)
+
+import pdf_appearance
+import pdf_form
+
+
+@dataclass
+class FormField:
+    name: str   # partial field name (/T) for text fields, "on" state for checkboxes
+    kind: str   # "text" or "checkbox"
+    value: str | None = None
+
+
+class FormBackend(ABC):
+    """
+    Interface every backend implements. Text fields are addressed by their partial
+    name (/T), checkboxes by the appearance state that ticks them, like pdf_form does.
+    """
+    name = None
+
+    def __init__(self, path: str, incremental: bool = True, appearances: bool = True):
+        self.path = path
+        self.incremental = incremental
+        self.appearances = appearances
+
+    @abstractmethod
+    def fields(self) -> list[FormField]:
+        ...
+
+    @abstractmethod
+    def fill_text(self, name: str, value: str) -> int:
+        """
+        :return: number of widgets that were filled
+        """
+
+    @abstractmethod
+    def set_checkbox(self, label: str) -> int:
+        """
+        :return: number of checkboxes that were ticked
+        """
+
+    @abstractmethod
+    def save(self, output=None):
+        """
+        :param output: file name or binary file object, None to get the pdf as bytes
+        :return: the pdf as bytes if output is None
+        """
+
+    def fill(self, data: dict[str, any]):
+        """
+        Fill a data dict in the format of fill_pdf_document.collect_pdf_user_data
+        """
+        for key, value in data.items():
+            if not key.startswith("TICK_"):
+                self.fill_text(key, str(value))
+        if "TICK_2A_JA" in data:
+            self.set_checkbox(pdf_form.TICK_2A_YES if data["TICK_2A_JA"] else pdf_form.TICK_2A_NO)
+        if "TICK_2B_JA" in data:
+            self.set_checkbox(pdf_form.TICK_2B_YES if data["TICK_2B_JA"] else pdf_form.TICK_2B_NO)
+
+
+# ----------------------------------------------------------------------
+# pdfrw
+# ----------------------------------------------------------------------
+class PdfrwBackend(FormBackend):
+    name = "pdfrw"
+
+    def __init__(self, path: str, incremental: bool = True, appearances: bool = True):
+        super().__init__(path, incremental, appearances)
+        self._template = pdf_form.FormTemplate(path)
+        self._text = {}
+        self._checkboxes = []
+        for annot in pdf_form.iter_widgets(self._template.pdf):
+            key = pdf_form.field_name(annot)
+            if key is not None:
+                self._text.setdefault(key, []).append(annot)
+            else:
+                self._checkboxes.append(annot)
+
+    def fields(self) -> list[FormField]:
+        result = [FormField(key, "text", annots[0].V and annots[0].V.to_unicode())
+                  for key, annots in self._text.items()]
+        for annot in self._checkboxes:
+            for state in (annot.AP.N.keys() if annot.AP and annot.AP.N else ()):
+                if state != PdfName.Off:
+                    result.append(FormField(state[1:], "checkbox", annot.AS))
+        return result
+
+    def fill_text(self, name: str, value: str) -> int:
+        form = pdf_form.acroform(self._template.pdf)
+        annots = self._text.get(name, [])
+        for annot in annots:
+            annot.V = PdfString.encode(value)
+            if not (self.appearances and pdf_appearance.set_appearance(annot, value, form)):
+                annot.AP = None
+                self._need_appearances()
+            self._template.changed.append(annot)
+        return len(annots)
+
+    def set_checkbox(self, label: str) -> int:
+        ticked = [annot for annot in self._checkboxes if pdf_form.set_checkbox(annot, label)]
+        self._template.changed.extend(ticked)
+        return len(ticked)
+
+    def _need_appearances(self):
+        form = pdf_form.mark_need_appearances(self._template.pdf)
+        if form is not None:
+            self._template.changed.append(form)
+
+    def save(self, output=None):
+        return self._template.save(output, incremental=self.incremental)
+
+
+# ----------------------------------------------------------------------
+# pypdf
+# ----------------------------------------------------------------------
+class PypdfBackend(FormBackend):
+    name = "pypdf"
+
+    def __init__(self, path: str, incremental: bool = True, appearances: bool = True):
+        super().__init__(path, incremental, appearances)
+        self._writer = PdfWriter(path, incremental=incremental)
+        self._text = {}
+        self._checkboxes = []
+        for page in self._writer.pages:
+            for ref in page.get("/Annots") or []:
+                annot = ref.get_object()
+                if annot.get("/Subtype") != "/Widget":
+                    continue
+                if "/T" in annot:
+                    self._text.setdefault(str(annot["/T"]), []).append(annot)
+                else:
+                    self._checkboxes.append(annot)
+
+    def fields(self) -> list[FormField]:
+        result = [FormField(key, "text", annots[0].get("/V")) for key, annots in self._text.items()]
+        for annot in self._checkboxes:
+            states = annot.get("/AP", {}).get("/N", {})
+            for state in states.keys():
+                if state != "/Off":
+                    result.append(FormField(state[1:], "checkbox", annot.get("/AS")))
+        return result
+
+    def fill_text(self, name: str, value: str) -> int:
+        annots = self._text.get(name, [])
+        for annot in annots:
+            annot[NameObject("/V")] = TextStringObject(value)
+            if not (self.appearances and self._set_appearance(annot, value)):
+                annot.pop("/AP", None)
+                self._writer.set_need_appearances_writer(True)
+        return len(annots)
+
+    @staticmethod
+    def _encoding(font) -> dict[str, int]:
+        encoding = font.get("/Encoding")
+        encoding = encoding.get_object() if encoding is not None else None
+        if isinstance(encoding, DictionaryObject):
+            base = encoding.get("/BaseEncoding")
+            differences = tuple(int(item) if isinstance(item, int) else str(item)[1:]
+                                for item in encoding.get("/Differences", ()))
+            return pdf_appearance.font_encoding(str(base)[1:] if base else None, differences)
+        return pdf_appearance.font_encoding(str(encoding)[1:] if encoding else None)
+
+    def _set_appearance(self, annot, value: str) -> bool:
+        form = self._writer.root_object.get("/AcroForm", {})
+        field, da, flags, max_len, quadding = annot, None, 0, 0, 0
+        while field is not None:
+            # inheritable field attributes, nearest one wins
+            da = da or field.get("/DA")
+            flags = flags or field.get("/Ff", 0)
+            max_len = max_len or field.get("/MaxLen", 0)
+            quadding = quadding or field.get("/Q", 0)
+            field = field.get("/Parent")
+            field = field.get_object() if field is not None else None
+        da = str(da or form.get("/DA", ""))
+        font_name, _, _ = pdf_appearance.parse_da(da)
+        fonts = form.get("/DR", {}).get("/Font", {})
+        if "/" + font_name not in fonts:
+            return False
+
+        font_ref = fonts.raw_get("/" + font_name)
+        font = font_ref.get_object()
+        base_font = str(font.get("/BaseFont", "/Helvetica"))[1:]
+        if "/Widths" in font and "/FirstChar" in font:
+            metrics = pdf_appearance.font_metrics(base_font, int(font["/FirstChar"]),
+                                                  tuple(float(w) for w in font["/Widths"]))
+        else:
+            metrics = pdf_appearance.font_metrics(base_font)
+        text = pdf_appearance.encode_text(value, self._encoding(font))
+        if text is None:
+            return False # the font cannot show the value, leave it to the viewer
+        comb = int(max_len) if int(flags) & pdf_appearance.COMB_FLAG else 0
+        appearance = pdf_appearance.build_appearance(text, annot["/Rect"], da, metrics,
+                                                     quadding=int(quadding), comb_cells=comb)
+
+        stream = DecodedStreamObject()
+        stream.set_data(appearance.content.encode("latin-1"))
+        stream.update({
+            NameObject("/Type"): NameObject("/XObject"),
+            NameObject("/Subtype"): NameObject("/Form"),
+            NameObject("/BBox"): ArrayObject(FloatObject(v) for v in appearance.bbox),
+            NameObject("/Resources"): DictionaryObject({
+                NameObject("/Font"): DictionaryObject({NameObject("/" + appearance.font_name): font_ref})}),
+        })
+        # streams must be indirect objects; pypdf has no public call for that (pinned in requirements.txt)
+        annot[NameObject("/AP")] = DictionaryObject({NameObject("/N"): self._writer._add_object(stream)})
+        return True
+
+    def set_checkbox(self, label: str) -> int:
+        state = NameObject("/" + label)
+        ticked = 0
+        for annot in self._checkboxes:
+            if state in annot.get("/AP", {}).get("/N", {}):
+                annot[NameObject("/AS")] = state
+                annot[NameObject("/V")] = state
+                ticked += 1
+        return ticked
+
+    def save(self, output=None):
+        if output is None:
+            buffer = io.BytesIO()
+            self._writer.write(buffer)
+            return buffer.getvalue()
+        self._writer.write(output)
+
+
+# ---------------------------------------------------------------------------
+#   Registry
+# ---------------------------------------------------------------------------
+
+BACKENDS = {backend.name: backend for backend in (PdfrwBackend, PypdfBackend)}
+
+
+def get_backend(name: str) -> type[FormBackend]:
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown pdf backend {name!r}, choose from {sorted(BACKENDS)}")
@@ -0,0 +1,236 @@
+import io
+
+from pdfrw import PdfReader, PdfWriter, PdfName, PdfObject, PdfString
+
+import pdf_appearance
+import pdf_incremental
+import pdf_lazy
+
+# ---------------------------------------------------------------------------
+#   Checkbox appearance labels of the LH0082Z form
+# ---------------------------------------------------------------------------
+
+TICK_2A_YES = "Ja. Vul de datum in vanaf wanneer."
+TICK_2A_NO = "Nee. Vul de datum in vanaf wanneer niet of niet meer, en ga daarna verder met vraag 3."
+TICK_2B_YES = "Ja"
+TICK_2B_NO = "Nee"
+
+# Keys touched by filling, used to reset a template between records
+_FILL_KEYS = (PdfName.V, PdfName.AS, PdfName.AP)
+_ACROFORM_KEYS = (PdfName.NeedAppearances,)
+
+
+# ----------------------------------------------------------------------
+# Helpers
+# ----------------------------------------------------------------------
+def load_template(path: str) -> PdfReader:
+    return PdfReader(path)
+
+
+def acroform(pdf: PdfReader):
+    return pdf.Root.AcroForm if pdf.Root else None
+
+
+def mark_need_appearances(pdf: PdfReader):
+    """
+    Ask viewers to regenerate field appearances
+    :return: the changed AcroForm, or None if the document has none
+    """
+    form = acroform(pdf)
+    if form is not None:
+        form.NeedAppearances = PdfObject("true")
+    return form
+
+
+def iter_widgets(pdf: PdfReader):
+    """
+    Yield every widget annotation of the document. The AcroForm field tree is
+    walked rather than the pages, so a lazily loaded pdf never parses a page.
+    :param pdf: parsed pdf (PdfReader or pdf_lazy.LazyPdf)
+    :return: generator of widget annotations
+    """
+    form = acroform(pdf)
+    if form is not None and form.Fields is not None:
+        seen = set()
+        stack = list(reversed(form.Fields))
+        while stack:
+            node = stack.pop()
+            if node is None or id(node) in seen:
+                continue
+            seen.add(id(node))
+            if node.Kids:
+                stack.extend(reversed(node.Kids))
+            elif node.Subtype == PdfName.Widget:
+                yield node
+        return
+
+    for page in pdf.pages:
+        annots = page.Annots
+        if not annots:
+            continue
+        for annot in annots:
+            if annot.Subtype == PdfName.Widget:
+                yield annot
+
+
+def set_checkbox(annot, want_label: str) -> bool:
+    """
+    Tick a checkbox by the name of its appearance state
+    :param annot: checkbox widget
+    :param want_label: appearance state to switch to
+    :return: True if the checkbox has that state
+    """
+    ap = annot.get("/AP")
+    if not ap or "/N" not in ap:
+        return False
+
+    normal_states = ap["/N"].keys()
+    label = PdfName(want_label)
+    if label in normal_states:
+        annot.AS = label
+        annot.V = label
+        return True
+    return False
+
+
+def field_name(annot) -> str | None:
+    if not annot.T:
+        return None
+    return annot.T.to_unicode().strip("()")
+
+
+# ---------------------------------------------------------------------------
+#   Filling
+# ---------------------------------------------------------------------------
+
+def fill_template(pdf: PdfReader, data: dict[str, any], verbose: bool = True,
+                  appearances: bool = True) -> list:
+    """
+    Fill the form fields of a parsed pdf in place
+    :param pdf: parsed pdf, e.g. from load_template
+    :param data: field name -> value, plus the TICK_2A_JA / TICK_2B_JA flags
+    :param verbose: print every field that is set
+    :param appearances: generate appearance streams for filled text fields, instead of
+                        leaving them to the viewer (/NeedAppearances)
+    :return: the changed objects (widgets and, if appearances are left to the viewer, the AcroForm)
+    """
+    changed = []
+    need_appearances = False
+    form = acroform(pdf)
+    for annot in iter_widgets(pdf):
+        # 1) text fields (have a /T key)
+        key = field_name(annot)
+        if key is not None:
+            if key in data:
+                value = str(data[key])
+                if verbose:
+                    print(f"Setting field '{key}' to '{value}'")
+                annot.V = PdfString.encode(value)
+                if not (appearances and pdf_appearance.set_appearance(annot, value, form)):
+                    annot.AP = None
+                    need_appearances = True
+                changed.append(annot)
+            continue
+
+        # 2) checkbox fields – matched by appearance label
+        ticked = False
+        if "TICK_2A_JA" in data:
+            ticked |= set_checkbox(annot, TICK_2A_YES if data["TICK_2A_JA"] else TICK_2A_NO)
+        if "TICK_2B_JA" in data:
+            ticked |= set_checkbox(annot, TICK_2B_YES if data["TICK_2B_JA"] else TICK_2B_NO)
+        if ticked:
+            if verbose:
+                print(f"Ticked checkbox with label: {annot.AS}")
+            changed.append(annot)
+
+    # cleared appearances have to be regenerated by the viewer
+    if need_appearances and mark_need_appearances(pdf) is not None:
+        changed.append(form)
+    return changed
+
+
+class FormTemplate:
+    """
+    A form that is parsed once and then filled many times.
+
+    Instead of re-parsing (or deep-copying) the document per record, the
+    original state of every widget is remembered and put back before the
+    next fill, so a "clone" only costs as much as the number of widgets.
+    """
+
+    def __init__(self, path: str, lazy: bool = False):
+        """
+        :param path: the blank form
+        :param lazy: memory-map the file and only parse the objects the form fields need
+                     (pdf_lazy), instead of reading the whole document
+        """
+        self.path = path
+        if lazy:
+            self.pdf = pdf_lazy.LazyPdf(path)
+            self.source = self.pdf.source
+        else:
+            with open(path, "rb") as f:
+                self.source = f.read()
+            self.pdf = PdfReader(fdata=self.source)
+        self.changed = []
+
+        form = acroform(self.pdf)
+        touched = [(annot, _FILL_KEYS) for annot in iter_widgets(self.pdf)]
+        if form is not None:
+            touched.append((form, _ACROFORM_KEYS))
+        self._pristine = [(obj, [(key, obj.get(key)) for key in keys]) for obj, keys in touched]
+
+    def close(self):
+        """Unmap and close the file of a lazy template, a no-op otherwise"""
+        if isinstance(self.pdf, pdf_lazy.LazyPdf):
+            self.pdf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def reset(self):
+        for obj, values in self._pristine:
+            for key, value in values:
+                obj[key] = value
+        self.changed = []
+
+    def fill(self, data: dict[str, any], verbose: bool = False, appearances: bool = True) -> list:
+        """
+        Reset the template and fill it with a new record
+        :return: the objects that were changed
+        """
+        self.reset()
+        self.changed = fill_template(self.pdf, data, verbose=verbose, appearances=appearances)
+        return self.changed
+
+    def save(self, output=None, incremental: bool = True):
+        """
+        Write the filled form
+        :param output: file name or binary file object, None to get the pdf as bytes
+        :param incremental: append only the changed objects to the template instead
+                            of serializing the whole document again
+        :return: the pdf as bytes if output is None
+        """
+        if incremental:
+            try:
+                result = pdf_incremental.write_incremental(self.source, self.pdf, self.changed, output)
+                return result if output is None else None
+            except ValueError as e:
+                print(f"[WARN] No incremental update ({e}), saving the whole document")
+        if output is None:
+            buffer = io.BytesIO()
+            PdfWriter().write(buffer, self.pdf)
+            return buffer.getvalue()
+        PdfWriter().write(output, self.pdf)
+
+
+def fill_to_bytes(path: str, data: dict[str, any], incremental: bool = True, lazy: bool = False) -> bytes:
+    """
+    Fill a form and return the result in memory, no output file needed
+    """
+    with FormTemplate(path, lazy=lazy and incremental) as template:
+        template.fill(data)
+        return template.save(incremental=incremental)
@@ -0,0 +1,214 @@
+"""
+Incremental-update writing for pdfrw documents.
+
+Instead of serializing the whole document again, only the changed objects are
+appended to the original file bytes, followed by a new cross-reference section
+that points back (/Prev) to the original one. Everything that was not touched
+stays byte-for-byte what it was in the template.
+"""
+
+import io
+import re
+
+from pdfrw import PdfArray, PdfDict
+from pdfrw.objects.pdfindirect import PdfIndirect
+
+_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+
+
+# ----------------------------------------------------------------------
+# Serialization
+# ----------------------------------------------------------------------
+class _Serializer:
+    """
+    Formats pdfrw objects without resolving untouched references.
+
+    Objects with an (objnum, gennum) tuple in .indirect are written as references,
+    objects with indirect=True are new and get an object number from next_number.
+    """
+
+    def __init__(self, next_number: int):
+        self.next_number = next_number
+        self.numbers = {} # id(obj) -> (objnum, gennum) of new indirect objects
+        self.queue = []   # new indirect objects that still need to be written
+
+    def ref(self, obj) -> tuple[int, int]:
+        indirect = getattr(obj, "indirect", False)
+        if isinstance(indirect, tuple):
+            return int(indirect[0]), int(indirect[1])
+        key = self.numbers.get(id(obj))
+        if key is None:
+            key = self.numbers[id(obj)] = (self.next_number, 0)
+            self.next_number += 1
+            self.queue.append(obj)
+        return key
+
+    def format(self, obj, top: bool = False) -> str:
+        if isinstance(obj, PdfIndirect):
+            return "%d %d R" % (int(obj[0]), int(obj[1]))
+        if not top and getattr(obj, "indirect", False):
+            return "%d %d R" % self.ref(obj)
+        if isinstance(obj, PdfDict):
+            # raw items: referenced objects are not loaded just to be written as "n g R"
+            items = [(key, value) for key, value in dict.items(obj) if value is not None]
+            stream = obj.stream
+            if stream is not None:
+                items = [(k, v) for k, v in items if k != "/Length"] + [("/Length", str(len(stream)))]
+            body = "<<" + "".join(f"{_encoded(key)} {self.format(value)}" for key, value in items) + ">>"
+            if stream is not None:
+                body += f"\nstream\n{stream}\nendstream"
+            return body
+        if isinstance(obj, PdfArray):
+            return "[" + " ".join(self.format(value) for value in list.__iter__(obj)) + "]"
+        if obj is None:
+            return "null"
+        if isinstance(obj, bool):
+            return "true" if obj else "false"
+        if isinstance(obj, float):
+            return ("%.4f" % obj).rstrip("0").rstrip(".")
+        return _encoded(obj)
+
+
+def _encoded(obj) -> str:
+    # names with spaces or delimiters carry their escaped #xx form in .encoded
+    return str(getattr(obj, "encoded", None) or obj)
+
+
+def _previous_xref(source) -> int:
+    matches = _STARTXREF.findall(source[-2048:])
+    if not matches:
+        raise ValueError("No startxref found at the end of the source pdf")
+    return int(matches[-1])
+
+
+def _subsections(numbers: list[int]) -> list[tuple[int, int]]:
+    """Group sorted object numbers into (first, count) runs."""
+    runs = []
+    for num in numbers:
+        if runs and runs[-1][0] + runs[-1][1] == num:
+            runs[-1][1] += 1
+        else:
+            runs.append([num, 1])
+    return [(first, count) for first, count in runs]
+
+
+def _is_indirect(obj) -> bool:
+    return isinstance(getattr(obj, "indirect", False), tuple)
+
+
+def _with_containers(trailer, objects) -> list:
+    """
+    Replace every direct object (an AcroForm inside the catalog, a widget inside
+    an /Annots or /Kids array) by the nearest indirect object that holds it.
+    Only what is already loaded is walked, starting at /Root.
+    :raises ValueError: if a direct object cannot be found below /Root
+    """
+    wanted = {id(obj) for obj in objects if not _is_indirect(obj)}
+    if not wanted:
+        return list(objects)
+    holders = {}
+    seen = set()
+    stack = [(trailer.Root, None)]
+    while stack and len(holders) < len(wanted):
+        node, holder = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if _is_indirect(node):
+            holder = node
+        elif id(node) in wanted:
+            holders[id(node)] = holder
+        values = dict.values(node) if isinstance(node, PdfDict) else list.__iter__(node)
+        stack.extend((value, holder) for value in values if isinstance(value, (PdfDict, PdfArray)))
+    missing = wanted - holders.keys()
+    if missing:
+        raise ValueError(f"{len(missing)} changed direct objects are not below /Root, "
+                         "they cannot be written as an incremental update")
+    return [holders.get(id(obj), obj) for obj in objects]
+
+
+# ---------------------------------------------------------------------------
+#   INCREMENTAL UPDATE
+# ---------------------------------------------------------------------------
+
+def build_update(source, trailer, objects) -> bytes:
+    """
+    Serialize the update section to append to source
+    :param source: bytes (or mmap) of the original pdf
+    :param trailer: the pdfrw PdfReader the objects came from (Root, Info, ID, Size)
+    :param objects: changed objects; existing ones keep their object number, direct
+                    ones are written as part of the indirect object that holds them
+    :return: the bytes to append after source
+    :raises ValueError: if the update cannot be written, a full save is needed instead
+    """
+    prev = _previous_xref(source)
+    serializer = _Serializer(int(trailer.Size))
+    base = len(source)
+    out = io.BytesIO()
+    if source[-1:] != b"\n":
+        out.write(b"\n")
+
+    offsets = {}
+    pending = _with_containers(trailer, objects)
+    while pending or serializer.queue:
+        obj = pending.pop(0) if pending else serializer.queue.pop(0)
+        num, gen = serializer.ref(obj)
+        if num in offsets:
+            continue
+        offsets[num] = (base + out.tell(), gen)
+        body = serializer.format(obj, top=True)
+        out.write(f"{num} {gen} obj\n{body}\nendobj\n".encode("latin-1"))
+
+    trailer_items = {"/Root": trailer.Root, "/Info": trailer.Info, "/ID": trailer.ID}
+    trailer_body = "".join(f"{key} {serializer.format(value)}"
+                           for key, value in trailer_items.items() if value is not None)
+
+    if bytes(source[prev:prev + 4]) == b"xref":
+        # classic cross-reference table after a classic table
+        size = serializer.next_number
+        xref_at = base + out.tell()
+        out.write(b"xref\n")
+        for first, count in _subsections(sorted(offsets)):
+            out.write(f"{first} {count}\n".encode())
+            for num in range(first, first + count):
+                out.write(b"%010d %05d n \n" % offsets[num])
+        out.write(f"trailer\n<</Size {size}{trailer_body}/Prev {prev}>>\n".encode("latin-1"))
+    else:
+        # a cross-reference stream must follow a cross-reference stream
+        xref_num = serializer.next_number
+        size = xref_num + 1
+        xref_at = base + out.tell()
+        offsets[xref_num] = (xref_at, 0)
+        numbers = sorted(offsets)
+        data = b"".join(b"\x01" + offsets[num][0].to_bytes(4, "big") + offsets[num][1].to_bytes(2, "big")
+                        for num in numbers)
+        index = " ".join(f"{first} {count}" for first, count in _subsections(numbers))
+        header = (f"{xref_num} 0 obj\n<</Type/XRef/Size {size}/Index[{index}]/W[1 4 2]"
+                  f"{trailer_body}/Prev {prev}/Length {len(data)}>>\nstream\n")
+        out.write(header.encode("latin-1") + data + b"\nendstream\nendobj\n")
+
+    out.write(f"startxref\n{xref_at}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def write_incremental(source, trailer, objects, output=None):
+    """
+    Write source plus an incremental update containing only the changed objects
+    :param source: bytes (or mmap) of the original pdf
+    :param trailer: the pdfrw PdfReader the objects came from
+    :param objects: changed objects, e.g. from pdf_form.fill_template
+    :param output: file name or binary file object; None returns the bytes instead
+    :return: the complete pdf as bytes if output is None, else the number of bytes written
+    :raises ValueError: if no update can be built, nothing is written then
+    """
+    update = build_update(source, trailer, objects)
+    if output is None:
+        return bytes(source) + update
+    if hasattr(output, "write"):
+        output.write(source)
+        output.write(update)
+    else:
+        with open(output, "wb") as f:
+            f.write(source)
+            f.write(update)
+    return len(source) + len(update)
@@ -0,0 +1,323 @@
+"""
+Memory-mapped, lazily parsed pdf for filling large form templates.
+
+pdfrw's PdfReader reads the whole file, loads every object stream and walks
+every page before the first field can be filled. LazyPdf only parses the
+cross-reference sections up front; an object is parsed the first time it is
+accessed, straight out of the memory map. Filling walks the AcroForm field
+tree, so only the fields, their fonts and the objects on that path are ever
+parsed. Combined with pdf_incremental, everything else goes to the output
+as the original, unparsed bytes.
+
+LazyPdf produces ordinary pdfrw objects, so pdf_form, pdf_appearance and
+pdf_incremental work on it unchanged.
+"""
+
+import mmap
+import re
+import zlib
+
+from pdfrw import PdfArray, PdfDict, PdfName
+from pdfrw.errors import PdfParseError
+from pdfrw.objects.pdfindirect import PdfIndirect
+from pdfrw.tokens import PdfTokens
+
+_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+_XREF_SUBSECTION = re.compile(rb"\s*(\d+)\s+(\d+)\s*[\r\n]")
+_HEAD_WINDOW = 4096   # bytes tokenized for an object header, grown until the header fits
+
+
+# ----------------------------------------------------------------------
+# Stream decoding
+# ----------------------------------------------------------------------
+def _unpredict_png(data: bytes, columns: int) -> bytes:
+    """Undo the PNG row predictors (/Predictor 10..15) used by xref streams."""
+    rows = []
+    prev = bytearray(columns)
+    for start in range(0, len(data), columns + 1):
+        kind, row = data[start], bytearray(data[start + 1:start + 1 + columns])
+        for i in range(len(row)):
+            left = row[i - 1] if i else 0
+            up = prev[i]
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif kind == 3:
+                row[i] = (row[i] + (left + up) // 2) & 0xFF
+            elif kind == 4:
+                upleft = prev[i - 1] if i else 0
+                p = left + up - upleft
+                pa, pb, pc = abs(p - left), abs(p - up), abs(p - upleft)
+                row[i] = (row[i] + (left if pa <= pb and pa <= pc else up if pb <= pc else upleft)) & 0xFF
+        rows.append(bytes(row))
+        prev = row
+    return b"".join(rows)
+
+
+def _decode(obj, raw: bytes) -> bytes:
+    filters = obj.Filter
+    if filters is None:
+        return raw
+    if not isinstance(filters, PdfArray):
+        filters = [filters]
+    if list(filters) != [PdfName.FlateDecode]:
+        raise PdfParseError(f"Unsupported filter {filters} in object stream")
+    data = zlib.decompress(raw)
+    params = obj.DecodeParms
+    if isinstance(params, PdfArray):
+        params = params[0]
+    if params and int(params.Predictor or 1) >= 10:
+        data = _unpredict_png(data, int(params.Columns or 1))
+    return data
+
+
+# ---------------------------------------------------------------------------
+#   LAZY PDF
+# ---------------------------------------------------------------------------
+
+class LazyPdf(PdfDict):
+    """
+    A pdf trailer (Root, Info, ID, Size) whose objects are loaded on access.
+
+    Use it like a PdfReader: pdf.Root.AcroForm.Fields, pdf_form.fill_template(pdf, ...).
+    Keep it open while the filled result is being written, the original bytes
+    are taken from the memory map.
+    """
+
+    def __init__(self, path: str):
+        private = self.private
+        private.path = path
+        private._file = open(path, "rb")
+        private.source = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        private.xref = {}        # objnum -> (1, offset, gen) or (2, objstm num, index)
+        private.objects = {}     # (objnum, gen) -> PdfIndirect, resolved on access
+        private.object_streams = {} # objstm num -> (decoded data, {objnum: offset})
+        private._pages = None
+
+        trailer = self._read_xref_chain()
+        for key in (PdfName.Root, PdfName.Info, PdfName.ID, PdfName.Size):
+            # raw values: /Info is only parsed if somebody asks for it
+            value = dict.get(trailer, key)
+            if value is not None:
+                self[key] = value
+
+    def close(self):
+        self.source.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def pages(self) -> list:
+        """The page list, only walked when asked for (filling does not need it)."""
+        if self._pages is None:
+            pages = []
+            stack = [self.Root.Pages]
+            while stack:
+                node = stack.pop()
+                if node.Type == PdfName.Pages:
+                    stack.extend(reversed(node.Kids))
+                else:
+                    pages.append(node)
+            self.private._pages = pages
+        return self._pages
+
+    # ------------------------------------------------------------------
+    # Parsing
+    # ------------------------------------------------------------------
+    def _reference(self, num, gen) -> PdfIndirect:
+        key = (int(num), int(gen))
+        ref = self.objects.get(key)
+        if ref is None:
+            ref = self.objects[key] = PdfIndirect(key)
+            ref._loader = self._load
+        return ref
+
+    def _read_value(self, source):
+        tok = source.next()
+        if tok == "<<":
+            return self._read_dict(source)
+        if tok == "[":
+            return self._read_array(source)
+        return tok
+
+    def _read_dict(self, source) -> PdfDict:
+        result = PdfDict()
+        tok = source.next()
+        while tok != ">>":
+            key = tok
+            value = source.next()
+            if value == "<<":
+                value = self._read_dict(source)
+                tok = source.next()
+            elif value == "[":
+                value = self._read_array(source)
+                tok = source.next()
+            else:
+                tok = source.next()
+                if value.isdigit() and tok.isdigit():
+                    if source.next() != "R":
+                        source.exception("Expected indirect reference")
+                    value = self._reference(value, tok)
+                    tok = source.next()
+            result[key] = value
+        return result
+
+    def _read_array(self, source) -> PdfArray:
+        result = []
+        for tok in source:
+            if tok == "]":
+                break
+            if tok == "<<":
+                tok = self._read_dict(source)
+            elif tok == "[":
+                tok = self._read_array(source)
+            elif tok == "R":
+                gen, num = result.pop(), result.pop()
+                tok = self._reference(num, gen)
+            result.append(tok)
+        return PdfArray(result)
+
+    def _parse_at(self, offset: int):
+        """Parse the indirect object starting at offset, including its stream."""
+        mm = self.source
+        window = _HEAD_WINDOW
+        while True:
+            head = mm[offset:offset + window].decode("latin-1")
+            complete = offset + window >= len(mm)
+            try:
+                key, obj, keyword, (kw_start, kw_end) = self._parse_head(head)
+                if complete or kw_end < len(head):
+                    break
+            except (PdfParseError, RuntimeError):
+                # the header runs past the window (RuntimeError: the tokens ran out)
+                if complete:
+                    raise
+            window *= 4
+        if keyword == "stream" and isinstance(obj, PdfDict):
+            start = offset + kw_start + len(b"stream")
+            start += 2 if mm[start:start + 2] == b"\r\n" else 1
+            length = obj.Length
+            length = int(length.real_value() if isinstance(length, PdfIndirect) else length)
+            obj._stream = mm[start:start + length].decode("latin-1")
+        return key, obj
+
+    def _parse_head(self, head: str):
+        """
+        Tokenize "num gen obj <value>" and the keyword after the value.
+
+        Only a "stream" token right after the value starts the stream data, so
+        "stream" or "endobj" inside a string value does not cut the header short.
+
+        :return: (num, gen), the value, the keyword after it and the keyword's span in head
+        """
+        source = PdfTokens(head, 0, False)
+        num, gen, tok = source.next(), source.next(), source.next()
+        if tok != "obj":
+            raise PdfParseError(f"Expected object {num} {gen}")
+        obj = self._read_value(source)
+        try:
+            keyword = source.next()
+        except RuntimeError:
+            return (int(num), int(gen)), obj, None, (len(head), len(head))
+        return (int(num), int(gen)), obj, keyword, source.current[0]
+
+    def _load(self, ref: PdfIndirect):
+        num, gen = ref
+        entry = self.xref.get(num)
+        if entry is None or entry[0] == 0:
+            return None
+        if entry[0] == 1:
+            key, obj = self._parse_at(entry[1])
+        else:
+            key, obj = (num, 0), self._from_object_stream(entry[1], num)
+        if isinstance(obj, (PdfDict, PdfArray)):
+            obj.indirect = key
+        return obj
+
+    def _from_object_stream(self, stream_num: int, num: int):
+        cached = self.object_streams.get(stream_num)
+        if cached is None:
+            stream = self._reference(stream_num, 0).real_value()
+            data = _decode(stream, stream.stream.encode("latin-1")).decode("latin-1")
+            header = PdfTokens(data, 0, False)
+            first = int(stream.First)
+            offsets = {}
+            for _ in range(int(stream.N)):
+                objnum = int(header.next())
+                offsets[objnum] = first + int(header.next())
+            cached = self.object_streams[stream_num] = (data, offsets)
+        data, offsets = cached
+        return self._read_value(PdfTokens(data, offsets[num], False))
+
+    # ------------------------------------------------------------------
+    # Cross-reference sections
+    # ------------------------------------------------------------------
+    def _read_xref_chain(self) -> PdfDict:
+        mm = self.source
+        matches = _STARTXREF.findall(mm[-2048:])
+        if not matches:
+            raise PdfParseError(f"No startxref found in {self.path}")
+        offset = int(matches[-1])
+        newest = None
+        seen = set()
+        while offset is not None and offset not in seen:
+            seen.add(offset)
+            if mm[offset:offset + 4] == b"xref":
+                trailer = self._read_xref_table(offset)
+                if trailer.XRefStm is not None:
+                    # hybrid file: the xref stream holds the compressed objects
+                    self._read_xref_stream(int(trailer.XRefStm))
+            else:
+                trailer = self._read_xref_stream(offset)
+            newest = newest or trailer
+            offset = int(trailer.Prev) if trailer.Prev is not None else None
+        return newest
+
+    def _read_xref_table(self, offset: int) -> PdfDict:
+        mm = self.source
+        pos = offset + 4
+        trailer_at = mm.find(b"trailer", pos)
+        while True:
+            match = _XREF_SUBSECTION.match(mm, pos)
+            if match is None or match.start() >= trailer_at:
+                break
+            first, count = int(match.group(1)), int(match.group(2))
+            pos = match.end()
+            while mm[pos:pos + 1] in b" \r\n":
+                pos += 1
+            for i in range(count):
+                entry = mm[pos:pos + 20]
+                if entry[17:18] == b"n":
+                    self.xref.setdefault(first + i, (1, int(entry[:10]), int(entry[11:16])))
+                else:
+                    self.xref.setdefault(first + i, (0, 0, 0))
+                pos += 20
+        source = PdfTokens(mm[trailer_at + 7:trailer_at + 7 + 4096].decode("latin-1"), 0, False)
+        if source.next() != "<<":
+            raise PdfParseError("Expected trailer dictionary")
+        return self._read_dict(source)
+
+    def _read_xref_stream(self, offset: int) -> PdfDict:
+        _, obj = self._parse_at(offset)
+        data = _decode(obj, obj.stream.encode("latin-1"))
+        widths = [int(w) for w in obj.W]
+        row = sum(widths)
+        index = [int(i) for i in (obj.Index or [0, obj.Size])]
+        pos = 0
+        for first, count in zip(index[::2], index[1::2]):
+            for num in range(first, first + count):
+                fields = []
+                for width in widths:
+                    fields.append(int.from_bytes(data[pos:pos + width], "big") if width else None)
+                    pos += width
+                kind = 1 if fields[0] is None else fields[0]
+                self.xref.setdefault(num, (kind, fields[1] or 0, fields[2] or 0))
+        if pos > len(data) or row == 0:
+            raise PdfParseError("Truncated cross-reference stream")
+        return obj
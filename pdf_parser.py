@@ -1,28 +1,17 @@
-from pypdf import PdfReader, PdfWriter
-from pypdf.generic import NameObject, BooleanObject
+from pypdf import PdfWriter
 
-reader = PdfReader("example.pdf")
-writer = PdfWriter()
+# incremental=True keeps the original bytes and only appends the changed objects
+writer = PdfWriter("example.pdf", incremental=True)
 
 updated_data = {
     "Naam": "John Doe"
 }
 
-page = reader.pages[0]
-writer.add_page(page)
-
 # Update form field values
-writer.update_page_form_field_values(writer.pages[0], updated_data)
+writer.update_page_form_field_values(writer.pages[0], updated_data, auto_regenerate=False)
 
-# Copy over AcroForm and set NeedAppearances to True
-acro_form = reader.trailer["/Root"].get("/AcroForm")
-if acro_form:
-    acro_form.update({
-        NameObject("/NeedAppearances"): BooleanObject(True)
-    })
-    writer._root_object.update({
-        NameObject("/AcroForm"): acro_form
-    })
+# Set NeedAppearances to True on the AcroForm
+writer.set_need_appearances_writer(True)
 
 # Save to output
 with open("output.pdf", "wb") as f:
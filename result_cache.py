@@ -0,0 +1,235 @@
+"""
+Persistent cache for results of deterministic online calculators.
+
+The toeslagen Proefberekening gives the same answer for the same year and
+answers, so a result is stored under a hash of the canonical form of the input:
+keys sorted, amounts rounded to cents, digit strings as numbers, dates as ISO
+dates, text stripped and case-folded. "850", 850 and 850.001 are one entry, and
+so are "05" and 5.
+
+Entries expire per calculation year: the rules of a past year no longer change,
+those of the current year can (TTL_BY_YEAR). Storage is a SQLite file, so
+entries and the hit/miss counters survive between runs:
+
+    python result_cache.py stats
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+
+# ---------------------------------------------------------------------------
+#   Configurations
+# ---------------------------------------------------------------------------
+
+CACHE_PATH = os.path.join("data", "result_cache.sqlite")
+DAY = 86400
+CURRENT_YEAR_TTL = 1 * DAY      # rules and rates of the running year may still be corrected
+PAST_YEAR_TTL = 180 * DAY       # a closed year is final
+TTL_BY_YEAR: Dict[int, float] = {}  # overrides per calculation year, in seconds
+
+_DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%d.%m.%Y")
+_WHITESPACE = re.compile(r"\s+")
+
+
+# ----------------------------------------------------------------------
+# Canonical input
+# ----------------------------------------------------------------------
+def _canonical_text(text: str):
+    text = _WHITESPACE.sub(" ", text.strip())
+    if re.fullmatch(r"[+-]?\d+", text):
+        return int(text)
+    amount = re.fullmatch(r"[+-]?\d+[.,]\d+", text)
+    if amount:
+        return canonical(float(text.replace(",", ".")))
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return text.casefold()
+
+
+def canonical(value: Any) -> Any:
+    """
+    Normalized, JSON-serializable form of an input value
+    """
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        rounded = round(float(value), 2)
+        return int(rounded) if rounded.is_integer() else rounded
+    if isinstance(value, str):
+        return _canonical_text(value)
+    if isinstance(value, (datetime, date)):
+        return (value.date() if isinstance(value, datetime) else value).isoformat()
+    if isinstance(value, dict):
+        return {str(k): canonical(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple)):
+        return [canonical(v) for v in value]
+    return _canonical_text(str(value))
+
+
+def cache_key(namespace: str, data: Dict[str, Any]) -> str:
+    """
+    :param namespace: the calculator, with a version to invalidate entries when its form code changes
+    """
+    payload = json.dumps([namespace, canonical(data)], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def ttl_for_year(year: Optional[int]) -> float:
+    if year in TTL_BY_YEAR:
+        return TTL_BY_YEAR[year]
+    if year is not None and int(year) < date.today().year:
+        return PAST_YEAR_TTL
+    return CURRENT_YEAR_TTL
+
+
+# ---------------------------------------------------------------------------
+#   CACHE
+# ---------------------------------------------------------------------------
+
+class ResultCache:
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY, namespace TEXT NOT NULL, year INTEGER,
+                value TEXT NOT NULL, created REAL NOT NULL, expires REAL NOT NULL, hits INTEGER DEFAULT 0);
+            CREATE TABLE IF NOT EXISTS counters (
+                namespace TEXT PRIMARY KEY, hits INTEGER DEFAULT 0, misses INTEGER DEFAULT 0,
+                expired INTEGER DEFAULT 0, stores INTEGER DEFAULT 0);
+        """)
+
+    def _count(self, namespace: str, counter: str):
+        self._db.execute("INSERT OR IGNORE INTO counters (namespace) VALUES (?)", (namespace,))
+        self._db.execute(f"UPDATE counters SET {counter} = {counter} + 1 WHERE namespace = ?", (namespace,))
+
+    def get(self, namespace: str, data: Dict[str, Any]) -> Optional[Any]:
+        """
+        :return: the stored result, None on a miss or an expired entry
+        """
+        key = cache_key(namespace, data)
+        with self._lock, self._db:
+            row = self._db.execute("SELECT value, expires FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count(namespace, "misses")
+                return None
+            if row[1] < time.time():
+                self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._count(namespace, "expired")
+                self._count(namespace, "misses")
+                return None
+            self._db.execute("UPDATE results SET hits = hits + 1 WHERE key = ?", (key,))
+            self._count(namespace, "hits")
+        return json.loads(row[0])
+
+    def put(self, namespace: str, data: Dict[str, Any], value: Any, year: Optional[int] = None,
+            ttl: Optional[float] = None):
+        """
+        :param year: calculation year, decides the TTL unless ttl is given
+        """
+        now = time.time()
+        expires = now + (ttl if ttl is not None else ttl_for_year(year))
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO results (key, namespace, year, value, created, expires) "
+                             "VALUES (?, ?, ?, ?, ?, ?)",
+                             (cache_key(namespace, data), namespace, year, json.dumps(value), now, expires))
+            self._count(namespace, "stores")
+
+    def purge(self) -> int:
+        """
+        Delete expired entries
+        :return: number of deleted entries
+        """
+        with self._lock, self._db:
+            return self._db.execute("DELETE FROM results WHERE expires < ?", (time.time(),)).rowcount
+
+    def clear(self, namespace: Optional[str] = None):
+        with self._lock, self._db:
+            if namespace is None:
+                self._db.execute("DELETE FROM results")
+                self._db.execute("DELETE FROM counters")
+            else:
+                self._db.execute("DELETE FROM results WHERE namespace = ?", (namespace,))
+                self._db.execute("DELETE FROM counters WHERE namespace = ?", (namespace,))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per namespace: hits, misses, expired, stores, hit_rate, live entries and
+        how often the average live entry was reused
+        """
+        with self._lock:
+            counters = self._db.execute("SELECT namespace, hits, misses, expired, stores FROM counters").fetchall()
+            entries = dict((namespace, (count, reuse)) for namespace, count, reuse in self._db.execute(
+                "SELECT namespace, COUNT(*), AVG(hits) FROM results WHERE expires >= ? GROUP BY namespace",
+                (time.time(),)))
+        result = {}
+        for namespace, hits, misses, expired, stores in counters:
+            count, reuse = entries.get(namespace, (0, None))
+            lookups = hits + misses
+            result[namespace] = {"hits": hits, "misses": misses, "expired": expired, "stores": stores,
+                                 "hit_rate": hits / lookups if lookups else 0.0,
+                                 "entries": count, "avg_reuse": reuse or 0.0}
+        return result
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache(path: str = CACHE_PATH) -> ResultCache:
+    """
+    The process-wide cache, opened on first use
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None or _cache.path != path:
+            _cache = ResultCache(path)
+        return _cache
+
+
+# ---------------------------------------------------------------------------
+#   MAIN
+# ---------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect the calculator result cache.")
+    parser.add_argument("command", choices=["stats", "purge", "clear"])
+    parser.add_argument("--path", default=CACHE_PATH)
+    parser.add_argument("--namespace", help="only this calculator (clear)")
+    args = parser.parse_args(argv)
+
+    cache = ResultCache(args.path)
+    if args.command == "purge":
+        print(f"Deleted {cache.purge()} expired entries")
+    elif args.command == "clear":
+        cache.clear(args.namespace)
+        print("Cache cleared")
+    else:
+        stats = cache.stats()
+        if not stats:
+            print("No lookups yet")
+        for namespace, s in stats.items():
+            print(f"{namespace}: {s['hit_rate']:.1%} hit rate ({s['hits']} hits, {s['misses']} misses, "
+                  f"{s['expired']} expired), {s['entries']} entries reused {s['avg_reuse']:.1f}x on average")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,25 @@
-import time
 import util
 from typing import Dict, Optional, Tuple, Any
 import action_chain
+import browser_profile
+import driver_pool
+import form_fill
+import huurtoeslag_rules
+import result_cache
+import tracing
+import voice_util
 from voice_util import say
 import sys
 
 from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from googletrans import Translator
 
-# Fix for macOS
-if sys.platform == 'darwin':
-    from webdriver_manager.chrome import ChromeDriverManager
-else:
-    # Translater.translate seems to not be async on macOS? only import asyncio on other platforms
+# Translater.translate seems to not be async on macOS? only import asyncio on other platforms
+if sys.platform != 'darwin':
     import asyncio
 
 
@@ -31,8 +32,13 @@ TOESLAGEN_URL = (
     "content/hulpmiddel-proefberekening-toeslagen"
 )
 
-CHROME_HEADLESS = False
+BROWSER_PROFILE = "light" # see browser_profile.PROFILES, "full" shows the window and loads everything
 aDEFAULT_TIMEOUT = 15
+USE_LOCAL_RULES = True # refuse locally when a published limit already rules the benefit out
+USE_RESULT_CACHE = True
+CACHE_NAMESPACE = "toeslagen/v1" # bump when the form filling changes what is calculated
+CALCULATION_ERROR = "An error occurred while calculating result. Please try again later."
+BULK_FILL = True # fill the form with one injected script, False for one WebDriver call per field
 
 action_chain = action_chain.ActionChain()
 
@@ -158,218 +164,139 @@ def safe_select_by_value(sel: Select, value: Any):
         sel.select_by_visible_text(val)
 
 
-def fill_date(driver, prefix_id: str, date_tuple: Tuple[str, str, str]):
-    day, month, year = date_tuple
-    driver.find_element(By.ID, f"{prefix_id}-1").send_keys(day)
-    driver.find_element(By.ID, f"{prefix_id}-2").send_keys(month)
-    driver.find_element(By.ID, f"{prefix_id}-3").send_keys(year)
-
-def click_yes_no(wait: WebDriverWait, field_name: str,flag: bool):
-    suffix   = "True" if flag else "False"           
-    label_for = f"{field_name}_{suffix}"             
-    locator  = (By.XPATH, f"//label[@for='{label_for}']")
-    lbl      = wait.until(EC.element_to_be_clickable(locator))
-    lbl.click()
-
 # ---------------------------------------------------------------------------
 #   MAIN FORM FILLER
 # ---------------------------------------------------------------------------
 
-def fill_form(driver: webdriver.Chrome, data: Dict[str, Any]):
-    wait = WebDriverWait(driver, aDEFAULT_TIMEOUT)
+def _money(amount) -> str:
+    return f"{amount:.2f}".replace('.', ',')
 
-    # 0) Year --------------------------------------------------------------
-    try: 
-        safe_select_by_value(Select(wait.until(EC.presence_of_element_located((By.ID, "V1-1_pbt")))), data["year"])
-    except Exception as e:
-        print(f"[WARN] Year selection failed: {e}")
 
-    # only Huurtoeslag checked
-    try: 
-        huur = driver.find_element(By.ID, "V1-3_pbt_1")
-        if not huur.is_selected():
-            huur.click()
-    except Exception as e:
-        print(f"[WARN] Huurtoeslag checkbox selection failed: {e}")
+def _date_steps(prefix_id: str, date_tuple, description: str) -> list[form_fill.FieldStep]:
+    return [form_fill.FieldStep(form_fill.TEXT, f"{prefix_id}-{part}", str(value), description)
+            for part, value in enumerate(date_tuple, start=1)]
 
-    # 1) Partner ----------------------------------------------------------
-    try:
-        click_yes_no(wait, "V2-1_pbt", data["has_partner"])
-    except Exception as e:
-        print(f"[WARN] Partner selection failed: {e}")
 
-    # 2) Applicant birthday & country ------------------------------------
-    try:
-        fill_date(driver, "V2-3_pbt", (data["birth_day"], data["birth_month"], data["birth_year"]))
-    except Exception as e:
-        print(f"[WARN] Applicant birthday selection failed: {e}")
+def _yes_no(field_name: str, flag: bool, description: str) -> form_fill.FieldStep:
+    return form_fill.FieldStep(form_fill.CLICK_LABEL, f"{field_name}_{'True' if flag else 'False'}", None, description)
 
-    try:
-        safe_select_by_value(Select(driver.find_element(By.ID, "V2-11_pbt")), data["country"])
-    except Exception as e:
-        print(f"[WARN] Applicant country selection failed: {e}")
 
-    # 3) Applicant income --------------------------------------------------
-    try:
-        driver.find_element(By.ID, "V3-10_pbt").send_keys(data["annual_income"])
-    except Exception as e:
-        print(f"[WARN] Applicant income entry failed: {e}")
+def form_plan(data: Dict[str, Any]) -> list[form_fill.FieldStep]:
+    """
+    Every field of the calculator to fill for the answers in data, in page order
+    """
+    Step = form_fill.FieldStep
+    steps = [
+        # 0) Year, only Huurtoeslag checked
+        Step(form_fill.SELECT, "V1-1_pbt", str(data["year"]), "Year selection"),
+        Step(form_fill.CHECK, "V1-3_pbt_1", True, "Huurtoeslag checkbox selection"),
+        # 1) Partner
+        _yes_no("V2-1_pbt", data["has_partner"], "Partner selection"),
+        # 2) Applicant birthday & country
+        *_date_steps("V2-3_pbt", (data["birth_day"], data["birth_month"], data["birth_year"]),
+                     "Applicant birthday selection"),
+        Step(form_fill.SELECT, "V2-11_pbt", str(data["country"]), "Applicant country selection"),
+        # 3) Applicant income
+        Step(form_fill.TEXT, "V3-10_pbt", str(data["annual_income"]), "Applicant income entry"),
+    ]
 
-    # 4) Partner section ---------------------------------------------------
+    # 4) Partner section
     if data["has_partner"]:
-        try:
-            fill_date(driver, "V4-2_pbt", (data["partner_birth_day"], data["partner_birth_month"], data["partner_birth_year"]))
-        except Exception as e:
-            print(f"[WARN] Partner birthday selection failed: {e}")
-        try:
-            click_yes_no(wait, "V4-3_pbt", data["same_address"])
-        except Exception as e:
-            print(f"[WARN] Partner same address selection failed: {e}")
-        
+        steps += _date_steps("V4-2_pbt", (data["partner_birth_day"], data["partner_birth_month"],
+                                          data["partner_birth_year"]), "Partner birthday selection")
+        steps.append(_yes_no("V4-3_pbt", data["same_address"], "Partner same address selection"))
         if data["same_address"]:
-            try:
-                driver.find_element(By.ID, "V4-25_pbt").send_keys(data["partner_income"])
-            except Exception as e:
-                print(f"[WARN] Partner income entry failed: {e}")
+            steps.append(Step(form_fill.TEXT, "V4-25_pbt", str(data["partner_income"]), "Partner income entry"))
         else:
-            try:
-                safe_select_by_value(Select(driver.find_element(By.ID, "V4-4_pbt")), data["partner_country"])
-            except Exception as e:
-                print(f"[WARN] Partner country selection failed: {e}")
+            steps.append(Step(form_fill.SELECT, "V4-4_pbt", str(data["partner_country"]),
+                              "Partner country selection"))
 
-    # 5) Children ----------------------------------------------------------
-    try:
-        click_yes_no(wait, "V6-1_pbt", data["has_children"])
-    except Exception as e:
-        print(f"[WARN] Children selection failed: {e}")
-    
+    # 5) Children
+    steps.append(_yes_no("V6-1_pbt", data["has_children"], "Children selection"))
     if data["has_children"]:
-        try:
-            click_yes_no(wait, "V6-3_pbt", data["co_parent"])
-        except Exception as e:
-            print(f"[WARN] Co-parent selection failed: {e}")
-        try:
-            Select(driver.find_element(By.ID, "V6-4_pbt")).select_by_value(str(data["num_children"]))
-        except Exception as e:
-            print(f"[WARN] Children number selection failed: {e}")
-
+        steps.append(_yes_no("V6-3_pbt", data["co_parent"], "Co-parent selection"))
+        steps.append(Step(form_fill.SELECT, "V6-4_pbt", str(data["num_children"]), "Children number selection"))
         for idx, bday in enumerate(data["children_birthdays"], start=1):
-            try:
-                fill_date(driver, f"V6-5-{idx}_pbt", bday)
-            except Exception as e:
-                print(f"[WARN] Child birthday selection failed: {e}")
-            try:
-                wait_click(wait, (By.ID, f"V6-13-{idx}_pbt_0"))
-            except Exception as e:
-                print(f"[WARN] Child co-parent selection failed: {e}")
-            try:
-                wait_click(wait, (By.ID, f"V6-14-{idx}_pbt_False"))
-            except Exception as e:
-                print(f"[WARN] Child living situation selection failed: {e}")
-            try:
-                driver.find_element(By.ID, f"V6-15-{idx}_pbt").send_keys("0")
-            except Exception as e:
-                print(f"[WARN] Child income entry failed: {e}")
-
-    # 6) Housemates --------------------------------------------------------
-    try:
-        click_yes_no(wait, "V9-1_pbt", data["has_housemates"])
-    except Exception as e:
-        print(f"[WARN] Housemates selection failed: {e}")
-    
+            steps += _date_steps(f"V6-5-{idx}_pbt", bday, "Child birthday selection")
+            steps.append(Step(form_fill.CLICK, f"V6-13-{idx}_pbt_0", None, "Child co-parent selection"))
+            steps.append(Step(form_fill.CLICK, f"V6-14-{idx}_pbt_False", None, "Child living situation selection"))
+            steps.append(Step(form_fill.TEXT, f"V6-15-{idx}_pbt", "0", "Child income entry"))
+
+    # 6) Housemates
+    steps.append(_yes_no("V9-1_pbt", data["has_housemates"], "Housemates selection"))
     if data["has_housemates"]:
-        try:
-            Select(driver.find_element(By.ID, "V9-2_pbt")).select_by_value(str(data["num_housemates"]))
-        except Exception as e:
-            print(f"[WARN] Housemates number selection failed: {e}")
-        
+        steps.append(Step(form_fill.SELECT, "V9-2_pbt", str(data["num_housemates"]), "Housemates number selection"))
         for idx, (bday, inc) in enumerate(zip(data["housemate_birthdays"], data["housemate_incomes"]), start=1):
-            try:
-                fill_date(driver, f"V9-3-{idx}_pbt", bday)
-            except Exception as e:
-                print(f"[WARN] Housemate birthday selection failed: {e}")
-            try:
-                driver.find_element(By.ID, f"V9-4-{idx}_pbt").send_keys(inc)
-            except Exception as e:
-                print(f"[WARN] Housemate income entry failed: {e}")
-
-    # 7) Room / shared housing -------------------------------------------
-    try:
-        click_yes_no(wait, "V10-1_pbt", data["lives_in_room"])
-    except Exception as e:
-        print(f"[WARN] Room living situation selection failed: {e}")
-    
-    if data["lives_in_room"]:
-        try:
-            click_yes_no(wait, "V10-3_pbt", data["room_eligible_for_rent_allowance"])
-        except Exception as e:
-            print(f"[WARN] Room rent allowance eligibility selection failed: {e}")
-    
-    # 8) Group housing for elderly / begeleid wonen -------------------
-    try:
-        click_yes_no(wait, "V10-2_pbt", data["lives_in_group_housing"])
-    except Exception as e:
-        print(f"[WARN] Group housing selection failed: {e}")
+            steps += _date_steps(f"V9-3-{idx}_pbt", bday, "Housemate birthday selection")
+            steps.append(Step(form_fill.TEXT, f"V9-4-{idx}_pbt", str(inc), "Housemate income entry"))
 
-    # 9) Handicap modifications ------------------------------------------
-    try:
-        click_yes_no(wait, "V10-5_pbt", data["disability_adjusted_home"])
-    except Exception as e:
-        print(f"[WARN] Handicap modifications selection failed: {e}")
+    # 7) Room / shared housing
+    steps.append(_yes_no("V10-1_pbt", data["lives_in_room"], "Room living situation selection"))
+    if data["lives_in_room"]:
+        steps.append(_yes_no("V10-3_pbt", data["room_eligible_for_rent_allowance"],
+                             "Room rent allowance eligibility selection"))
 
-    # 10) Rent & Service costs --------------------------------------------
-    try:
-        rent_str = f"{data['basic_rent']:.2f}".replace('.', ',')
-        driver.find_element(By.ID, "V10-10_pbt").send_keys(rent_str)
-    except Exception as e:
-        print(f"[WARN] Basic rent entry failed: {e}")
+    # 8) Group housing for elderly / begeleid wonen
+    steps.append(_yes_no("V10-2_pbt", data["lives_in_group_housing"], "Group housing selection"))
 
-    try:
-        click_yes_no(wait, "V10-11_pbt", data["pays_service_costs"])
-    except Exception as e:
-        print(f"[WARN] Service costs selection failed: {e}")
+    # 9) Handicap modifications
+    steps.append(_yes_no("V10-5_pbt", data["disability_adjusted_home"], "Handicap modifications selection"))
 
+    # 10) Rent & Service costs
+    steps.append(Step(form_fill.TEXT, "V10-10_pbt", _money(data["basic_rent"]), "Basic rent entry"))
+    steps.append(_yes_no("V10-11_pbt", data["pays_service_costs"], "Service costs selection"))
     if data["pays_service_costs"]:
-        try:
-            energy_str = f"{data['service_energy']:.2f}".replace('.', ',')
-            driver.find_element(By.ID, "V10-12-1_pbt").send_keys(energy_str)
-        except Exception as e:
-            print(f"[WARN] Service energy entry failed: {e}")
-        
-        try:
-            cleaning_str = f"{data['service_cleaning']:.2f}".replace('.', ',')
-            driver.find_element(By.ID, "V10-12-2_pbt").send_keys(cleaning_str)
-        except Exception as e:
-            print(f"[WARN] Service cleaning entry failed: {e}")
+        for part, key in enumerate(("energy", "cleaning", "janitor", "recreation"), start=1):
+            steps.append(Step(form_fill.TEXT, f"V10-12-{part}_pbt", _money(data[f"service_{key}"]),
+                              f"Service {key} entry"))
+
+    # 11) Savings
+    steps.append(_yes_no("V11-3_pbt", data["high_savings"], "Savings selection"))
+    return steps
+
+
+def fill_step(driver: webdriver.Chrome, wait: WebDriverWait, step: form_fill.FieldStep):
+    """
+    Apply one step of the plan with regular WebDriver calls, waiting for the element
+    """
+    if step.kind == form_fill.SELECT:
+        safe_select_by_value(Select(wait.until(EC.presence_of_element_located((By.ID, step.target)))), step.value)
+    elif step.kind == form_fill.TEXT:
+        field = wait.until(EC.visibility_of_element_located((By.ID, step.target)))
+        field.clear()
+        field.send_keys(step.value)
+    elif step.kind == form_fill.CHECK:
+        box = wait.until(EC.presence_of_element_located((By.ID, step.target)))
+        if box.is_selected() != step.value:
+            box.click()
+    elif step.kind == form_fill.CLICK_LABEL:
+        wait_click(wait, (By.XPATH, f"//label[@for='{step.target}']"))
+    else:
+        wait_click(wait, (By.ID, step.target))
 
-        try:
-            janitor_str = f"{data['service_janitor']:.2f}".replace('.', ',')
-            driver.find_element(By.ID, "V10-12-3_pbt").send_keys(janitor_str)
-        except Exception as e:
-            print(f"[WARN] Service janitor entry failed: {e}")
 
-        try:
-            recreation_str = f"{data['service_recreation']:.2f}".replace('.', ',')
-            driver.find_element(By.ID, "V10-12-4_pbt").send_keys(recreation_str)
-        except Exception as e:
-            print(f"[WARN] Service recreation entry failed: {e}")
+def fill_form(driver: webdriver.Chrome, data: Dict[str, Any]):
+    wait = WebDriverWait(driver, aDEFAULT_TIMEOUT)
 
-    # 11) Savings ---------------------------------------------------------
-    try:
-        click_yes_no(wait, "V11-3_pbt", data["high_savings"])
-    except Exception as e:
-        print(f"[WARN] Savings selection failed: {e}")
+    # 0-11) All answers in one script, field by field only where the script gets stuck
+    wait.until(EC.presence_of_element_located((By.ID, "V1-1_pbt")))
+    with tracing.span("form.fill", bulk=BULK_FILL) as span:
+        report = form_fill.apply_plan(driver, form_plan(data), lambda step: fill_step(driver, wait, step),
+                                      bulk=BULK_FILL)
+        span.set(fields=report.steps, scripts=report.scripts, fallbacks=report.fallbacks)
+    print(f"[DEBUG] {report}")
 
     # 12) Results ---------------------------------------------------------
     try:
-        wait_click(wait, (By.ID, "butResults_pbt"))
-        result_el = wait.until(EC.visibility_of_element_located((By.ID, "divResultTxt_pbt")))
+        with tracing.span("form.results"):
+            wait_click(wait, (By.ID, "butResults_pbt"))
+            result_el = wait.until(EC.visibility_of_element_located((By.ID, "divResultTxt_pbt")))
 
-        # Only first <p> tag contains the result
-        result_el = result_el.find_elements(By.TAG_NAME, 'p')[0]
+            # Only first <p> tag contains the result
+            result_el = result_el.find_elements(By.TAG_NAME, 'p')[0]
     except Exception as e:
         print(f"[ERROR] Result calculation failed: {e}")
-        return "An error occurred while calculating result. Please try again later."
+        return CALCULATION_ERROR
 
     return result_el.text.strip()
 
@@ -390,64 +317,79 @@ else:
 
 
 def run_calculation(data: Dict[str, Any]):
-    opts = Options()
-    if CHROME_HEADLESS:
-        opts.add_argument("--headless=new")
-    
-    # macOS fix again
-    if sys.platform == 'darwin':
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=opts)
-    else:
-        driver = webdriver.Chrome(options=opts)
+    with tracing.span("calculation", demo="toeslagen", year=data.get("year")):
+        return _run_calculation(data)
+
 
-    driver.set_window_size(1280, 1200)
+def _run_calculation(data: Dict[str, Any]):
+    # Only huurtoeslag is calculated: a savings, rent or age limit decides without the calculator
+    if USE_LOCAL_RULES:
+        try:
+            assessment = huurtoeslag_rules.assess(data)
+        except KeyError as e:
+            print(f"[WARN] No local rules for {e}")
+        else:
+            if assessment.exact and not assessment.eligible:
+                print(f"[DEBUG] Answered by the local rules {huurtoeslag_rules.RULES_VERSION}")
+                return assessment.answer()
+
+    # The calculation is deterministic per year and answers, check the cache before any browser is needed
+    cache = result_cache.get_cache() if USE_RESULT_CACHE else None
+    if cache is not None:
+        cached = cache.get(CACHE_NAMESPACE, data)
+        if cached is not None:
+            print("[DEBUG] Answer from the result cache")
+            return cached
 
     result: Optional[str] = None
-    try:
-        driver.get(TOESLAGEN_URL)
+    with driver_pool.get_pool(BROWSER_PROFILE).borrow() as driver:
+        browser_profile.navigate(driver, TOESLAGEN_URL, BROWSER_PROFILE)
         WebDriverWait(driver, aDEFAULT_TIMEOUT).until(
             EC.presence_of_element_located((By.ID, "V1-1_pbt"))
         )
-        result = fill_form(driver, data)
-
-        # Translater.translate seems to not be async on macOS?
-        if sys.platform == 'darwin':
-            result = translate_to_english(result)
-        else:
-            result = asyncio.run(translate_to_english(result))
+        result = dutch_result = fill_form(driver, data)
+    print("[DEBUG] Navigation timings:\n" + browser_profile.timing_report())
 
-    finally:
-        time.sleep(3)
-        driver.quit()
+    # Translater.translate seems to not be async on macOS?
+    if sys.platform == 'darwin':
+        result = translate_to_english(result)
+    else:
+        result = asyncio.run(translate_to_english(result))
 
+    if cache is not None and result and dutch_result != CALCULATION_ERROR:
+        cache.put(CACHE_NAMESPACE, data, result, year=data.get("year"))
     return result or "No result found. Please try again."
 
 # ---------------------------------------------------------------------------
 #   MAIN
 # ---------------------------------------------------------------------------
 
+# answers used by the demo instead of asking, and as the base of toeslagen_sweep
+EXAMPLE_DATA = {
+    "year": 2024,
+    "birth_day": "12",
+    "birth_month": "03",
+    "birth_year": "1990",
+    "country": "Nederland",
+    "basic_rent": 720,
+    "high_savings": False,
+    "has_partner": False,
+    "annual_income": 16000,
+    "monthly_rent": 720,
+    "has_children": False,
+    "has_housemates": False,
+    "lives_in_room": False,
+    "lives_in_group_housing": False,
+    "disability_adjusted_home": False,
+    "pays_service_costs": False,
+}
+
 if __name__ == "__main__":
     ########## Task 2: Visiting benefit calculator page ###########
+    voice_util.init() # health check and spaCy load while the welcome message plays
+    driver_pool.get_pool(BROWSER_PROFILE).warm() # Chrome starts while the user answers
     #user_data = collect_user_data()
-    user_data = {
-        "year": 2024,
-        "birth_day": "12",
-        "birth_month": "03",
-        "birth_year": "1990",
-        "country": "Nederland",
-        "basic_rent": 720,
-        "high_savings": False,
-        "has_partner": False,
-        "annual_income": 16000,
-        "monthly_rent": 720,
-        "has_children": False,
-        "has_housemates": False,
-        "lives_in_room": False,
-        "lives_in_group_housing": False,
-        "disability_adjusted_home": False,
-        "pays_service_costs": False,
-    }
+    user_data = dict(EXAMPLE_DATA)
     say("Please wait for the calculation...")
     result = run_calculation(user_data)
     say(result)
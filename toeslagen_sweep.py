@@ -0,0 +1,185 @@
+"""
+What-if sweeps for the toeslagen calculator: one base answer set, expanded over
+a grid of parameters, calculated concurrently.
+
+    rows = sweep(toeslagen.EXAMPLE_DATA, {"year": [2021, 2022, 2023, 2024, 2025],
+                                           "basic_rent": [700, 800, 900]}, workers=3)
+    print(format_table(rows))
+
+Answer sets that are the same after result_cache canonicalisation (e.g. rent
+"800" and 800.0) are calculated once. The runs share a driver pool grown to
+`workers` browsers, and every run goes through toeslagen.run_calculation, so
+answers already in the result cache need no browser at all.
+
+    python toeslagen_sweep.py --param year=2021,2022,2023,2024,2025 --param basic_rent=700,800,900
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import driver_pool
+import result_cache
+import toeslagen
+
+# ---------------------------------------------------------------------------
+#   Configurations
+# ---------------------------------------------------------------------------
+
+WORKERS = 3     # browsers running calculations at the same time
+
+_AMOUNT = re.compile(r"€\s?[\d.,]*\d")
+
+
+@dataclass
+class SweepRow:
+    params: Dict[str, Any]         # the grid values of this run
+    data: Dict[str, Any] = field(default_factory=dict, repr=False)  # the full answer set
+    result: Optional[str] = None
+    seconds: float = 0.0
+    error: Optional[str] = None
+    duplicates: List[Dict[str, Any]] = field(default_factory=list)  # grid points with the same answers
+
+    @property
+    def amount(self) -> Optional[str]:
+        """The first euro amount in the answer, e.g. '€ 2.345'"""
+        match = _AMOUNT.search(self.result or "")
+        return match.group(0) if match else None
+
+
+# ----------------------------------------------------------------------
+# Grid
+# ----------------------------------------------------------------------
+def expand(base: Dict[str, Any], grid: Dict[str, List[Any]]) -> List[tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Every combination of the grid values applied to the base answers
+    :return: (grid values, full answer set) per combination, in grid order
+    """
+    names = list(grid)
+    runs = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        params = dict(zip(names, values))
+        runs.append((params, {**base, **params}))
+    return runs
+
+
+def deduplicate(runs: List[tuple[Dict[str, Any], Dict[str, Any]]]) -> List[SweepRow]:
+    """
+    One row per distinct answer set, the other grid points that map to it listed as duplicates
+    """
+    rows: Dict[str, SweepRow] = {}
+    for params, data in runs:
+        key = result_cache.cache_key(toeslagen.CACHE_NAMESPACE, data)
+        if key in rows:
+            rows[key].duplicates.append(params)
+        else:
+            rows[key] = SweepRow(params, data)
+    return list(rows.values())
+
+
+# ---------------------------------------------------------------------------
+#   SWEEP
+# ---------------------------------------------------------------------------
+
+def _run(row: SweepRow) -> SweepRow:
+    start = time.perf_counter()
+    try:
+        row.result = toeslagen.run_calculation(dict(row.data))
+    except Exception as e:
+        row.error = str(e)
+        print(f"[WARN] Calculation for {row.params} failed: {e}")
+    row.seconds = time.perf_counter() - start
+    return row
+
+
+def sweep(base: Dict[str, Any], grid: Dict[str, List[Any]], workers: int = WORKERS) -> List[SweepRow]:
+    """
+    Calculate every grid point, at most `workers` at a time
+    :return: one row per distinct answer set, in grid order
+    """
+    runs = expand(base, grid)
+    rows = deduplicate(runs)
+    workers = max(1, min(workers, len(rows)))
+    print(f"[DEBUG] {len(runs)} grid points, {len(rows)} distinct answer sets, {workers} workers")
+    driver_pool.get_pool(toeslagen.BROWSER_PROFILE, size=workers).warm(workers)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sweep") as executor:
+        rows = list(executor.map(_run, rows))
+    print(f"[DEBUG] Sweep took {time.perf_counter() - start:.1f}s, "
+          f"{sum(row.seconds for row in rows):.1f}s of calculations")
+    return rows
+
+
+def format_table(rows: List[SweepRow]) -> str:
+    """
+    A fixed-width table: grid values, amount, seconds and the number of grid points it also answers
+    """
+    names = list(rows[0].params) if rows else []
+    header = names + ["amount", "seconds", "duplicates"]
+    lines = [[str(row.params[name]) for name in names]
+             + [row.amount or ("error" if row.error else "-"), f"{row.seconds:.1f}", str(len(row.duplicates))]
+             for row in rows]
+    widths = [max(len(cell) for cell in column) for column in zip(header, *lines)]
+    out = ["  ".join(cell.ljust(width) for cell, width in zip(header, widths)),
+           "  ".join("-" * width for width in widths)]
+    out += ["  ".join(cell.ljust(width) for cell, width in zip(line, widths)) for line in lines]
+    return "\n".join(out)
+
+
+def write_csv(rows: List[SweepRow], path: str):
+    names = list(rows[0].params) if rows else []
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(names + ["amount", "seconds", "result", "error"])
+        for row in rows:
+            writer.writerow([row.params[name] for name in names]
+                            + [row.amount, f"{row.seconds:.2f}", row.result, row.error])
+
+
+# ---------------------------------------------------------------------------
+#   MAIN
+# ---------------------------------------------------------------------------
+
+def _parse_value(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _parse_param(text: str) -> tuple[str, List[Any]]:
+    name, sep, values = text.partition("=")
+    if not sep or not values:
+        raise argparse.ArgumentTypeError(f"expected name=value,value,... got {text!r}")
+    return name.strip(), [_parse_value(value.strip()) for value in values.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the toeslagen calculation over a grid of answers.")
+    parser.add_argument("--base", help="JSON file with the base answers, defaults to toeslagen.EXAMPLE_DATA")
+    parser.add_argument("--param", type=_parse_param, action="append", required=True,
+                        help="name=value,value,... e.g. year=2021,2022 (repeatable)")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--csv", help="also write the rows with the full answers to this file")
+    args = parser.parse_args(argv)
+
+    base = toeslagen.EXAMPLE_DATA
+    if args.base:
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+    rows = sweep(base, dict(args.param), args.workers)
+    print(format_table(rows))
+    if args.csv:
+        write_csv(rows, args.csv)
+    return 0 if all(row.error is None for row in rows) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+"""
+Lightweight latency tracing for the voice demos.
+
+A span times one stage of a turn (speech synthesis, playback, listening,
+recognition, extraction, an LLM call, a browser step). Spans nest through a
+context variable, so a span opened inside another becomes its child without
+passing anything around, and every span carries the context attributes set
+around it: the session, the action index and the INPUT_TYPE of the question.
+
+    with tracing.context(action_index=2, input_type="NUMBER"):
+        with tracing.span("recognize"):
+            text = r.recognize_google(audio)
+
+Finished spans are buffered and appended to TRACE_PATH, one per line, either
+as plain JSON records (TRACE_FORMAT = "jsonl") or as OTLP/JSON
+ResourceSpans ("otlp"), the file format of the OpenTelemetry collector's file
+exporter. Sampling is decided per trace (a root span and everything below it)
+with SAMPLE_RATE; a trace that is not sampled costs two clock reads per span
+and is never serialized. Listeners see every finished span, sampled or not, so
+the latency metrics cover every turn whatever the rate. When TRACE_PATH grows
+past MAX_TRACE_BYTES it is rotated to TRACE_PATH.1 (.2, ... up to TRACE_BACKUPS).
+"""
+
+import atexit
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional
+
+# ---------------------------------------------------------------------------
+#   Configurations
+# ---------------------------------------------------------------------------
+
+TRACE_PATH = os.path.join("data", "traces.jsonl")
+TRACE_FORMAT = "jsonl"      # "jsonl" or "otlp"
+SAMPLE_RATE = 0.05          # share of traces written, 0 disables writing, 1 writes every turn
+FLUSH_EVERY = 64            # spans buffered before they are written
+MAX_TRACE_BYTES = 10 * 1024 * 1024  # TRACE_PATH is rotated when it grows past this
+TRACE_BACKUPS = 2           # rotated files kept: TRACE_PATH.1 (newest) .. TRACE_PATH.<TRACE_BACKUPS>
+SERVICE_NAME = "voice-assistant"
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    sampled: bool
+    start_ns: int                   # wall clock, for the file
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    duration_ns: int = 0
+    error: Optional[str] = None
+    _start_perf: int = 0
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration_ns / 1e6
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def as_record(self) -> dict:
+        record = {"name": self.name, "trace_id": self.trace_id, "span_id": self.span_id,
+                  "parent_id": self.parent_id, "start_ns": self.start_ns,
+                  "duration_ms": round(self.duration_ms, 3), "attributes": self.attributes}
+        if self.error is not None:
+            record["error"] = self.error
+        return record
+
+    def as_otlp(self) -> dict:
+        span = {"traceId": self.trace_id, "spanId": self.span_id, "name": self.name, "kind": 1,
+                "startTimeUnixNano": str(self.start_ns), "endTimeUnixNano": str(self.start_ns + self.duration_ns),
+                "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+                "status": {"code": 2, "message": self.error} if self.error is not None else {"code": 1}}
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+# ---------------------------------------------------------------------------
+#   Context
+# ---------------------------------------------------------------------------
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("tracing_span", default=None)
+_attributes: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("tracing_attributes", default={})
+_session_id = uuid.uuid4().hex[:16]
+
+
+def new_session() -> str:
+    """
+    Start a new session id for the spans that follow, e.g. per conversation
+    """
+    global _session_id
+    _session_id = uuid.uuid4().hex[:16]
+    return _session_id
+
+
+def session_id() -> str:
+    return _session_id
+
+
+@contextmanager
+def context(**attributes):
+    """
+    Attributes added to every span opened inside the block
+    """
+    token = _attributes.set({**_attributes.get(), **attributes})
+    try:
+        yield
+    finally:
+        _attributes.reset(token)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+# ---------------------------------------------------------------------------
+#   Spans
+# ---------------------------------------------------------------------------
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time the block as a span, a child of the span around it
+    """
+    parent = _current.get()
+    if parent is None:
+        trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+        sampled = SAMPLE_RATE >= 1 or (SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE)
+    else:
+        trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+    current = Span(name, trace_id, f"{random.getrandbits(64):016x}", parent_id, sampled, time.time_ns(),
+                   {"session": _session_id, **_attributes.get(), **attributes})
+    token = _current.set(current)
+    current._start_perf = time.perf_counter_ns()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration_ns = time.perf_counter_ns() - current._start_perf
+        _current.reset(token)
+        _finish(current)
+
+
+def traced(name: Optional[str] = None):
+    """
+    Decorator: run the function inside a span (default name: module.function)
+    """
+    def decorate(func: Callable) -> Callable:
+        span_name = name or f"{func.__module__}.{func.__name__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ---------------------------------------------------------------------------
+#   Export
+# ---------------------------------------------------------------------------
+
+_buffer: List[Span] = []
+_buffer_lock = threading.Lock()
+_write_lock = threading.Lock()   # one flush at a time, so rotating does not race a write
+_listeners: List[Callable[[Span], None]] = []
+
+
+def add_listener(listener: Callable[[Span], None]):
+    """
+    Call listener with every finished span, sampled or not
+    """
+    _listeners.append(listener)
+
+
+def remove_listener(listener: Callable[[Span], None]):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def _finish(finished: Span):
+    for listener in _listeners:
+        try:
+            listener(finished)
+        except Exception as e:
+            print(f"[WARN] Trace listener failed: {e}")
+    if not finished.sampled:
+        return
+    with _buffer_lock:
+        _buffer.append(finished)
+        full = len(_buffer) >= FLUSH_EVERY
+    # a finished root span ends a turn, write it while the user is not waiting
+    if full or finished.parent_id is None:
+        flush()
+
+
+def _rotate():
+    """
+    Move TRACE_PATH to TRACE_PATH.1 (and .1 to .2, ...) once it is MAX_TRACE_BYTES, the oldest is dropped
+    """
+    try:
+        if os.path.getsize(TRACE_PATH) < MAX_TRACE_BYTES:
+            return
+    except OSError:
+        return # no trace file yet
+    if TRACE_BACKUPS <= 0:
+        os.remove(TRACE_PATH)
+        return
+    for i in range(TRACE_BACKUPS - 1, 0, -1):
+        if os.path.exists(f"{TRACE_PATH}.{i}"):
+            os.replace(f"{TRACE_PATH}.{i}", f"{TRACE_PATH}.{i + 1}")
+    os.replace(TRACE_PATH, f"{TRACE_PATH}.1")
+
+
+def trace_files(path: str) -> List[str]:
+    """
+    The existing files of a trace path, oldest first: the rotated ones, then path itself
+    """
+    rotated = [f"{path}.{i}" for i in range(TRACE_BACKUPS, 0, -1)]
+    return [p for p in rotated + [path] if os.path.exists(p)]
+
+
+def flush():
+    """
+    Write the buffered spans to TRACE_PATH, rotating it first when it is full
+    """
+    with _buffer_lock:
+        spans = _buffer[:]
+        _buffer.clear()
+    if not spans:
+        return
+    if TRACE_FORMAT == "otlp":
+        lines = [json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [s.as_otlp() for s in spans]}]}]})]
+    else:
+        lines = [json.dumps(s.as_record(), default=str) for s in spans]
+    try:
+        if os.path.dirname(TRACE_PATH):
+            os.makedirs(os.path.dirname(TRACE_PATH), exist_ok=True)
+        with _write_lock:
+            _rotate()
+            with open(TRACE_PATH, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+    except OSError as e:
+        print(f"[WARN] Writing traces to {TRACE_PATH} failed: {e}")
+
+
+def configure(path: Optional[str] = None, fmt: Optional[str] = None, sample_rate: Optional[float] = None):
+    """
+    Change where and how often traces are written, flushing what is buffered first
+    """
+    global TRACE_PATH, TRACE_FORMAT, SAMPLE_RATE
+    flush()
+    if path is not None:
+        TRACE_PATH = path
+    if fmt is not None:
+        if fmt not in ("jsonl", "otlp"):
+            raise ValueError(f"Unknown trace format {fmt!r}, use 'jsonl' or 'otlp'")
+        TRACE_FORMAT = fmt
+    if sample_rate is not None:
+        SAMPLE_RATE = sample_rate
+
+
+atexit.register(flush)
+
+
+# ---------------------------------------------------------------------------
+#   MAIN
+# ---------------------------------------------------------------------------
+
+def read_spans(path: str) -> List[dict]:
+    """
+    Span records from a trace file in either format, as {"name", "duration_ms", "attributes"}
+    """
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "resourceSpans" not in entry:
+                records.append(entry)
+                continue
+            for resource in entry["resourceSpans"]:
+                for scope in resource.get("scopeSpans", []):
+                    for s in scope.get("spans", []):
+                        records.append({"name": s["name"],
+                                        "duration_ms": (int(s["endTimeUnixNano"]) - int(s["startTimeUnixNano"])) / 1e6,
+                                        "attributes": {a["key"]: next(iter(a["value"].values()))
+                                                       for a in s.get("attributes", [])}})
+    return records
+
+
+def main(argv=None):
+    import argparse
+    import statistics
+
+    parser = argparse.ArgumentParser(description="Summarize a trace file: time per stage.")
+    parser.add_argument("path", nargs="?", default=TRACE_PATH, help="trace file, its rotated files are read too")
+    parser.add_argument("--by", default=None, help="also group by this attribute, e.g. input_type")
+    args = parser.parse_args(argv)
+
+    groups: Dict[tuple, List[float]] = {}
+    records = [record for path in trace_files(args.path) for record in read_spans(path)]
+    if not records:
+        print(f"No spans in {args.path}, raise SAMPLE_RATE in tracing.py to record turns")
+        return
+    for record in records:
+        key = (record["name"], record["attributes"].get(args.by) if args.by else None)
+        groups.setdefault(key, []).append(record["duration_ms"])
+    print(f"{'span':<28} {args.by or '':<14} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'total s':>8}")
+    for (name, group), durations in sorted(groups.items(), key=lambda item: -sum(item[1])):
+        durations.sort()
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        print(f"{name:<28} {str(group or ''):<14} {len(durations):>6} {statistics.median(durations):>9.1f} "
+              f"{p95:>9.1f} {sum(durations) / 1000:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
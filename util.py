@@ -1,16 +1,44 @@
 from nameparser import HumanName
-import spacy
 from enum import Enum
 import re
 from dateutil.parser import parse as _parse_date
 import pycountry
 from word2number import w2n
 import voice_util as vu
+import metrics
+import tracing
 from rapidfuzz import process, fuzz
 import datetime
+import threading
 
 # TODO: download small English language model: python -m spacy download en_core_web_sm
-nlp = spacy.load("en_core_web_sm")
+SPACY_MODEL = "en_core_web_sm"
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+
+def nlp(text):
+    """
+    Run the spaCy pipeline on text. spaCy and its model are loaded on first use
+    (or by load_models() during voice_util.init), not when util is imported.
+    """
+    return load_models()(text)
+
+
+def load_models():
+    """
+    Load the spaCy model once, safe to call from several threads
+    :return: the spaCy pipeline
+    """
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                import spacy
+                with tracing.span("spacy.load", model=SPACY_MODEL):
+                    _nlp = spacy.load(SPACY_MODEL)
+    return _nlp
 
 '''
 Other categories spacey recognizes: 
@@ -47,6 +75,7 @@ class INPUT_TYPE(Enum):
     INITIALS = 10
     BSN = 11
     CONTAINER = 12
+    CONTAINERS = 13
 
     def format(self, data):
         match self:
@@ -64,6 +93,8 @@ class INPUT_TYPE(Enum):
             case INPUT_TYPE.BIRTHDATE:
                 date = datetime.date(data[2], data[1], data[0])
                 return date.strftime('%B %d %Y')
+            case INPUT_TYPE.CONTAINERS:
+                return join_spoken(data or [])
             case _:
                 return str(data)
 
@@ -167,23 +198,16 @@ def extract_number(text: str) -> int | None:
 
 def extract_yes_no(text: str) -> bool | None:
     categories = ["yes", "no"]
-    prompt = (
-        f"Which category from the list {categories} fits the sentence "
-        f"'{text}' best? Only reply with the matching category name."
-    )
-
-    # make the LLM request
-    llm_reply = vu.make_llm_request(prompt)
-    print(f"LLM categorized the input as: {llm_reply!r}")
 
-    # find which keyword appeared
-    choice = next((c for c in categories if c in llm_reply.lower()), None)
+    # make the LLM request, the reply is one of the categories or None when it fits neither
+    choice = vu.classify(text, categories)
+    print(f"LLM categorized the input as: {choice!r}")
     if choice == "yes":
         return True
     if choice == "no":
         return False
 
-    print(f"[Warning] Could not interpret yes/no from LLM reply: {llm_reply!r}")
+    print("[Warning] Could not interpret yes/no from the LLM reply")
     return None
 
 def extract_initials(text: str) -> str | None:
@@ -227,7 +251,61 @@ def extract_container(text):
         score_cutoff=80  # adjust threshold for strictness
     )
 
+def extract_containers(text: str) -> list[str] | None:
+    """Every container type mentioned in the answer, in the order they were said."""
+    types = [
+        "residual waste",
+        "glass",
+        "paper",
+        "textile collection",
+        "textile containers",
+        "organic waste",
+        "bread and pastry waste"
+    ]
+    text_lower = text.lower()
+    found = {}
+
+    # exact matches first, "bread and pastry waste" must not be split at "and"; the whole
+    # word is blanked, so the "s" of "papers" is not left over for the fuzzy pass
+    for t in types:
+        match = re.search(rf"\b{re.escape(t)}\w*", text_lower)
+        if match:
+            found[t] = match.start()
+            text_lower = text_lower[:match.start()] + " " * len(match.group()) + text_lower[match.end():]
+
+    # fuzzy match every remaining part of an enumeration
+    position = 0
+    for part in re.split(r"(,|\band\b|\bor\b|&)", text_lower):
+        letters = sum(c.isalpha() for c in part)
+        if letters >= 3 and part.strip() not in ("and", "or"):
+            result = process.extractOne(part.strip(), types, scorer=fuzz.WRatio, score_cutoff=80)
+            if result is not None and result[0] not in found:
+                found[result[0]] = position
+        position += len(part)
+
+    if not found:
+        print("[Warning] Could not recognize a container type.")
+        return None
+    return sorted(found, key=found.get)
+
+def join_spoken(items: list[str]) -> str:
+    """Join items for speech: 'a', 'a and b', 'a, b and c'."""
+    items = [str(item) for item in items]
+    if len(items) <= 1:
+        return "".join(items)
+    return ", ".join(items[:-1]) + " and " + items[-1]
+
 def extract(input_type, text):
+    name = getattr(input_type, "name", str(input_type))
+    with tracing.span("extract", extract_type=name):
+        result = _extract(input_type, text)
+    metrics.EXTRACTIONS.inc(input_type=name)
+    if result is None:
+        metrics.EXTRACTION_FAILURES.inc(input_type=name)
+    return result
+
+
+def _extract(input_type, text):
     match input_type:
         case INPUT_TYPE.FIRSTNAME:
             return extract_firstname(text)
@@ -253,4 +331,6 @@ def extract(input_type, text):
             return extract_bsn(text)
         case INPUT_TYPE.CONTAINER:
             return extract_container(text)
+        case INPUT_TYPE.CONTAINERS:
+            return extract_containers(text)
     return None
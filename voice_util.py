@@ -4,7 +4,14 @@ import os
 import requests
 import util
 import platform
+import metrics
+import tracing
+import threading
 import traceback
+from functools import lru_cache
+from typing import Literal
+
+from pydantic import ValidationError, create_model
 
 import sys
 
@@ -12,7 +19,7 @@ audio_player = "mpv"
 environment = "linux"
 
 ''' config for speech recognition '''
-r = sr.Recognizer()
+r = None # the shared sr.Recognizer, created on first use by _get_recognizer()
 pause_threshold_spelling = 2.0 # pauses between words when spelling
 pause_threshold_normal = 1.5 # pauses between words for normal sentences
 timeout = 5 # wait time until user speaks
@@ -23,53 +30,158 @@ language = 'en'
 ''' config for LLM '''
 MODEL_NAME = "google/gemma-3-1b"
 url = "http://localhost:1234/v1/chat/completions"
+health_url = "http://localhost:1234" # checked by init(), in the background
+health_timeout = 2
+llm_max_tokens = 24 # {"category": "..."} takes a handful of tokens, stop decoding after that
+llm_stop = ["\n"] # for replies without a schema
+llm_temperature = 0 # categorization is deterministic
+llm_structured = True # restrict replies to the categories with a JSON schema, False for free text
+llm_keep_alive = "30m" # Ollama: keep the model loaded between turns
+UNCLEAR = "unclear" # the reply for a sentence that fits none of the categories, classify returns None for it
+# The instructions are the same for every categorization and sent first, as the system
+# prompt, so LM Studio / Ollama can reuse the processed prefix (prompt cache) across calls
+SYSTEM_PROMPT = (
+    "You sort the answer a user gave in a voice conversation into one of the given categories. "
+    "The user message lists the categories and the sentence. "
+    "Only reply with the matching category. "
+    f"If the sentence fits none of them, or it is unclear which one it means, reply with {UNCLEAR}."
+)
 headers = {
    "Content-Type": "application/json",
   "Authorization": "Bearer lm-studio"
 }
 
-if sys.platform.startswith("linux"):
-    print("Running on Linux")
-elif sys.platform == "darwin":
-    print("Running on macOS")
+if sys.platform == "darwin":
     audio_player = "afplay"
     environment = "mac"
 
     ### Differnt model (llama2) request
     MODEL_NAME = "llama2"
     url = "http://localhost:11434/api/generate"
+    health_url = "http://localhost:11434/api/models"
     headers = {
         "Content-Type": "application/json"
     }
-else:
-    print(f"Running on unknown platform: {sys.platform}")
 
 ### Helper methods
 
-def make_llm_request(prompt):
+_http = requests.Session() # keeps the connection to the LLM server open between calls
+
+def make_llm_request(prompt, system=None, max_tokens=None, schema=None, temperature=0.7):
+    """
+    :param system: system prompt, sent before the prompt
+    :param max_tokens: stop after this many tokens (or at llm_stop without a schema), None for no limit
+    :param schema: JSON schema the reply must follow (response_format in LM Studio, format in Ollama)
+    """
+    with tracing.span("llm", model=MODEL_NAME, structured=schema is not None):
+        return _make_llm_request(prompt, system, max_tokens, schema, temperature)
+
+
+def _make_llm_request(prompt, system=None, max_tokens=None, schema=None, temperature=0.7):
     if environment == "mac":
+        options = {"temperature": temperature} # Ollama reads sampling settings from options only
+        if max_tokens is not None:
+            options["num_predict"] = max_tokens
+            if schema is None:
+                options["stop"] = llm_stop
         data = {
             "model": MODEL_NAME,
             "prompt": prompt,
             "stream": False,  # Set to True if you want streamed output
-            "temperature": 0.7
+            "keep_alive": llm_keep_alive,
+            "options": options
         }
+        if system is not None:
+            data["system"] = system
+        if schema is not None:
+            data["format"] = schema
 
-        response = requests.post(url, headers=headers, json=data)
+        response = _http.post(url, headers=headers, json=data)
         return response.json()["response"]
     else:
+        messages = [{"role": "user", "content": f"{prompt}"}]
+        if system is not None:
+            messages.insert(0, {"role": "system", "content": system})
         data = {
             "model": f"{MODEL_NAME}",
-            "messages": [
-                {"role": "user", "content": f"{prompt}"},
-            ],
-            "temperature": 0.7
+            "messages": messages,
+            "temperature": temperature
         }
-        request = requests.post(url, headers=headers, json=data)
+        if max_tokens is not None:
+            data["max_tokens"] = max_tokens
+            if schema is None:
+                data["stop"] = llm_stop
+        if schema is not None:
+            data["response_format"] = {"type": "json_schema",
+                                       "json_schema": {"name": "reply", "strict": True, "schema": schema}}
+        request = _http.post(url, headers=headers, json=data)
         print(request.json())
         return request.json()["choices"][0]["message"]["content"]
 
 
+@lru_cache(maxsize=32)
+def category_model(categories):
+    """
+    Pydantic model of a reply that names exactly one of the categories, or UNCLEAR:
+    {"category": "<category>"}. Without UNCLEAR, off-topic speech would be forced into a category.
+    :param categories: tuple of the category names
+    """
+    choices = categories if UNCLEAR in categories else categories + (UNCLEAR,)
+    return create_model("CategoryReply", category=(Literal[choices], ...))
+
+
+@lru_cache(maxsize=32)
+def category_schema(categories):
+    """
+    JSON schema of category_model(categories), generating it costs more than the rest of the call
+    """
+    return category_model(categories).model_json_schema()
+
+
+def _category_prompt(text, categories):
+    return f"Categories: {list(categories)}\nSentence: '{text}'"
+
+
+def classify(text, categories):
+    """
+    Ask the LLM which of the categories fits text. With llm_structured the server can only
+    decode {"category": <one of the categories or UNCLEAR>}. Only the categories and the
+    text change between calls, the instructions are the fixed SYSTEM_PROMPT.
+    :return: the matching category, None if the text fits none of them; the callers ask again
+    """
+    prompt = _category_prompt(text, categories)
+    if not llm_structured:
+        reply = make_llm_request(prompt, system=SYSTEM_PROMPT, max_tokens=llm_max_tokens, temperature=llm_temperature)
+        return _contains_word(reply, categories)
+
+    categories = tuple(categories)
+    reply = make_llm_request(prompt, system=SYSTEM_PROMPT, max_tokens=llm_max_tokens,
+                             schema=category_schema(categories), temperature=llm_temperature)
+    try:
+        category = category_model(categories).model_validate_json(reply).category
+    except ValidationError:
+        # a backend without structured output answers in free text
+        print(f"[WARN] LLM reply does not follow the category schema: {reply!r}")
+        return _contains_word(reply, categories)
+    return None if category == UNCLEAR and UNCLEAR not in categories else category
+
+
+def warm_up_llm():
+    """
+    Make the server load the model and process SYSTEM_PROMPT before the first question
+    :return: True if the LLM answered
+    """
+    try:
+        with tracing.span("init.llm_warmup"):
+            categories = ("yes", "no")
+            schema = category_schema(categories) if llm_structured else None
+            _make_llm_request(_category_prompt("yes", categories), SYSTEM_PROMPT, 1, schema, llm_temperature)
+        return True
+    except (requests.RequestException, KeyError, IndexError, ValueError) as e:
+        print(f"[WARN] LLM warm-up failed: {e}")
+        return False
+
+
 
 def _contains_word(text, word_list):
     """
@@ -85,16 +197,25 @@ def _contains_word(text, word_list):
     return None
 
 ### Methods to get speak to the user and get input from user voice
+def _get_recognizer():
+    global r
+    if r is None:
+        r = sr.Recognizer()
+    return r
+
 def _record_user(input_type):
+    r = _get_recognizer()
     if input_type == util.INPUT_TYPE.SPELLING:
         r.pause_threshold = pause_threshold_spelling
     else:
         r.pause_threshold = pause_threshold_normal
 
-    with sr.Microphone() as source:
-        r.adjust_for_ambient_noise(source, duration=0.25)
+    with tracing.span("capture"), sr.Microphone() as source:
+        with tracing.span("capture.calibrate"):
+            r.adjust_for_ambient_noise(source, duration=0.25)
         print("Listening...")
-        return r.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
+        with tracing.span("capture.listen"):
+            return r.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
 
 def say(message):
     """
@@ -103,10 +224,13 @@ def say(message):
     :return:
     """
     print("Talking... ")
-    message_obj = gTTS(text=message, lang=language, slow=False)
-    message_obj.save("message.mp3")
-    null_device = "nul" if platform.system() == "Windows" else "/dev/null" # Redirect audio_player console printing
-    os.system(f"{audio_player} message.mp3 > {null_device} 2>&1")
+    with tracing.span("say", characters=len(message)):
+        with tracing.span("tts.synthesize"):
+            message_obj = gTTS(text=message, lang=language, slow=False)
+            message_obj.save("message.mp3")
+        null_device = "nul" if platform.system() == "Windows" else "/dev/null" # Redirect audio_player console printing
+        with tracing.span("tts.playback"):
+            os.system(f"{audio_player} message.mp3 > {null_device} 2>&1")
 
 
 
@@ -121,27 +245,34 @@ def get_user_input(input_type):
     r = sr.Recognizer()
 
     while user_input is None:
+        reason = "not_extracted"
         try:
             audio_text = _record_user(input_type)
 
             print("Processing input...")
-            spoken_text = r.recognize_google(audio_text)
+            with tracing.span("recognize"):
+                spoken_text = r.recognize_google(audio_text)
             print(f"Recorded user input: {spoken_text}")
 
             user_input = util.extract(input_type, spoken_text)
             print(f"Extracted input: '{user_input}' for type '{input_type}'")
 
         except sr.WaitTimeoutError:
+            reason = "timeout"
             print("[Timeout] No speech detected within the timeout period.")
         except sr.UnknownValueError:
+            reason = "not_understood"
             print("[Warning] Could not understand the audio.")
         except sr.RequestError as e:
+            reason = "recognition_unavailable"
             print("[Error] Could not reach the speech recognition service.")
             print(f"Details: {e}")
         except Exception as e:
+            reason = "error"
             print("[Unexpected Error] while processing user input:")
             traceback.print_exc()
         if user_input is None:
+            metrics.INPUT_RETRIES.inc(input_type=getattr(input_type, "name", input_type), reason=reason)
             say("I didn't understand that. Please try again.")
 
     return user_input
@@ -157,56 +288,109 @@ def categorize_user_input(categories):
     r = sr.Recognizer()
 
     while category is None:
+        reason = "no_category"
         try:
             audio_text = _record_user(None)
 
             print("Processing input...")
-            user_input = r.recognize_google(audio_text)
+            with tracing.span("recognize"):
+                user_input = r.recognize_google(audio_text)
             print(f"Recorded user input: {user_input}")
 
-            prompt = (
-                f"Which category from the list {categories} fits the sentence: "
-                f"'{user_input}' the best? Only reply with the matching category name."
-            )
-            llm_reply = make_llm_request(prompt)
-            print(f"LLM categorized the input as: {llm_reply}")
-
-            category = _contains_word(llm_reply, categories)
+            category = classify(user_input, categories)
+            print(f"LLM categorized the input as: {category}")
 
         except sr.UnknownValueError:
+            reason = "not_understood"
             print("[Warning] Could not understand the audio.")
         except sr.RequestError as e:
+            reason = "recognition_unavailable"
             print("[Error] Could not reach the speech recognition service.")
             print(f"Details: {e}")
         except Exception as e:
+            reason = "error"
             print("[Unexpected Error] while categorizing user input:")
             traceback.print_exc()
 
         if category is None:
+            metrics.INPUT_RETRIES.inc(input_type="CATEGORY", reason=reason)
             say("I didn't understand that. Please try again.")
 
     return category
 
 
 
-try:
-    # Check if LM Studio is running by sending a request
-    if environment == "linux":
-        response = requests.get("http://localhost:1234", timeout=2)
-        print("[SUCCESS] LM studio online")
-    elif environment == "mac":
-        # Check for llama2 model availability
-        response = requests.get("http://localhost:11434/api/models", timeout=2)
-        print("[SUCCESS] Llama2 model available")
-
-    #print(response)
-except requests.RequestException:
-    print("[ERROR] Couldn't reach LM studio, did you start it?")
-
-
-
-
-
+### Initialization, kept out of the import so importing voice_util is cheap
 
+_init_lock = threading.Lock()
+_init_started = False
+_ready = threading.Event()
+llm_online = None # result of the health check, None until init() ran it
 
+def init(background=True):
+    """
+    Start the metrics exporters, check that LM Studio (or Ollama) is running, warm up its
+    model and load the spaCy model. In the background by default, so it overlaps the welcome message; nothing
+    waits for it, the extractors load spaCy themselves when it is needed earlier.
+    Safe to call more than once.
+    :param background: False to return when everything is ready
+    :return: an event that is set when the initialization finished
+    """
+    global _init_started
+    with _init_lock:
+        if _init_started:
+            return _ready
+        _init_started = True
+    if environment == "mac":
+        print("Running on macOS")
+    elif sys.platform.startswith("linux"):
+        print("Running on Linux")
+    else:
+        print(f"Running on unknown platform: {sys.platform}")
+    metrics.start()
+    if background:
+        threading.Thread(target=_initialize, name="voice-init", daemon=True).start()
+    else:
+        _initialize()
+    return _ready
 
+def wait_ready(timeout=None):
+    """
+    Wait for init() to finish
+    :return: False if it did not finish within timeout
+    """
+    return _ready.wait(timeout)
+
+def _initialize():
+    try:
+        with tracing.span("init"):
+            # spaCy loads while the LLM server loads its model
+            models = threading.Thread(target=_load_models, name="voice-init-models", daemon=True)
+            models.start()
+            if check_llm():
+                warm_up_llm()
+            models.join()
+    finally:
+        _ready.set()
+
+def _load_models():
+    try:
+        util.load_models()
+    except Exception as e:
+        print(f"[WARN] Loading the spaCy model failed: {e}")
+
+def check_llm():
+    """
+    Check if LM Studio (or the llama2 model in Ollama) is reachable
+    :return: True if it answered
+    """
+    global llm_online
+    try:
+        with tracing.span("init.health_check"):
+            requests.get(health_url, timeout=health_timeout)
+        print("[SUCCESS] Llama2 model available" if environment == "mac" else "[SUCCESS] LM studio online")
+        llm_online = True
+    except requests.RequestException:
+        print("[ERROR] Couldn't reach LM studio, did you start it?")
+        llm_online = False
+    return llm_online